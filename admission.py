@@ -0,0 +1,116 @@
+"""ブラウザ起動の受け付け制御
+
+複数のスケジュールが同時に発火しても、マシンが滑らかに再生できる数を超えて
+Chromeを起動しないよう、起動の直前で順番待ちをさせる。
+
+- アプリが起動したブラウザのツリー数（PROCESS_REGISTRY）が上限未満
+- ホスト全体のCPU使用率が上限未満
+- 空きメモリが下限以上
+- 直前の起動から stagger 秒以上経過（同時のコールドスタートを避ける）
+
+をすべて満たしたときに、到着順で1つずつ通す。
+
+通した起動は、ブラウザが登録簿に載るまで release() されないので、その間も1つ分として数える
+（同時に発火した複数の起動が、まだ登録されていないブラウザの分だけ上限を超えないように）。
+"""
+import time
+import itertools
+import threading
+
+from process_registry import CANCEL_POLL
+
+
+class AdmissionTimeout(Exception):
+    """待ち時間の上限までに起動できる状態にならなかった"""
+
+
+class AdmissionController:
+    """起動要求を順番に並べ、予算の範囲で通す（0の項目は制限しない）"""
+
+    def __init__(self, registry, max_browsers=0, max_cpu_percent=0, min_available_mb=0,
+                 stagger=0.5, timeout=60, poll=0.25, clock=time.monotonic):
+        self.registry = registry
+        self.max_browsers = max_browsers
+        self.max_cpu_percent = max_cpu_percent
+        self.min_available = min_available_mb * 1024 * 1024
+        self.stagger = stagger
+        self.timeout = timeout
+        self.poll = poll
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._tickets = itertools.count()
+        self._queue = []
+        self._last_admit = None
+        self._reserved = 0  # 通したが、まだ release されていない起動の数
+        self.stats = {"admitted": 0, "waited": 0, "timeouts": 0, "total_wait": 0.0, "max_wait": 0.0}
+
+    def acquire(self, stop_event=None):
+        """起動してよくなるまで待ち、待った秒数を返す
+
+        通したら枠を1つ確保するので、ブラウザを登録簿に載せた後（または起動しなかったとき）に release() で返す。
+        stop_event がセットされたらNoneを返し、timeout を過ぎたら AdmissionTimeout を送出する（どちらも枠は確保しない）。
+        """
+        start = self.clock()
+        with self._cond:
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+            try:
+                while True:
+                    if stop_event is not None and stop_event.is_set():
+                        return None
+                    if self._queue[0] == ticket:
+                        reason, wait = self._blocked()
+                        if reason is None:
+                            break
+                    else:
+                        reason, wait = "queue", self.poll
+                    remaining = start + self.timeout - self.clock()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise AdmissionTimeout(f"ブラウザを起動できる状態になりませんでした（{reason}）")
+                    if stop_event is not None:
+                        # 停止は通知されないので、待つ間も CANCEL_POLL ごとに確かめる
+                        wait = min(wait, CANCEL_POLL)
+                    self._cond.wait(min(wait, remaining))
+                self._last_admit = self.clock()
+                self._reserved += 1
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+            waited = self._last_admit - start
+            self.stats["admitted"] += 1
+            if waited > 0.001:
+                self.stats["waited"] += 1
+            self.stats["total_wait"] += waited
+            self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+        return waited
+
+    def release(self):
+        """acquire で確保した枠を返す"""
+        with self._cond:
+            self._reserved -= 1
+            self._cond.notify_all()
+
+    def _blocked(self):
+        """起動を待たせる理由と、次に調べるまでの秒数を返す（通してよければ理由はNone）"""
+        if self.stagger and self._last_admit is not None:
+            rest = self._last_admit + self.stagger - self.clock()
+            if rest > 0:
+                return "stagger", rest
+        if self.max_browsers and self._live_browsers() + self._reserved >= self.max_browsers:
+            return "browsers", self.poll
+        if self.max_cpu_percent or self.min_available:
+            import psutil
+            # 前回の呼び出しからの平均なので、待っている間は poll ごとの値になる
+            if self.max_cpu_percent and psutil.cpu_percent(None) >= self.max_cpu_percent:
+                return "cpu", self.poll
+            if self.min_available and psutil.virtual_memory().available < self.min_available:
+                return "memory", self.poll
+        return None, 0
+
+    def _live_browsers(self):
+        """プロセスが残っているツリーの数（終了したのに登録が残っているものは数えない）"""
+        roots = self.registry.roots()
+        if len(roots) + self._reserved < self.max_browsers:
+            return len(roots)
+        return sum(1 for root in roots if self.registry.pids(root))
@@ -1,103 +1,43 @@
 import os
 import sys
-import json
+import math
+import time
 import threading
-import subprocess
-import tempfile
-import shutil
-import winreg
-import psutil
-import time  # timeモジュールを追加
 import tkinter as tk
 import tkinter.messagebox as messagebox
-import requests
-from PIL import Image, ImageTk
-from io import BytesIO
-from win32com.client import Dispatch
+import repeater
+from repeater import (
+    Repeater,
+    TIME_UNITS,
+    create_admission,
+    create_browser_launcher,
+    create_profile_pool,
+    create_schedule_store,
+    create_telemetry_log,
+    create_video_cache,
+    create_watchdog,
+    kill_chrome_processes,
+    resolve_browser_path,
+    setup_diagnostics,
+)
+from scheduler import Scheduler
+from control_server import create_control_server
+from ui_channel import UpdateChannel
+from playlist import load_url_list, prefetch
+from youtube_url import extract_video_id, canonical_url
+
+# ワーカーからのUI更新を反映する間隔（ミリ秒）
+UI_POLL_MS = 200
 
-# 設定ファイルパス
-CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config.json')
 
 def load_config():
-    if os.path.exists(CONFIG_PATH):
-        try:
-            with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
-            messagebox.showerror("設定エラー", f"設定ファイルの読み込みに失敗しました:\n{e}")
-        except Exception as e:
-            messagebox.showerror("設定エラー", f"設定ファイルの読み込み中にエラーが発生しました:\n{e}")
-    return {
-        "skip_shortcut_prompt": False,
-        "last_url": "",
-        "repeat_time": 10,
-        "time_unit": "分",
-        "repeat_count": 1,
-        "infinite_loop": True,
-        "use_incognito": False  # シークレットモードのデフォルト設定を追加
-    }
+    return repeater.load_config(on_error=lambda msg: messagebox.showerror("設定エラー", msg))
 
 
 def save_config(config):
-    try:
-        with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        messagebox.showerror("設定エラー", f"設定ファイルの保存に失敗しました:\n{e}")
+    repeater.save_config(config, on_error=lambda msg: messagebox.showerror("設定エラー", msg))
 
 
-def get_chrome_path():
-    for key in (
-        r"SOFTWARE\\Microsoft\\Windows\\CurrentVersion\\App Paths\\chrome.exe",
-        r"SOFTWARE\\WOW6432Node\\Microsoft\\Windows\\CurrentVersion\\App Paths\\chrome.exe",
-    ):
-        try:
-            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key) as reg:
-                return winreg.QueryValue(reg, None)
-        except FileNotFoundError:
-            continue
-    for path in (
-        r"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
-        r"C:\\Program Files (x86)\\Google\\Chrome\\Application\\chrome.exe",
-    ):
-        if os.path.exists(path):
-            return path
-    return None
-
-
-def kill_process_tree(pid):
-    """プロセスとその子プロセスを強制終了する（改良版）"""
-    try:
-        parent = psutil.Process(pid)
-        children = parent.children(recursive=True)
-        
-        # すべてのプロセスを終了リストに入れる
-        processes = children + [parent]
-        
-        # まずは優しく終了要求
-        for p in processes:
-            try:
-                p.terminate()
-            except:
-                pass
-                
-        # 短い待機
-        _, alive = psutil.wait_procs(processes, timeout=2)
-        
-        # 残っているプロセスを強制終了
-        for p in alive:
-            try:
-                p.kill()
-            except:
-                pass
-                
-        # 最終確認（特にシークレットモード用）
-        _, still_alive = psutil.wait_procs(processes, timeout=1)
-        if still_alive:
-            print(f"警告: {len(still_alive)}個のプロセスが終了しませんでした")
-    except Exception as e:
-        print(f"プロセス終了エラー: {e}")
-
 def create_desktop_shortcut():
     try:
         desktop = os.path.join(os.environ.get('USERPROFILE', ''), 'Desktop')
@@ -114,6 +54,7 @@ def create_desktop_shortcut():
             
         script = os.path.abspath(__file__)
         icon = os.path.join(os.path.dirname(script), 'app.ico')
+        from win32com.client import Dispatch
         shell = Dispatch('WScript.Shell')
         shortcut = shell.CreateShortcut(shortcut_path)
         shortcut.TargetPath = pythonw_exe  # pythonw.exeを使用
@@ -139,7 +80,26 @@ class App:
             except Exception:
                 img = tk.PhotoImage(file=icon_path)
                 self.root.iconphoto(True, img)
-        self.stop_event = threading.Event()
+        # 繰り返し処理はスケジューラが駆動し、このウィンドウはその利用者の1つになる
+        # ワーカースレッドはTkに直接触れず、このチャネル経由で更新を渡す
+        self.updates = UpdateChannel()
+        self.deadline = None
+        self.scheduler = Scheduler(
+            max_workers=self.config.get("scheduler_workers", 4),
+            listener=self.on_schedule_state,
+        ).start()
+        self.schedule = None
+        self.video_cache = create_video_cache(self.config)
+        self.telemetry_log = create_telemetry_log(self.config)
+        # 初期化済みプロファイルのプールは、最初の実行時に作る（起動を遅くしないため）
+        self.profile_pool = None
+        self._pool_lock = threading.Lock()
+        # 監視・受け付け制御・保存先・診断・制御APIは、ウィンドウを表示してから start_services で用意する
+        self.watchdog = None
+        self.admission = None
+        self.store = None
+        self.diagnostics = None
+        self.control = None
 
         # UI構築
         tk.Label(root, text="YouTube URL:").grid(row=0, column=0, sticky="e")
@@ -159,6 +119,10 @@ class App:
         self.unit_var = tk.StringVar(value=self.config.get("time_unit", "分"))
         tk.OptionMenu(root, self.unit_var, "秒", "分", "時間", "日").grid(row=1, column=2)
 
+        # ウォームブラウザ（Chromeを終了せずにタブを再ナビゲート）のオプション
+        self.warm_var = tk.BooleanVar(value=self.config.get("warm_browser", False))
+        tk.Checkbutton(root, text="ブラウザ再利用", variable=self.warm_var).grid(row=1, column=3)
+
         tk.Label(root, text="回数:").grid(row=2, column=0, sticky="e")
         self.spin_count = tk.Spinbox(root, from_=1, to=999999, width=6)
         self.spin_count.grid(row=2, column=1, pady=4)
@@ -183,6 +147,8 @@ class App:
         self.label_title.grid(row=3, column=1, columnspan=3, sticky="w")
         self.thumbnail_label = tk.Label(root)
         self.thumbnail_label.grid(row=4, column=0, columnspan=4, pady=4)
+        # 表示中のサムネイル（動画IDとPNGのバイト列）
+        self.thumbnail_key = None
 
         tk.Label(root, text="残り時間:").grid(row=5, column=0, sticky="e")
         self.label_timer = tk.Label(root, text="--:--:--")
@@ -198,32 +164,133 @@ class App:
         self.btn_stop = tk.Button(btn_frame, text="停止", width=10, command=self.on_stop, state="disabled")
         self.btn_stop.pack(side=tk.LEFT, padx=5)
 
+        # URLリスト（ファイル）の取り込み。読み込んだリストはURL欄にファイルのパスとして表示する
+        tk.Button(btn_frame, text="リスト読込", width=10, command=self.on_import).pack(side=tk.LEFT, padx=5)
+        self.shuffle_var = tk.BooleanVar(value=self.config.get("shuffle_playlist", False))
+        tk.Checkbutton(btn_frame, text="シャッフル", variable=self.shuffle_var).pack(side=tk.LEFT, padx=5)
+        self.label_playlist = tk.Label(root, text="")
+        self.label_playlist.grid(row=7, column=0, columnspan=4)
+        self.playlist = None
+        self.playlist_path = None
+        self.playlist_summary = ""
+
         root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(UI_POLL_MS, self.drain_updates)
+        self.root.after(0, self.start_services)
         
-        # 初期URLがあれば、起動時に動画情報を取得
+        # 初期URLがあれば、ウィンドウが表示されてから動画情報を取得
         initial_url = self.config.get("last_url", "").strip()
-        if initial_url and (initial_url.startswith(("http://", "https://")) and 
+        if initial_url and os.path.isfile(initial_url):
+            self.root.after_idle(lambda: self.load_playlist(initial_url, quiet=True))
+        elif initial_url and (initial_url.startswith(("http://", "https://")) and 
                            ("youtube.com" in initial_url or "youtu.be" in initial_url)):
-            # 別スレッドで情報取得（UIをブロックしないため）
-            threading.Thread(target=self.load_initial_video_info, args=(initial_url,), daemon=True).start()
+            self.root.after_idle(lambda: self.start_initial_video_info(initial_url))
+
+    def start_services(self):
+        """ウィンドウの表示後に、起動を待たせたくない準備をまとめて行う"""
+        # 描画待ちが残っていれば先に済ませ、ウィンドウを出してから重い処理に入る
+        self.root.update_idletasks()
+        self.watchdog = create_watchdog(self.config)
+        self.admission = create_admission(self.config)
+        # スケジュールの進み具合を保存し、異常終了しても次の起動で続きから再開する
+        self.store = create_schedule_store(self.config)
+        # プロファイル・メモリの差分・スレッドのスタック（設定・YTR_DIAG・シグナル・制御APIで切り替える）
+        self.diagnostics = setup_diagnostics(self.config)
+        if self.store is not None:
+            self.scheduler.add_listener(self.store.on_state)
+        # 制御APIからも同じスケジューラでスケジュールを作れるようにする
+        try:
+            self.control = create_control_server(
+                self.config, self.scheduler, self.create_api_job, admission=self.admission)
+        except OSError as e:
+            print(f"制御APIを起動できません: {e}")
+        if self.control is not None:
+            self.control.start()
+            host, port = self.control.address
+            print(f"制御API: http://{host}:{port}/status")
+        if self.store is not None:
+            self.restore_schedules()
+
+    def restore_schedules(self):
+        """前回途中で終わったスケジュールを再開する（最初の1つはこのウィンドウのボタンで操作する）"""
+        restored = self.store.restore(self.scheduler, self.create_api_job)
+        if not restored or self.schedule is not None:
+            return
+        schedule = restored[0]
+        job = schedule.job
+        job.on_info = self.on_video_info
+        job.on_error = self.show_error
+        job.on_finish = self.on_finished
+        self.schedule = schedule
+        self.btn_start.config(state="disabled")
+        self.btn_stop.config(state="normal")
+        if schedule.next_fire is not None:
+            self.updates.post("deadline", schedule.next_fire)
+        print(f"{len(restored)}件のスケジュールを前回の続きから再開しました")
+
+    def start_initial_video_info(self, url):
+        """初回描画の後で、動画情報の取得を別スレッドで始める"""
+        # 別スレッドで情報取得（UIをブロックしないため）
+        threading.Thread(target=self.load_initial_video_info, args=(url,), daemon=True).start()
     
     def load_initial_video_info(self, url):
-        """アプリ起動時に初期動画情報を取得"""
+        """アプリ起動時に初期動画情報を取得（ディスクキャッシュを先に表示し、必要なら裏で更新）"""
         try:
-            # ネットワーク接続確認
-            try:
-                requests.head("https://www.youtube.com", timeout=5)
-            except requests.RequestException:
-                # 接続エラーは静かに無視（起動時なので）
-                return
-                
-            info = self.fetch_video_info(url, show_error=False)
-            if info and info.get("title") != "-":
-                self.root.after(0, lambda i=info: self.display_video_info(i))
+            cached = self.video_cache.peek(url)
+            if cached:
+                self.on_video_info(cached)
+                if cached["fresh"]:
+                    return
+            # キャッシュがないか期限切れのときだけネットワークから取得する
+            # 接続エラーは静かに無視（起動時なので）
+            info = self.video_cache.get(url)
+            if info.get("title") != "-" and (not cached or info != {k: cached[k] for k in info}):
+                self.on_video_info(info)
         except Exception as e:
             # 起動時のエラーは静かに無視
             print(f"初期動画情報取得エラー: {e}")
 
+    def on_import(self):
+        """URLリストのファイルを選んで読み込む"""
+        from tkinter import filedialog
+        path = filedialog.askopenfilename(
+            title="URLリストを選択",
+            filetypes=[("URLリスト", "*.txt *.csv"), ("すべてのファイル", "*.*")],
+        )
+        if path:
+            self.load_playlist(path)
+
+    def load_playlist(self, path, quiet=False):
+        """URLリストを読み込み、動画情報の先読みを別スレッドで始める"""
+        try:
+            video_ids, stats = load_url_list(path)
+        except (OSError, UnicodeDecodeError) as e:
+            if not quiet:
+                messagebox.showerror("読み込みエラー", f"URLリストを読み込めません:\n{e}")
+            return
+        if not video_ids:
+            if not quiet:
+                messagebox.showerror("読み込みエラー", "URLリストに有効なYouTubeのURLがありません。")
+            return
+        self.playlist = [canonical_url(video_id) for video_id in video_ids]
+        self.playlist_path = path
+        self.entry_url.delete(0, tk.END)
+        self.entry_url.insert(0, path)
+        self.playlist_summary = (f"リスト: {len(video_ids)}件"
+                                 f"（重複 {stats['duplicates']}件・無効 {len(stats['invalid'])}件を除外）")
+        self.label_playlist.config(text=self.playlist_summary)
+        threading.Thread(target=self.prefetch_playlist, args=(video_ids,), daemon=True).start()
+
+    def prefetch_playlist(self, video_ids):
+        """リスト全体の動画情報を先読みする（ワーカースレッド）"""
+        counts = prefetch(
+            self.video_cache, video_ids,
+            workers=self.config.get("prefetch_workers", 16),
+            rate=self.config.get("prefetch_rate", 50),
+            on_progress=lambda done, total: self.updates.post("prefetch", (done, total)),
+        )
+        print(f"先読みが完了しました: {counts}")
+
     def toggle_infinite(self):
         state = "disabled" if self.infinite_var.get() else "normal"
         self.spin_count.config(state=state)
@@ -238,19 +305,24 @@ class App:
         if not url:
             messagebox.showerror("入力エラー", "URLを入力してください。")
             return
-        if not url.startswith(("http://", "https://")):
-            messagebox.showerror("入力エラー", "有効なURLを入力してください。")
-            return
-        if not ("youtube.com" in url or "youtu.be" in url):
-            messagebox.showerror("入力エラー", "YouTubeのURLを入力してください。")
-            return
+        if self.playlist and url == self.playlist_path:
+            target = self.playlist
+        else:
+            if not url.startswith(("http://", "https://")):
+                messagebox.showerror("入力エラー", "有効なURLを入力してください。")
+                return
+            video_id = extract_video_id(url)
+            if not video_id:
+                messagebox.showerror("入力エラー", "YouTubeのURLを入力してください。")
+                return
+            target = canonical_url(video_id)
         
         try:
             t = float(self.spin_time.get())
         except ValueError:
             messagebox.showerror("入力エラー", "繰り返し時間は数値で入力してください。")
             return
-        interval = t * {"秒":1, "分":60, "時間":3600, "日":86400}[self.unit_var.get()]
+        interval = t * TIME_UNITS[self.unit_var.get()]
 
         if not self.infinite_var.get():
             try:
@@ -263,171 +335,158 @@ class App:
         else:
             count = None
 
-        self.stop_event.clear()  # 停止フラグをリセット
+        browser_path = resolve_browser_path(self.config)
+        try:
+            launcher = create_browser_launcher(self.config, browser_path)
+        except ValueError as e:
+            messagebox.showerror("設定エラー", str(e))
+            return
+        try:
+            job = Repeater(
+                target,
+                browser_path,
+                video_cache=self.video_cache,
+                incognito=self.incognito_var.get(),
+                warm=self.warm_var.get(),
+                probe_url=self.config.get("probe_url", repeater.PROBE_URL),
+                on_info=self.on_video_info,
+                on_error=self.show_error,
+                on_finish=self.on_finished,
+                telemetry_log=self.telemetry_log,
+                shuffle=self.shuffle_var.get(),
+                profile_pool=self.get_profile_pool(browser_path),
+                watchdog=self.watchdog,
+                admission=self.admission,
+                launcher=launcher,
+                low_quality=self.config.get("low_quality", False),
+                handoff=self.config.get("handoff", False),
+                handoff_lead=self.config.get("handoff_lead", 5),
+                handoff_timeout=self.config.get("handoff_timeout", 15),
+            )
+        except OSError as e:
+            messagebox.showerror("実行エラー", f"一時ディレクトリを作成できません:\n{e}")
+            return
+
         self.btn_start.config(state="disabled")
         self.btn_stop.config(state="normal")  # 停止ボタンを有効化
         self.label_timer.config(text=self.format_time(interval))
-        threading.Thread(target=self.run_loop, args=(url, interval, count), daemon=True).start()
+        self.deadline = None
+        self.schedule = job.schedule(interval, count)
+        self.scheduler.add(self.schedule)
+
+    def get_profile_pool(self, browser_path):
+        """初期化済みプロファイルのプールを返す（最初の呼び出しで作る）"""
+        with self._pool_lock:
+            if self.profile_pool is None:
+                self.profile_pool = create_profile_pool(self.config, browser_path)
+            return self.profile_pool
+
+    def create_api_job(self, target, shuffle):
+        """制御APIから作るジョブ（制御APIのスレッドで呼ばれるので、Tkの値ではなく設定を使う）"""
+        urls = [target] if isinstance(target, str) else target
+        canonical = []
+        for url in urls:
+            video_id = extract_video_id(url)
+            if not video_id:
+                raise ValueError(f"YouTubeのURLではありません: {url}")
+            canonical.append(canonical_url(video_id))
+        browser_path = resolve_browser_path(self.config)
+        if not browser_path:
+            raise ValueError("ブラウザが見つかりません")
+        launcher = create_browser_launcher(self.config, browser_path)
+        return Repeater(
+            canonical[0] if isinstance(target, str) else canonical,
+            browser_path,
+            video_cache=self.video_cache,
+            incognito=self.config.get("use_incognito", False),
+            warm=self.config.get("warm_browser", False),
+            probe_url=self.config.get("probe_url", repeater.PROBE_URL),
+            on_error=lambda title, message: print(f"{title}: {message}"),
+            telemetry_log=self.telemetry_log,
+            shuffle=shuffle,
+            profile_pool=self.get_profile_pool(browser_path),
+            watchdog=self.watchdog,
+            admission=self.admission,
+            launcher=launcher,
+            low_quality=self.config.get("low_quality", False),
+            handoff=self.config.get("handoff", False),
+            handoff_lead=self.config.get("handoff_lead", 5),
+            handoff_timeout=self.config.get("handoff_timeout", 15),
+        )
+
+    def on_schedule_state(self, schedule, state):
+        """スケジューラからの状態通知（スケジューラのスレッドで呼ばれる）"""
+        if schedule is self.schedule and state == "waiting":
+            # 次回発火時刻（単調時計）だけを渡し、残り時間はTkスレッドで計算する
+            self.updates.post("deadline", schedule.next_fire)
+
+    def drain_updates(self):
+        """ワーカーからの更新をまとめて反映する（Tkスレッドで定期実行）"""
+        self.root.after(UI_POLL_MS, self.drain_updates)
+        latest, events = self.updates.drain()
+        for key, value in latest:
+            if key == "deadline":
+                if self.schedule is not None and not self.schedule.cancelled:
+                    self.deadline = value
+            elif key == "video_info":
+                self.display_video_info(value)
+            elif key == "prefetch":
+                done, total = value
+                status = "先読み完了" if done >= total else f"先読み中 {done}/{total}"
+                self.label_playlist.config(text=f"{self.playlist_summary}　{status}")
+            elif key == "finished":
+                self.deadline = None
+                self.btn_start.config(state="normal")
+                self.btn_stop.config(state="disabled")
+                self.set_timer_text("--:--:--")
+        self.update_timer()
+        for kind, value in events:
+            if kind == "error":
+                messagebox.showerror(*value)
+
+    def update_timer(self):
+        """残り時間の表示を更新する（最小化中は何もしない）"""
+        if self.deadline is None or self.root.state() == "iconic":
+            return
+        remaining = max(0.0, self.deadline - time.monotonic())
+        self.set_timer_text(self.format_time(math.ceil(remaining)))
 
-    def fetch_video_info(self, url, show_error=True):
-        info = {"title": "-", "thumbnail": None}
-        try:
-            resp = requests.get(f"https://www.youtube.com/oembed?url={url}&format=json", timeout=5)
-            data = resp.json()
-            info["title"] = data.get("title", "-")
-            thumb = data.get("thumbnail_url")
-            if thumb:
-                img = Image.open(BytesIO(requests.get(thumb, timeout=5).content))
-                img = img.resize((256,144), Image.Resampling.LANCZOS)
-                info["thumbnail"] = ImageTk.PhotoImage(img)
-        except Exception as e:
-            print(f"Error fetching video info: {e}")
-            if show_error:
-                messagebox.showerror("エラー", f"動画情報の取得に失敗しました:\n{e}")
-        return info
-
-    def run_loop(self, url, interval, count):
-        iteration = 0
-        chrome_proc = None
-        temp_dir = None
-        
-        try:
-            # 一時ディレクトリを作成（Chromeのユーザーデータ用）
-            temp_dir = tempfile.mkdtemp(prefix="youtube_repeater_")
-            
-            # 起動前の既存Chromeプロセスのリストを記録
-            existing_chrome_pids = set()
-            for proc in psutil.process_iter(['pid', 'name']):
-                try:
-                    if 'chrome.exe' in proc.info['name'].lower():
-                        existing_chrome_pids.add(proc.info['pid'])
-                except:
-                    pass
-                
-            print(f"既存のChromeプロセス数: {len(existing_chrome_pids)}")
-            
-            while not self.stop_event.is_set() and (count is None or iteration < count):
-                # ネットワーク接続確認
-                try:
-                    requests.head("https://www.youtube.com", timeout=5)
-                except requests.RequestException:
-                    self.root.after(0, lambda: messagebox.showerror("ネットワークエラー", 
-                        "YouTubeサーバーに接続できません。ネットワーク接続を確認してください。"))
-                    break
-                    
-                info = self.fetch_video_info(url)
-                self.root.after(0, lambda i=info: self.display_video_info(i))
-
-                play_url = url
-                if 'youtube.com/watch' in url:
-                    sep = '&' if '?' in url else '?'
-                    play_url = f"{url}{sep}autoplay=1"
-            
-                # 独立したChromeインスタンスとして起動
-                cmd = [
-                    CHROME_PATH,
-                    "--new-window",
-                    "--autoplay-policy=no-user-gesture-required",
-                ]
-                
-                # シークレットモードが有効なら追加
-                if self.incognito_var.get():
-                    cmd.append("--incognito")
-                else:
-                    # シークレットモードでない場合はユーザーデータディレクトリを指定
-                    cmd.append(f"--user-data-dir={temp_dir}")
-            
-                # 共通のオプションを追加
-                cmd.extend([
-                    "--no-first-run",
-                    "--no-default-browser-check",
-                    "--disable-sync",
-                    "--disable-extensions",
-                    play_url
-                ])
-                
-                try:
-                    # 前回のプロセスが残っていれば終了
-                    if chrome_proc and chrome_proc.poll() is None:
-                        kill_process_tree(chrome_proc.pid)
-                    
-                    chrome_proc = subprocess.Popen(cmd)
-                except FileNotFoundError:
-                    self.root.after(0, lambda: messagebox.showerror("ブラウザエラー", 
-                        "Chromeが見つかりません。パスが正しいか確認してください。"))
-                    break
-                except PermissionError:
-                    self.root.after(0, lambda: messagebox.showerror("権限エラー", 
-                        "Chromeを起動する権限がありません。"))
-                    break
-                except Exception as e:
-                    self.root.after(0, lambda: messagebox.showerror("実行エラー", f"Chrome起動に失敗しました:\n{e}"))
-                    break
-
-                remaining = interval
-                while remaining > 0 and not self.stop_event.is_set():
-                    self.root.after(0, lambda t=remaining: self.label_timer.config(text=self.format_time(t)))
-                    if self.stop_event.wait(1):
-                        break
-                    remaining -= 1
-
-                # Chromeプロセスを確実に終了
-                if chrome_proc and chrome_proc.poll() is None:
-                    try:
-                        # シークレットモードでは終了処理を強化
-                        if self.incognito_var.get():
-                            print(f"シークレットモードのChromeプロセス(PID:{chrome_proc.pid})を終了中...")
-                        
-                            # 改良された強制終了処理を実行（既存プロセスは保護）
-                            kill_chrome_processes(chrome_proc.pid, existing_chrome_pids)
-                        else:
-                            # 通常モードの場合は従来通り
-                            kill_process_tree(chrome_proc.pid)
-                    except Exception as e:
-                        print(f"プロセス終了エラー: {e}")
-            
-            # イテレーション間で確実にChromeが終了していることを確認
-            time.sleep(2)
-            # 既存プロセスを保護しつつクリーンアップ
-            kill_chrome_processes(None, existing_chrome_pids)
-                
-            iteration += 1
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("予期せぬエラー", f"実行中に予期せぬエラーが発生しました:\n{e}"))
-        finally:
-            # 最終的にChromeプロセスを確実に終了
-            if chrome_proc and chrome_proc.poll() is None:
-                try:
-                    if self.incognito_var.get():
-                        kill_chrome_processes(chrome_proc.pid)
-                        # 最終手段としてtaskkillコマンドを使用
-                        subprocess.run(['taskkill', '/F', '/IM', 'chrome.exe', '/T'], 
-                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                    else:
-                        kill_process_tree(chrome_proc.pid)
-                except:
-                    pass
-        
-            # 一時ディレクトリを削除
-            if temp_dir and os.path.exists(temp_dir):
-                try:
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-                except:
-                    pass
-                
-            self.root.after(0, lambda: self.btn_start.config(state="normal"))
-            self.root.after(0, lambda: self.btn_stop.config(state="disabled"))
-            self.root.after(0, lambda: self.label_timer.config(text="--:--:--"))
+    def set_timer_text(self, text):
+        # 表示が変わるときだけラベルを更新する
+        if text != self.label_timer.cget("text"):
+            self.label_timer.config(text=text)
+
+    def on_video_info(self, info):
+        """繰り返し処理から動画情報を受け取ったとき（ワーカースレッド）
+
+        サムネイルはキャッシュで縮小済みのPNGなので、ここでは変換せずTkスレッドに渡す。
+        """
+        self.updates.post("video_info", info)
+
+    def show_error(self, title, message):
+        """繰り返し処理からのエラーを表示する（ワーカースレッドから呼ばれる）"""
+        self.updates.post_event("error", (title, message))
+
+    def on_finished(self, reason):
+        """スケジュールが終了したとき（ワーカースレッド）"""
+        self.updates.post("finished", reason)
 
     def display_video_info(self, info):
         self.label_title.config(text=info.get("title", "-"))
-        thumb = info.get("thumbnail")
+        thumb = info.get("thumbnail_bytes")
+        key = (info.get("video_id"), thumb)
+        # PhotoImageはサムネイルが変わったときだけ作り直す
+        if key == self.thumbnail_key:
+            return
+        self.thumbnail_key = key
+        image = None
         if thumb:
-            self.thumbnail_label.config(image=thumb)
-            self.thumbnail_label.image = thumb
-        else:
-            self.thumbnail_label.config(image="")
-            self.thumbnail_label.image = None
+            try:
+                image = tk.PhotoImage(data=thumb)
+            except tk.TclError as e:
+                print(f"Error decoding thumbnail: {e}")
+        self.thumbnail_label.config(image=image if image is not None else "")
+        self.thumbnail_label.image = image
 
     def on_close(self):
         # 現在の設定を保存
@@ -446,6 +505,8 @@ class App:
 
         self.config["infinite_loop"] = self.infinite_var.get()
         self.config["use_incognito"] = self.incognito_var.get()  # シークレットモード設定を保存
+        self.config["warm_browser"] = self.warm_var.get()
+        self.config["shuffle_playlist"] = self.shuffle_var.get()
         
         # 設定を保存
         save_config(self.config)
@@ -464,110 +525,46 @@ class App:
                 self.config["skip_shortcut_prompt"] = True
                 save_config(self.config)
         
-        # 終了前に残っているChromeプロセスをすべて終了
+        # スケジュールを止め、終了前に残っているChromeプロセスをすべて終了
+        if self.control is not None:
+            self.control.stop()
+        if self.store is not None:
+            # 自分で閉じたときは、次の起動で再開しないよう終了済みにしておく
+            self.store.discard()
+        self.scheduler.shutdown(wait=False)
+        if self.diagnostics is not None:
+            self.diagnostics.close()
+        if self.watchdog is not None:
+            self.watchdog.stop()
         self.cleanup_chrome()
+        if self.profile_pool is not None:
+            self.profile_pool.close()
+        self.video_cache.close()
+        if self.store is not None:
+            self.store.close()
     
-        self.stop_event.set()
         self.root.destroy()
 
     def on_stop(self):
         """停止ボタンがクリックされたときの処理"""
-        self.stop_event.set()
         self.btn_stop.config(state="disabled")
+        self.deadline = None
         self.label_timer.config(text="停止中...")
         
-        # すべてのChromeプロセスを強制終了
-        threading.Thread(target=lambda: self.cleanup_chrome(), daemon=True).start()
+        # スケジュールを止める（Chromeの終了と後片付けはスケジュールの on_finish（Repeater.finish）で行い、
+        # 終わったら on_finished で画面を戻す）
+        if self.schedule:
+            self.scheduler.cancel(self.schedule.id)
 
     def cleanup_chrome(self):
         """アプリが起動したChromeプロセスのみを終了"""
         print("Chromeの終了処理を開始...")
-        
-        # 既存の全Chromeプロセスを記録（これらは終了しない）
-        existing_chrome_pids = set()
-        for proc in psutil.process_iter(['pid', 'name']):
-            try:
-                if 'chrome.exe' in proc.info['name'].lower():
-                    existing_chrome_pids.add(proc.info['pid'])
-            except:
-                pass
-    
-        # 明示的にアプリが起動したChromeプロセスのみを終了
-        kill_chrome_processes(None, set())  # 空のセットを渡すと、全てのプロセスが対象になる
-    
+        # 登録簿にあるプロセスだけが対象なので、既存のChromeウィンドウは終了しない
+        kill_chrome_processes()
         print("Chrome終了処理が完了しました")
 
-def kill_chrome_processes(proc_pid=None, existing_pids=None):
-    """Chromeの関連プロセスを選択的に終了させる（ユーザーのウィンドウを保護）"""
-    try:
-        if existing_pids is None:
-            existing_pids = set()
-            
-        print(f"Chrome終了処理開始: 対象PID={proc_pid}, 保護対象プロセス数={len(existing_pids)}")
-        
-        # 特定のPIDが指定されている場合、そのプロセスとその子プロセスのみを終了
-        if proc_pid and psutil.pid_exists(proc_pid):
-            try:
-                # 指定されたプロセスを終了
-                parent = psutil.Process(proc_pid)
-                
-                # 子プロセスを取得
-                children = parent.children(recursive=True)
-                
-                # 終了すべきプロセスのリスト（既存プロセスは除外）
-                target_processes = []
-                for p in [parent] + children:
-                    if p.pid not in existing_pids:
-                        target_processes.append(p)
-                
-                print(f"終了対象プロセス数: {len(target_processes)}")
-                
-                # プロセスを終了
-                for p in target_processes:
-                    try:
-                        p.terminate()
-                    except:
-                        pass
-                
-                # 少し待機
-                _, alive = psutil.wait_procs(target_processes, timeout=2)
-                
-                # 残っているプロセスを強制終了
-                for p in alive:
-                    try:
-                        p.kill()
-                    except:
-                        pass
-            except Exception as e:
-                print(f"プロセス終了エラー: {e}")
-        else:
-            # 新規に作成されたChromeプロセスを検索（既存プロセスは保護）
-            for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-                try:
-                    # Chromeプロセスを特定
-                    if 'chrome.exe' in proc.info['name'].lower():
-                        # 既存プロセスリストにないもの、かつインコグニトフラグがあるものを終了
-                        if (proc.pid not in existing_pids and 
-                            proc.info.get('cmdline') and 
-                            '--incognito' in ' '.join(proc.info.get('cmdline', []))):
-                            print(f"インコグニトプロセスを終了: PID={proc.pid}")
-                            try:
-                                proc.terminate()
-                                try:
-                                    proc.wait(timeout=1)
-                                except:
-                                    proc.kill()
-                            except:
-                                pass
-                except:
-                    pass
-                    
-        print("Chrome終了処理が完了しました")
-    except Exception as e:
-        print(f"Chrome終了エラー: {e}")
-
 if __name__ == "__main__":
-    CHROME_PATH = get_chrome_path()
+    CHROME_PATH = resolve_browser_path(load_config())
     if not CHROME_PATH:
         tk.Tk().withdraw()
         messagebox.showerror("エラー", "Google Chromeが見つかりません。インストールをご確認ください。")
@@ -0,0 +1,109 @@
+"""起動モードごとのブラウザ1台あたりのメモリ・CPU使用量の比較
+
+各モード（normal / minimal / headless、画質指定の有無）でブラウザを1台ずつ起動し、
+落ち着くまで待ってから一定時間、プロセスツリー全体のRSSとCPU使用率を測る。
+実際の比較には本物のブラウザと再生できるURLが必要:
+
+    python bench/compare_modes.py --browser /usr/bin/chromium --url https://youtu.be/XXXXXXXXXXX
+    python bench/compare_modes.py --modes minimal headless --low-quality --json
+
+--browser を省略すると偽ブラウザ（bench/fake_chrome.py）で手順だけを確かめる。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from launchers import LAUNCH_MODES, create_launcher, low_quality_url  # noqa: E402
+from process_registry import PROCESS_REGISTRY  # noqa: E402
+from repeater import autoplay_url  # noqa: E402
+from run_bench import make_launcher  # noqa: E402
+
+
+def measure(launcher, url, settle, duration, interval):
+    """1台起動して測り、{"rss_mb", "peak_rss_mb", "cpu_percent", "procs"} を返す"""
+    profile = tempfile.mkdtemp(prefix="ytr_modes_")
+    proc = PROCESS_REGISTRY.spawn(launcher.build_cmd(url, profile))
+    try:
+        time.sleep(settle)
+        # 1回目のCPU使用率は基準点にしかならないので捨てる
+        PROCESS_REGISTRY.sample(proc.pid)
+        rss, cpu, procs = [], [], []
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            sample = PROCESS_REGISTRY.sample(proc.pid)
+            if sample is None:
+                break
+            rss.append(sample["rss"])
+            cpu.append(sample["cpu_percent"])
+            procs.append(sample["procs"])
+        if not rss:
+            raise RuntimeError("ブラウザがすぐに終了しました")
+        return {
+            "rss_mb": round(statistics.median(rss) / 1024 / 1024, 1),
+            "peak_rss_mb": round(max(rss) / 1024 / 1024, 1),
+            "cpu_percent": round(statistics.mean(cpu), 1),
+            "procs": max(procs),
+        }
+    finally:
+        PROCESS_REGISTRY.terminate(proc.pid)
+        shutil.rmtree(profile, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="起動モードごとのメモリ・CPU使用量の比較")
+    parser.add_argument("--browser", help="ブラウザの実行ファイル（省略時は偽ブラウザ）")
+    parser.add_argument("--kind", default="auto", help="ブラウザの種類（auto / chromium / firefox / generic）")
+    parser.add_argument("--url", default="https://www.youtube.com/watch?v=jNQXAC9IVRw", help="再生するURL")
+    parser.add_argument("--modes", nargs="+", choices=LAUNCH_MODES, default=list(LAUNCH_MODES))
+    parser.add_argument("--low-quality", action="store_true", help="各モードを最低画質指定ありでも測る")
+    parser.add_argument("--settle", type=float, default=10.0, help="起動後、測り始めるまでの秒数")
+    parser.add_argument("--duration", type=float, default=20.0, help="測る秒数")
+    parser.add_argument("--interval", type=float, default=1.0, help="測る間隔（秒）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="ytr_modes_bench_")
+    browser = args.browser
+    if not browser:
+        browser = make_launcher(work_dir)
+        args.settle, args.duration = min(args.settle, 1.0), min(args.duration, 2.0)
+        print("偽ブラウザで実行します（数値は比較の参考になりません）", file=sys.stderr)
+
+    variants = [(mode, False) for mode in args.modes]
+    if args.low_quality:
+        variants += [(mode, True) for mode in args.modes]
+    results = []
+    try:
+        for mode, low_quality in variants:
+            url = autoplay_url(args.url)
+            if low_quality:
+                url = low_quality_url(url)
+            launcher = create_launcher(browser, kind=args.kind, mode=mode)
+            result = measure(launcher, url, args.settle, args.duration, args.interval)
+            result.update(mode=mode, low_quality=low_quality)
+            results.append(result)
+            if not args.json:
+                label = f"{mode}{' + vq=tiny' if low_quality else ''}"
+                print(f"{label:<22}RSS {result['rss_mb']:>8.1f}MB（最大 {result['peak_rss_mb']:.1f}MB）"
+                      f"  CPU {result['cpu_percent']:>6.1f}%  プロセス数 {result['procs']}")
+    finally:
+        PROCESS_REGISTRY.terminate_all()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""ベンチマーク用の偽ブラウザ
+
+Chromeと同じコマンドライン（--user-data-dir、--remote-debugging-port、最後の引数がURL）を受け取り、
+設定した形の子プロセスツリーを作って待ち続ける。--remote-debugging-port を指定すると、
+DevToolsActivePort を書き出し、/json/list と Page.navigate に応答する代役サーバーも立ち上げる。
+
+挙動は環境変数で変える:
+    FAKE_CHROME_DEPTH       子プロセスツリーの深さ（既定 2）
+    FAKE_CHROME_FANOUT      各プロセスの子の数（既定 2）
+    FAKE_CHROME_STARTUP_MS  DevToolsの準備ができるまでの遅延（既定 0）
+    FAKE_CHROME_FIRST_RUN_MS プロファイルが空のときに初期化にかかる時間（既定 0）
+    FAKE_CHROME_RSS_MB      各プロセスが確保するメモリ（既定 0）
+    FAKE_CHROME_IGNORE_TERM 1ならSIGTERMを無視する（強制終了の経路を試す）
+    FAKE_CHROME_LOG         起動したURLを追記するファイル
+"""
+import os
+import sys
+import json
+import time
+import base64
+import signal
+import socket
+import hashlib
+import struct
+import threading
+import subprocess
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _env_int(name, default=0):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _hold_memory():
+    size = _env_int("FAKE_CHROME_RSS_MB") * 1024 * 1024
+    # 実際にページを割り当てるよう、全体を書き込んでおく
+    return bytearray(b"\x01" * size) if size else None
+
+
+def _spawn_children(depth):
+    if depth <= 0:
+        return []
+    return [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--fake-child", str(depth - 1)])
+        for _ in range(_env_int("FAKE_CHROME_FANOUT", 2))
+    ]
+
+
+class _DevToolsStandIn:
+    """/json/list と WebSocket の Page.navigate だけに応答するDevToolsの代役"""
+
+    def __init__(self, url):
+        self.url = url
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            conn, _ = self.sock.accept()
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        try:
+            data = b""
+            while b"\r\n\r\n" not in data:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    return
+                data += chunk
+            head = data.split(b"\r\n\r\n", 1)[0].decode("latin-1")
+            lines = head.split("\r\n")
+            path = lines[0].split()[1]
+            headers = dict(l.split(": ", 1) for l in lines[1:] if ": " in l)
+            if headers.get("Upgrade", "").lower() == "websocket":
+                self._websocket(conn, headers)
+            else:
+                self._http(conn, path)
+        except (OSError, ValueError, IndexError):
+            pass
+        finally:
+            conn.close()
+
+    def _http(self, conn, path):
+        ws = f"ws://127.0.0.1:{self.port}/devtools/page/1"
+        if path.startswith("/json/version"):
+            body = {"Browser": "FakeChrome/1.0", "webSocketDebuggerUrl": f"ws://127.0.0.1:{self.port}/devtools/browser/1"}
+        elif path.startswith("/json/new"):
+            body = {"id": "1", "type": "page", "url": self.url, "webSocketDebuggerUrl": ws}
+        else:
+            body = [{"id": "1", "type": "page", "url": self.url, "webSocketDebuggerUrl": ws}]
+        payload = json.dumps(body).encode("utf-8")
+        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(payload) + payload)
+
+    def _websocket(self, conn, headers):
+        accept = base64.b64encode(hashlib.sha1((headers["Sec-WebSocket-Key"] + _WS_GUID).encode()).digest())
+        conn.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        while True:
+            head = self._recv(conn, 2)
+            opcode, length = head[0] & 0x0F, head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._recv(conn, 2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._recv(conn, 8))[0]
+            mask = self._recv(conn, 4)
+            data = bytes(b ^ mask[i % 4] for i, b in enumerate(self._recv(conn, length)))
+            if opcode == 0x8:
+                return
+            if opcode != 0x1:
+                continue
+            message = json.loads(data)
+            if message.get("method") == "Page.navigate":
+                self.url = message.get("params", {}).get("url", self.url)
+                _log_url(self.url)
+            reply = json.dumps({"id": message.get("id"), "result": {"frameId": "1"}}).encode("utf-8")
+            header = bytes([0x81, len(reply)]) if len(reply) < 126 else bytes([0x81, 126]) + struct.pack("!H", len(reply))
+            conn.sendall(header + reply)
+
+    @staticmethod
+    def _recv(conn, n):
+        data = b""
+        while len(data) < n:
+            chunk = conn.recv(n - len(data))
+            if not chunk:
+                raise OSError("closed")
+            data += chunk
+        return data
+
+
+def _log_url(url):
+    path = os.environ.get("FAKE_CHROME_LOG")
+    if path:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(f"{os.getpid()} {url}\n")
+
+
+def _init_profile(user_data_dir):
+    """空のプロファイルなら初回起動の初期化をまねる"""
+    local_state = os.path.join(user_data_dir, "Local State")
+    if os.path.exists(local_state):
+        return
+    time.sleep(_env_int("FAKE_CHROME_FIRST_RUN_MS") / 1000)
+    os.makedirs(os.path.join(user_data_dir, "Default"), exist_ok=True)
+    with open(os.path.join(user_data_dir, "Default", "Preferences"), "w", encoding="utf-8") as f:
+        json.dump({"profile": {"name": "fake"}}, f)
+    with open(local_state, "w", encoding="utf-8") as f:
+        json.dump({"browser": {"fake": True}}, f)
+
+
+def main(argv):
+    if os.environ.get("FAKE_CHROME_IGNORE_TERM") == "1":
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    memory = _hold_memory()
+
+    if len(argv) >= 2 and argv[0] == "--fake-child":
+        children = _spawn_children(int(argv[1]))
+        while True:
+            time.sleep(3600)
+
+    user_data_dir = None
+    debugging = False
+    for arg in argv:
+        if arg.startswith("--user-data-dir="):
+            user_data_dir = arg.split("=", 1)[1]
+        elif arg.startswith("--remote-debugging-port"):
+            debugging = True
+    url = argv[-1] if argv and not argv[-1].startswith("--") else "about:blank"
+    _log_url(url)
+
+    children = _spawn_children(_env_int("FAKE_CHROME_DEPTH", 2))
+    if user_data_dir:
+        _init_profile(user_data_dir)
+    time.sleep(_env_int("FAKE_CHROME_STARTUP_MS") / 1000)
+    if debugging and user_data_dir:
+        server = _DevToolsStandIn(url)
+        os.makedirs(user_data_dir, exist_ok=True)
+        tmp = os.path.join(user_data_dir, "DevToolsActivePort.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"{server.port}\n/devtools/browser/1\n")
+        os.replace(tmp, os.path.join(user_data_dir, "DevToolsActivePort"))
+    while True:
+        time.sleep(3600)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,134 @@
+"""ベンチマーク用のYouTube代役サーバー（oEmbed・サムネイル・接続確認）
+
+    GET/HEAD /                          接続確認用（200を返す）
+    GET /oembed?url=...&format=json     oEmbed JSON
+    GET /vi/<動画ID>/maxresdefault.jpg  サムネイル（ETag付き、If-None-Matchで304）
+
+latency で各応答に遅延を入れられる。単体で起動することもできる:
+    python bench/fake_youtube.py --port 8765
+"""
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from youtube_url import extract_video_id  # noqa: E402
+
+
+def make_thumbnail(size=(1280, 720)):
+    """テスト用のJPEGを作る（maxres相当の大きさ）"""
+    from PIL import Image
+    img = Image.new("RGB", size)
+    # 単色だとJPEGが小さくなりすぎるので、なだらかな模様を入れる
+    img.putdata([((x * 7) % 256, (y * 5) % 256, (x + y) % 256) for y in range(size[1]) for x in range(size[0])])
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+class FakeYouTube:
+    """別スレッドで動く代役サーバー"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, thumbnail=None):
+        self.latency = latency
+        self.thumbnail = thumbnail if thumbnail is not None else make_thumbnail()
+        self.etag = '"%s"' % hashlib.md5(self.thumbnail).hexdigest()
+        self.requests = {"probe": 0, "oembed": 0, "thumbnail": 0, "not_modified": 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, key):
+        with self._lock:
+            self.requests[key] += 1
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=b"", content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                parsed = urlparse(self.path)
+                if parsed.path == "/oembed":
+                    fake._count("oembed")
+                    url = parse_qs(parsed.query).get("url", [""])[0]
+                    video_id = extract_video_id(url) or "unknown"
+                    body = json.dumps({
+                        "title": f"Fake video {video_id}",
+                        "thumbnail_url": f"{fake.base_url}/vi/{video_id}/maxresdefault.jpg",
+                        "type": "video",
+                    }).encode("utf-8")
+                    self._send(200, body)
+                elif parsed.path.startswith("/vi/"):
+                    if self.headers.get("If-None-Match") == fake.etag:
+                        fake._count("not_modified")
+                        self._send(304, headers={"ETag": fake.etag})
+                        return
+                    fake._count("thumbnail")
+                    self._send(200, fake.thumbnail, "image/jpeg", {"ETag": fake.etag})
+                else:
+                    fake._count("probe")
+                    self._send(200, b"ok", "text/plain")
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="YouTube代役サーバー")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答ごとの遅延（秒）")
+    args = parser.parse_args(argv)
+    fake = FakeYouTube(port=args.port, latency=args.latency)
+    print(f"{fake.base_url} で待ち受けます（oEmbed: {fake.base_url}/oembed）")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""繰り返し処理のベンチマーク（偽ブラウザとローカルのoEmbed代役で、ネットワークなしに動く）
+
+シナリオ:
+    cycles    Scheduler と Repeater で短い間隔の繰り返しを回し、
+              1分あたりの繰り返し回数・段階ごとの所要時間・残留プロセスを調べる
+    teardown  深いプロセスツリーを起動して kill_process_tree の所要時間と残留を調べる
+
+    python bench/run_bench.py
+    python bench/run_bench.py --scenario cycles --schedules 8 --count 10 --warm
+    python bench/run_bench.py --save baseline.json
+    python bench/run_bench.py --baseline baseline.json --tolerance 0.2
+
+--baseline を指定すると、保存済みの結果より指定の割合を超えて悪化した項目を表示し、
+終了コード1を返す。残留プロセスがある場合も1を返す。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+import telemetry  # noqa: E402
+from repeater import Repeater, kill_process_tree  # noqa: E402
+from process_registry import PROCESS_REGISTRY  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from video_cache import VideoInfoCache  # noqa: E402
+from fake_youtube import FakeYouTube  # noqa: E402
+from profile_pool import ProfilePool, prepare_template  # noqa: E402
+from admission import AdmissionController  # noqa: E402
+
+FAKE_CHROME = os.path.join(BENCH_DIR, "fake_chrome.py")
+
+# 小さいほど良い項目と大きいほど良い項目（ベースラインとの比較に使う）
+LOWER_IS_BETTER = ("admission_ms", "spawn_ms", "ready_ms", "navigate_ms", "teardown_ms", "probe_ms",
+                   "oembed_ms", "thumbnail_ms", "gap_ms", "drift_ms")
+HIGHER_IS_BETTER = ("repeats_per_min",)
+
+
+def make_launcher(work_dir):
+    """偽ブラウザを今のPythonで起動するラッパーを作る（Chromeの実行ファイルの代わり）"""
+    path = os.path.join(work_dir, "fake-chrome")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_CHROME}" "$@"\n')
+    os.chmod(path, 0o755)
+    return path
+
+
+def fake_chrome_pids():
+    """偽ブラウザのプロセスを探す（残留の検出用）"""
+    import psutil
+    pids = []
+    for proc in psutil.process_iter(["cmdline"]):
+        if FAKE_CHROME in (proc.info["cmdline"] or []):
+            pids.append(proc.pid)
+    return pids
+
+
+def run_cycles(args, work_dir):
+    """短い間隔の繰り返しを複数スケジュールで回す"""
+    fake = FakeYouTube(latency=args.latency).start()
+    cache = VideoInfoCache(os.path.join(work_dir, "cache"), oembed_url=f"{fake.base_url}/oembed")
+    log_path = os.path.join(work_dir, "telemetry.jsonl")
+    log = telemetry.TelemetryLog(log_path)
+    browser = make_launcher(work_dir)
+    pool = None
+    if args.profile_pool:
+        pool = ProfilePool(
+            os.path.join(work_dir, "profiles", "template"),
+            size=args.schedules,
+            work_dir=os.path.join(work_dir, "profiles"),
+            prepare=lambda path: prepare_template(
+                browser, path, PROCESS_REGISTRY.spawn, PROCESS_REGISTRY.terminate),
+        )
+        # テンプレートと初期のプロファイルが揃うまで待つ（計測に準備の時間を含めない）
+        deadline = time.monotonic() + args.timeout
+        while pool.ready_count() < args.schedules and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    admission = AdmissionController(PROCESS_REGISTRY, max_browsers=args.max_browsers, stagger=args.stagger)
+    # 切り替えでは繰り返しのたびにプロファイルが作られるので、残留を数えられるよう作業用に置く
+    temp_root = os.path.join(work_dir, "tmp")
+    os.makedirs(temp_root)
+    saved_tempdir, tempfile.tempdir = tempfile.tempdir, temp_root
+
+    scheduler = Scheduler(max_workers=args.workers).start()
+    done = threading.Semaphore(0)
+    jobs = []
+    for i in range(args.schedules):
+        # 動画IDを変えて、キャッシュの初回取得と再利用の両方を含める
+        url = f"https://www.youtube.com/watch?v=bench{i % 4:07d}"
+        job = Repeater(
+            url, browser,
+            video_cache=None if args.no_metadata else cache,
+            warm=args.warm,
+            probe_url=None if args.no_probe else f"{fake.base_url}/",
+            on_error=lambda title, message: print(f"{title}: {message}", file=sys.stderr),
+            on_finish=lambda reason: done.release(),
+            telemetry_log=log,
+            profile_pool=pool,
+            admission=admission,
+            handoff=args.handoff,
+            handoff_lead=args.handoff_lead,
+        )
+        jobs.append(job)
+    profile_dirs = [job.temp_dir for job in jobs]
+
+    start = time.perf_counter()
+    for job in jobs:
+        scheduler.add(job.schedule(args.interval, args.count))
+    for _ in jobs:
+        if not done.acquire(timeout=args.timeout):
+            print("時間内に終わりませんでした", file=sys.stderr)
+            break
+    elapsed = time.perf_counter() - start
+    scheduler.shutdown(wait=True)
+    for job in jobs:
+        job.close()
+    if pool is not None:
+        pool.close()
+    tempfile.tempdir = saved_tempdir
+    log.close()
+    fake.stop()
+
+    records = list(telemetry.read_records(log_path))
+    iterations = [r for r in records if r.get("event") == "iteration"]
+    return {
+        "iterations": len(iterations),
+        "failed": sum(1 for r in iterations if r.get("status") != "ok"),
+        "elapsed_s": round(elapsed, 3),
+        "repeats_per_min": round(len(iterations) / elapsed * 60, 1) if elapsed else 0,
+        "requests": dict(fake.requests),
+        "cache_hit_ratio": round(cache.hit_ratio(), 3),
+        "stages": telemetry.summarize(records),
+        "admission": dict(admission.stats),
+        "leaked_dirs": sum(1 for path in profile_dirs if os.path.exists(path)) + len(os.listdir(temp_root)),
+    }
+
+
+def run_teardown(args):
+    """深いプロセスツリーを起動し、終了にかかる時間を測る"""
+    expected = sum(args.fanout ** d for d in range(args.depth + 1))
+    times = []
+    killed = []
+    for _ in range(args.trees):
+        proc = PROCESS_REGISTRY.spawn([sys.executable, FAKE_CHROME, "about:blank"])
+        # ツリーがすべて起動するまで待つ
+        deadline = time.monotonic() + args.timeout
+        while len(PROCESS_REGISTRY.pids(proc.pid)) < expected and time.monotonic() < deadline:
+            time.sleep(0.02)
+        telemetry.begin(event="teardown")
+        kill_process_tree(proc.pid)
+        record = telemetry.end()
+        times.append(record.get("teardown_ms", 0))
+        killed.append(record.get("killed", 0))
+    return {
+        "trees": args.trees,
+        "expected_per_tree": expected,
+        "killed": killed,
+        "stages": telemetry.summarize({"teardown_ms": t} for t in times),
+    }
+
+
+def compare(result, baseline, tolerance):
+    """ベースラインより悪化した項目を返す"""
+    regressions = []
+    for scenario, current in result.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        for key in HIGHER_IS_BETTER:
+            if key in current and key in base and current[key] < base[key] * (1 - tolerance):
+                regressions.append(f"{scenario}.{key}: {base[key]} -> {current[key]}")
+        for key in LOWER_IS_BETTER:
+            now = current.get("stages", {}).get(key, {}).get("p50")
+            then = base.get("stages", {}).get(key, {}).get("p50")
+            # ごく短い処理は誤差で倍になりやすいので、1ms未満の差は無視する
+            if now is not None and then is not None and now > then * (1 + tolerance) and now - then > 1:
+                regressions.append(f"{scenario}.{key}.p50: {then} -> {now}")
+    return regressions
+
+
+def print_stages(stages):
+    for key, row in stages.items():
+        if not key.endswith("_ms"):
+            continue
+        print(f"  {key:<20}件数{row['count']:>5}  p50 {row['p50']:>9.2f}  p90 {row['p90']:>9.2f}"
+              f"  p99 {row['p99']:>9.2f}  最大 {row['max']:>9.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="繰り返し処理のベンチマーク（ネットワーク不要）")
+    parser.add_argument("--scenario", choices=("all", "cycles", "teardown"), default="all")
+    parser.add_argument("--schedules", type=int, default=4, help="同時に動かすスケジュール数")
+    parser.add_argument("--count", type=int, default=5, help="スケジュールごとの繰り返し回数")
+    parser.add_argument("--interval", type=float, default=0.2, help="繰り返し間隔（秒）")
+    parser.add_argument("--workers", type=int, default=4, help="スケジューラのワーカー数")
+    parser.add_argument("--warm", action="store_true", help="ブラウザを使い回す")
+    parser.add_argument("--no-probe", action="store_true", help="接続確認を行わない")
+    parser.add_argument("--no-metadata", action="store_true", help="動画情報を取得しない")
+    parser.add_argument("--latency", type=float, default=0.0, help="代役サーバーの応答遅延（秒）")
+    parser.add_argument("--stagger", type=float, default=0.0, help="ブラウザ起動の最小間隔（秒）")
+    parser.add_argument("--max-browsers", type=int, default=0, help="同時に起動しておくブラウザの上限")
+    parser.add_argument("--handoff", action="store_true", help="次のブラウザを先に起動して切り替える")
+    parser.add_argument("--handoff-lead", type=float, default=0.1, help="次のブラウザを予定時刻の何秒前に起動するか")
+    parser.add_argument("--startup-ms", type=int, default=0, help="偽ブラウザの準備完了までの遅延")
+    parser.add_argument("--profile-pool", action="store_true", help="初期化済みプロファイルのプールを使う")
+    parser.add_argument("--first-run-ms", type=int, default=0,
+                        help="偽ブラウザが空のプロファイルの初期化にかける時間（ミリ秒）")
+    parser.add_argument("--depth", type=int, default=3, help="偽ブラウザの子プロセスツリーの深さ")
+    parser.add_argument("--fanout", type=int, default=2, help="各プロセスの子の数")
+    parser.add_argument("--trees", type=int, default=5, help="teardown で起動するツリーの数")
+    parser.add_argument("--ignore-term", action="store_true", help="偽ブラウザがSIGTERMを無視する")
+    parser.add_argument("--timeout", type=float, default=60, help="シナリオごとの待ち時間の上限（秒）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    parser.add_argument("--save", help="結果をベースラインとして保存するパス")
+    parser.add_argument("--baseline", help="比較するベースラインのパス")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="悪化とみなす割合")
+    args = parser.parse_args(argv)
+
+    if sys.platform == "win32":
+        print("このベンチマークはLinux/macOS向けです", file=sys.stderr)
+        return 2
+
+    # 偽ブラウザ（とその子）は環境変数で形を決める
+    os.environ["FAKE_CHROME_DEPTH"] = str(args.depth)
+    os.environ["FAKE_CHROME_FANOUT"] = str(args.fanout)
+    os.environ["FAKE_CHROME_FIRST_RUN_MS"] = str(args.first_run_ms)
+    os.environ["FAKE_CHROME_STARTUP_MS"] = str(args.startup_ms)
+    if args.ignore_term:
+        os.environ["FAKE_CHROME_IGNORE_TERM"] = "1"
+
+    work_dir = tempfile.mkdtemp(prefix="ytr_bench_")
+    result = {}
+    # JSON出力を壊さないよう、計測中のログ出力は標準エラーに回す
+    quiet = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+    try:
+        with quiet:
+            if args.scenario in ("all", "cycles"):
+                result["cycles"] = run_cycles(args, work_dir)
+            if args.scenario in ("all", "teardown"):
+                result["teardown"] = run_teardown(args)
+    finally:
+        PROCESS_REGISTRY.terminate_all()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    leaked = fake_chrome_pids()
+    result["leaked_processes"] = len(leaked)
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        if "cycles" in result:
+            c = result["cycles"]
+            print(f"cycles: {c['iterations']}回（失敗 {c['failed']}）/ {c['elapsed_s']}秒"
+                  f" = {c['repeats_per_min']}回/分、キャッシュヒット率 {c['cache_hit_ratio']:.0%}")
+            print(f"  代役サーバーへの要求: {c['requests']}")
+            print_stages(c["stages"])
+        if "teardown" in result:
+            t = result["teardown"]
+            print(f"teardown: {t['trees']}ツリー（各{t['expected_per_tree']}プロセス）、終了数 {t['killed']}")
+            print_stages(t["stages"])
+        print(f"残留プロセス: {len(leaked)}" + (f" {leaked}" if leaked else ""))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    failed = bool(leaked) or result.get("cycles", {}).get("leaked_dirs")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"  -> 悪化: {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""複数ワーカーでの分担のベンチマーク（偽ブラウザと1つのSQLiteファイルで、1台のLinux上で動く）
+
+worker.py run を --workers 個のプロセスで起動し、--schedules 個のスケジュールを分担させて次を調べる。
+
+    1. 分担: すべてのスケジュールに担当が付くまでの時間と、ワーカーごとのブラウザ数
+    2. 引き継ぎ: ワーカーを1つ SIGKILL で落とし、その担当がほかのワーカーに移るまでの時間
+       （上限は lease_ttl + 確認間隔（lease_ttl / 3））と、移った後も回数が進むこと
+    3. 追加: ワーカーを1つ追加し、ブラウザ数の差が1以内に収まるまでの時間
+
+    python bench/shard_bench.py
+    python bench/shard_bench.py --workers 4 --schedules 12 --lease-ttl 3
+
+引き継ぎが上限を超えた場合や、落としたワーカーのもの以外に残留プロセスがある場合は終了コード1を返す。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from coordination import SQLiteLeases  # noqa: E402
+from run_bench import make_launcher, fake_chrome_pids  # noqa: E402
+
+WORKER = os.path.join(ROOT, "worker.py")
+
+
+def start_worker(args, work_dir, config_path, db_path, browser, name):
+    log = open(os.path.join(work_dir, f"{name}.log"), "w", encoding="utf-8")
+    return subprocess.Popen(
+        [sys.executable, WORKER, "--config", config_path, "--db", db_path, "run",
+         "--worker-id", name, "--browser", browser, "--lease-ttl", str(args.lease_ttl),
+         "--no-probe", "--no-metadata"],
+        stdout=log, stderr=subprocess.STDOUT, cwd=work_dir)
+
+
+def wait_until(predicate, timeout, step=0.05):
+    """predicate が真になるまでの秒数（timeout までにならなければ None）"""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if predicate():
+            return time.monotonic() - start
+        time.sleep(step)
+    return None
+
+
+def browsers_by_worker(leases, ttl):
+    return {w["id"]: w["browsers"] for w in leases.workers(ttl)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="複数ワーカーでの分担のベンチマーク")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--schedules", type=int, default=9)
+    parser.add_argument("--interval", type=float, default=1.0, help="繰り返し間隔（秒）")
+    parser.add_argument("--lease-ttl", type=float, default=2.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="ytr-shard-")
+    config_path = os.path.join(work_dir, "config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump({"telemetry_log": "", "profile_pool_size": 0, "watchdog_interval": 0,
+                   "launch_stagger": 0, "schedule_store": ""}, f)
+    db_path = os.path.join(work_dir, "shards.db")
+    browser = make_launcher(work_dir)
+    leases = SQLiteLeases(db_path)
+    for i in range(args.schedules):
+        leases.add([f"https://www.youtube.com/watch?v=shard{i:06d}"], False, args.interval, None)
+
+    ttl = args.lease_ttl
+    bound = ttl + ttl / 3
+    procs = {}
+    orphans = set()
+    result = {"workers": args.workers, "schedules": args.schedules, "lease_ttl": ttl, "bound_s": round(bound, 3)}
+    try:
+        for i in range(args.workers):
+            name = f"w{i}"
+            procs[name] = start_worker(args, work_dir, config_path, db_path, browser, name)
+
+        # 1. 分担
+        def all_owned(live=None):
+            shards = leases.shards(active_only=True)
+            now = time.time()
+            return all(s["owner"] and s["lease_until"] > now and (live is None or s["owner"] in live)
+                       for s in shards)
+
+        def balanced():
+            counts = browsers_by_worker(leases, ttl)
+            live = [counts.get(name, 0) for name in procs]
+            return all_owned(set(procs)) and sum(live) >= args.schedules and max(live) - min(live) <= 1
+
+        result["assign_s"] = wait_until(all_owned, args.timeout)
+        result["balance_s"] = wait_until(balanced, args.timeout)
+        result["browsers"] = browsers_by_worker(leases, ttl)
+
+        # 2. 引き継ぎ
+        import psutil
+        victim_name = max(result["browsers"], key=result["browsers"].get)
+        victim = procs.pop(victim_name)
+        # ブラウザはそれぞれ自分のプロセスグループで動くので、グループごと片付ける
+        # （一覧を取ってから落とすまでに起動されないよう、先に止めておく）
+        victim.send_signal(signal.SIGSTOP)
+        orphans = {os.getpgid(p.pid) for p in psutil.Process(victim.pid).children()}
+        moved = [s["id"] for s in leases.shards(active_only=True) if s["owner"] == victim_name]
+        before = {s["id"]: s["iteration"] for s in leases.shards() if s["id"] in moved}
+        victim.kill()
+        victim.wait()
+        killed_at = time.monotonic()
+
+        def taken_over():
+            now = time.time()
+            return all(s["owner"] in procs and s["lease_until"] > now
+                       for s in leases.shards(active_only=True) if s["id"] in moved)
+
+        result["killed"] = victim_name
+        result["moved"] = len(moved)
+        result["failover_s"] = wait_until(taken_over, args.timeout)
+        progressed = wait_until(
+            lambda: all(s["iteration"] > before[s["id"]] for s in leases.shards() if s["id"] in moved),
+            args.timeout)
+        result["resumed_s"] = round(time.monotonic() - killed_at, 3) if progressed is not None else None
+
+        # 3. 追加
+        procs["w-new"] = start_worker(args, work_dir, config_path, db_path, browser, "w-new")
+        result["rebalance_s"] = wait_until(balanced, args.timeout)
+        result["browsers_after"] = browsers_by_worker(leases, ttl)
+    finally:
+        for proc in procs.values():
+            proc.send_signal(signal.SIGTERM)
+        for proc in procs.values():
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        # 落としたワーカーのブラウザは親がいなくなって残るので、ここで片付ける
+        for pgid in orphans:
+            try:
+                os.killpg(pgid, signal.SIGKILL)
+            except OSError:
+                pass
+        time.sleep(0.2)
+        leaked = fake_chrome_pids()
+        leases.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for key in ("assign_s", "balance_s", "failover_s", "rebalance_s"):
+        if result.get(key) is not None:
+            result[key] = round(result[key], 3)
+    result["leaked"] = leaked
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(f"分担: {result['assign_s']}秒で全{args.schedules}件に担当、{result['balance_s']}秒で均等に"
+              f" {result['browsers']}")
+        print(f"引き継ぎ: {result['killed']} を落として{result['moved']}件が{result['failover_s']}秒で移動"
+              f"（上限 {result['bound_s']}秒）、{result['resumed_s']}秒で再生を再開")
+        print(f"追加: {result['rebalance_s']}秒で均等に {result['browsers_after']}")
+        print(f"残留プロセス: {len(leaked)}" + (f" {leaked}" if leaked else ""))
+    failover = result.get("failover_s")
+    failed = bool(leaked) or failover is None or failover > bound or result.get("rebalance_s") is None
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
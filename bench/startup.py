@@ -0,0 +1,99 @@
+"""起動時間のベンチマーク（import時間と初回描画までの時間）
+
+毎回新しいPythonプロセスで app.py を読み込み、中央値を予算と比較する。
+予算を超えた場合は終了コード1を返すので、性能の劣化を検出できる。
+
+    python bench/startup.py
+    python bench/startup.py --runs 10 --import-budget 0.2 --paint-budget 0.8
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 起動時には読み込まれていてほしくない重いモジュール
+HEAVY_MODULES = ("PIL", "requests", "urllib3", "psutil", "win32com", "cProfile", "pstats", "tracemalloc")
+
+_IMPORT_PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+import app
+elapsed = time.perf_counter() - t0
+print(json.dumps({"import": elapsed, "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+_PAINT_PROBE = """
+import time, json
+t0 = time.perf_counter()
+import tkinter as tk
+import app
+root = tk.Tk()
+app.App(root)
+def painted():
+    # アイドル処理（再描画）が一巡した時点を初回描画とみなす
+    root.update_idletasks()
+    print(json.dumps({"paint": time.perf_counter() - t0}))
+    root.destroy()
+root.bind("<Map>", lambda e: root.after_idle(painted) if e.widget is root else None)
+root.mainloop()
+"""
+
+
+def run_probe(code):
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT, capture_output=True, text=True, timeout=60,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip())
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(f"計測結果がありません: {proc.stdout!r}")
+
+
+def has_display():
+    return sys.platform == "win32" or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="起動時間のベンチマーク")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=0.25, help="import app の予算（秒）")
+    parser.add_argument("--paint-budget", type=float, default=1.0, help="初回描画までの予算（秒）")
+    args = parser.parse_args(argv)
+
+    failed = False
+    imports, heavy = [], set()
+    for _ in range(args.runs):
+        result = run_probe(_IMPORT_PROBE)
+        imports.append(result["import"])
+        heavy.update(result["heavy"])
+    median = statistics.median(imports)
+    print(f"import app: 中央値 {median * 1000:.1f}ms（予算 {args.import_budget * 1000:.0f}ms）")
+    if median > args.import_budget:
+        failed = True
+        print("  -> 予算超過")
+    if heavy:
+        failed = True
+        print(f"  -> 起動時に重いモジュールが読み込まれています: {', '.join(sorted(heavy))}")
+
+    if has_display():
+        paints = [run_probe(_PAINT_PROBE)["paint"] for _ in range(args.runs)]
+        median = statistics.median(paints)
+        print(f"初回描画: 中央値 {median * 1000:.1f}ms（予算 {args.paint_budget * 1000:.0f}ms）")
+        if median > args.paint_budget:
+            failed = True
+            print("  -> 予算超過")
+    else:
+        print("初回描画: ディスプレイがないため計測をスキップしました")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""コマンドライン版（GUIなし）の繰り返しビューア
+
+画面のないサーバーでも動かせるよう、tkinter や Windows 専用モジュールには依存しない。
+
+使い方の例:
+    python cli.py --url https://youtu.be/XXXXXXXXXXX --interval 10m --count 3
+    python cli.py --url URL1 --url URL2 --interval 30s --browser /usr/bin/chromium
+    python cli.py --url-file playlist.csv --shuffle --interval 5m   # リストを1つのスケジュールで順に再生
+    python cli.py                       # config.json の last_url / repeat_time などを使う
+    python cli.py --control-port 8765   # 制御API（control_server.py）で操作する
+    YTR_DIAG=profile python cli.py ...  # 繰り返し処理をプロファイルする（diagnostics.py）
+"""
+import sys
+import signal
+import argparse
+import threading
+from contextlib import ExitStack
+
+import repeater
+from repeater import (
+    Repeater,
+    create_admission,
+    create_browser_launcher,
+    create_profile_pool,
+    create_schedule_store,
+    create_telemetry_log,
+    create_video_cache,
+    create_watchdog,
+    kill_chrome_processes,
+    parse_interval,
+    resolve_browser_path,
+    setup_diagnostics,
+)
+from scheduler import Scheduler
+from launchers import LAUNCH_MODES
+from control_server import create_control_server
+from playlist import load_url_list, prefetch
+from youtube_url import canonical_url
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="YouTube動画を指定間隔で繰り返し再生する（GUIなし）")
+    parser.add_argument("--url", action="append", help="再生するURL（複数指定可）")
+    parser.add_argument("--url-file", help="URLリスト（1行1URLのテキスト、またはTakeoutの再生リストCSV）")
+    parser.add_argument("--shuffle", action="store_true", help="URLリストをシャッフルして再生する")
+    parser.add_argument("--interval", help="繰り返し時間（例: 90, 30s, 10m, 2h, 1d。単位なしは秒）")
+    parser.add_argument("--count", type=int, help="繰り返し回数（省略すると無限）")
+    parser.add_argument("--browser", help="ブラウザの実行ファイル（省略時は設定・YTR_BROWSER・自動検出の順）")
+    parser.add_argument("--config", default=repeater.CONFIG_PATH, help="設定ファイルのパス")
+    parser.add_argument("--incognito", action="store_true", default=None, help="シークレットモードで起動する")
+    parser.add_argument("--warm", action="store_true", default=None, help="ブラウザを使い回す")
+    parser.add_argument("--no-probe", action="store_true", help="毎回の接続確認を行わない")
+    parser.add_argument("--no-metadata", action="store_true", help="タイトル・サムネイルを取得しない")
+    parser.add_argument("--mode", choices=LAUNCH_MODES,
+                        help="起動モード（normal / minimal: 小さなミュートのウィンドウ / headless）")
+    parser.add_argument("--low-quality", action="store_true", default=None, help="最低画質での再生を求める")
+    parser.add_argument("--handoff", action="store_true", default=None,
+                        help="次のブラウザを予定時刻の前に起動しておき、準備ができたら切り替える")
+    parser.add_argument("--control-port", type=int,
+                        help="制御APIの待ち受けポート（指定するとURLなしでも起動し、停止されるまで待ち受ける）")
+    parser.add_argument("--store", help="スケジュールの保存先（SQLite、空文字で保存しない）")
+    parser.add_argument("--no-resume", action="store_true", help="前回途中で終わったスケジュールを再開せずに破棄する")
+    parser.add_argument("--telemetry", help="計測ログ（JSONL）の出力先（空文字で記録しない）")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = repeater.load_config(args.config)
+    if args.control_port is not None:
+        config["control_port"] = args.control_port
+    # 途中で戻っても（引数の誤り・制御APIを起動できないなど）、それまでに作ったものを逆順にすべて片付ける
+    with ExitStack() as cleanup:
+        return run(args, config, cleanup)
+
+
+def run(args, config, cleanup):
+    """main の本体（作ったものの後片付けは作るたびに cleanup に積む）"""
+    serving = bool(config.get("control_port"))
+    diagnostics = setup_diagnostics(config)
+    cleanup.callback(diagnostics.close)
+    store = create_schedule_store(config, args.store)
+    pending = []
+    if store is not None:
+        cleanup.callback(store.close)
+        if args.no_resume:
+            store.discard()
+        else:
+            pending = store.active()
+
+    # 各要素が1つのスケジュールになる（URLリストは1つのスケジュールで順に再生する）
+    playlist = None
+    if args.url_file:
+        try:
+            video_ids, stats = load_url_list(args.url_file)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"URLリストを読み込めません: {e}", file=sys.stderr)
+            return 2
+        print(f"URLリスト: {len(video_ids)}件（重複 {stats['duplicates']}件、無効 {len(stats['invalid'])}件を除外）")
+        if not video_ids:
+            print("URLリストに有効なURLがありません", file=sys.stderr)
+            return 2
+        playlist = [canonical_url(video_id) for video_id in video_ids]
+    urls = args.url or []
+    if not urls and not playlist and not serving and not pending and config.get("last_url"):
+        urls = [config["last_url"]]
+    jobs = urls + ([playlist] if playlist else [])
+    if not jobs and not serving and not pending:
+        print("URLが指定されていません（--url、--url-file または設定ファイルの last_url）", file=sys.stderr)
+        return 2
+
+    try:
+        if args.interval:
+            interval = parse_interval(args.interval)
+        else:
+            interval = parse_interval(config.get("repeat_time", 10), config.get("time_unit", "分"))
+    except (ValueError, KeyError):
+        print(f"繰り返し時間が不正です: {args.interval}", file=sys.stderr)
+        return 2
+    if interval <= 0:
+        print("繰り返し時間は正の値で指定してください", file=sys.stderr)
+        return 2
+
+    count = args.count
+    if count is None and not args.url and not playlist and not config.get("infinite_loop", True):
+        count = config.get("repeat_count", 1)
+    if count is not None and count < 1:
+        print("回数は1以上の整数で指定してください", file=sys.stderr)
+        return 2
+
+    browser_path = args.browser or resolve_browser_path(config)
+    if not browser_path:
+        print("ブラウザが見つかりません。--browser で指定してください", file=sys.stderr)
+        return 2
+
+    incognito = config.get("use_incognito", False) if args.incognito is None else args.incognito
+    warm = config.get("warm_browser", False) if args.warm is None else args.warm
+    probe_url = None if args.no_probe else config.get("probe_url", repeater.PROBE_URL)
+    video_cache = None if args.no_metadata else create_video_cache(config)
+    if video_cache is not None:
+        cleanup.callback(video_cache.close)
+    telemetry_log = create_telemetry_log(config, args.telemetry)
+    if telemetry_log is not None:
+        cleanup.callback(telemetry_log.close)
+    if args.mode:
+        config["launch_mode"] = args.mode
+    try:
+        launcher = create_browser_launcher(config, browser_path)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    low_quality = config.get("low_quality", False) if args.low_quality is None else args.low_quality
+    handoff = config.get("handoff", False) if args.handoff is None else args.handoff
+    profile_pool = create_profile_pool(config, browser_path)
+    if profile_pool is not None:
+        cleanup.callback(profile_pool.close)
+    # 残っているブラウザは、スケジューラと監視を止めた後で終了させる
+    cleanup.callback(kill_chrome_processes)
+    watchdog = create_watchdog(config)
+    if watchdog is not None:
+        cleanup.callback(watchdog.stop)
+    admission = create_admission(config)
+
+    def report_admission():
+        stats = admission.stats
+        if stats["waited"]:
+            print(f"起動の順番待ち: {stats['waited']}/{stats['admitted']}回、"
+                  f"平均 {stats['total_wait'] / stats['admitted']:.2f}秒、最大 {stats['max_wait']:.2f}秒")
+
+    cleanup.callback(report_admission)
+
+    if playlist and video_cache is not None:
+        def prefetch_all():
+            counts = prefetch(
+                video_cache, video_ids,
+                workers=config.get("prefetch_workers", 16),
+                rate=config.get("prefetch_rate", 50),
+            )
+            print(f"先読みが完了しました: {counts}")
+
+        # 再生を待たせないよう、リスト全体の動画情報は裏で先読みする
+        threading.Thread(target=prefetch_all, name="prefetch", daemon=True).start()
+
+    scheduler = Scheduler(max_workers=config.get("scheduler_workers", 4)).start()
+    cleanup.callback(scheduler.shutdown, wait=True)
+    if store is not None:
+        scheduler.add_listener(store.on_state)
+    remaining = set()
+    all_done = threading.Event()
+    lock = threading.Lock()
+
+    def finished(schedule_id, reason):
+        print(f"スケジュール{schedule_id}が終了しました ({reason})")
+        with lock:
+            remaining.discard(schedule_id)
+            if not remaining:
+                all_done.set()
+
+    def on_info(info):
+        print(f"再生中タイトル: {info.get('title', '-')}")
+
+    def create_job(target, shuffle, on_finish=None):
+        urls = [target] if isinstance(target, str) else target
+        if not all(url.startswith(("http://", "https://")) for url in urls):
+            raise ValueError("URLは http:// または https:// で始めてください")
+        job = Repeater(
+            target,
+            browser_path,
+            video_cache=video_cache,
+            incognito=incognito,
+            warm=warm,
+            probe_url=probe_url,
+            on_info=on_info,
+            on_finish=on_finish or (lambda reason: print(f"スケジュール{job.schedule_id}が終了しました ({reason})")),
+            telemetry_log=telemetry_log,
+            shuffle=shuffle,
+            profile_pool=profile_pool,
+            watchdog=watchdog,
+            admission=admission,
+            launcher=launcher,
+            low_quality=low_quality,
+            handoff=handoff,
+            handoff_lead=config.get("handoff_lead", 5),
+            handoff_timeout=config.get("handoff_timeout", 15),
+        )
+        return job
+
+    def create_tracked_job(target, shuffle):
+        # 終了を待つ対象にするジョブ（起動時に指定したものと、保存先から再開したもの）
+        job = create_job(target, shuffle, on_finish=lambda reason: finished(job.schedule_id, reason))
+        return job
+
+    with lock:
+        restored = set()
+        if pending:
+            for schedule in store.restore(scheduler, create_tracked_job):
+                remaining.add(schedule.id)
+                restored.add(job_key(schedule.job.order.urls))
+                print(f"スケジュール{schedule.id}: 前回の続き（{schedule.iteration}回目まで再生済み）から再開します")
+        for url in jobs:
+            if job_key(url) in restored:
+                # 同じURL（リスト）で起動し直しても、再開したものと二重にしない
+                target = url if isinstance(url, str) else f"URLリスト（{len(url)}件）"
+                print(f"{target} は前回の続きから再開したので、新しくは追加しません")
+                continue
+            job = create_tracked_job(url, args.shuffle)
+            schedule = job.schedule(interval, count)
+            remaining.add(schedule.id)
+            scheduler.add(schedule)
+            target = url if isinstance(url, str) else f"URLリスト（{len(url)}件）"
+            print(f"スケジュール{schedule.id}: {target} を{interval:g}秒ごとに"
+                  f"{'無限' if count is None else f'{count}回'}繰り返します")
+        if not remaining:
+            # 再開できるスケジュールが1つもなかった
+            all_done.set()
+
+    control = None
+    if serving:
+        try:
+            control = create_control_server(config, scheduler, create_job, admission=admission).start()
+        except OSError as e:
+            print(f"制御APIを起動できません: {e}", file=sys.stderr)
+            return 2
+        cleanup.callback(control.stop)
+        host, port = control.address
+        print(f"制御API: http://{host}:{port}/status")
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        print("停止要求を受け取りました")
+        stopping.set()
+        for schedule in scheduler.schedules():
+            scheduler.cancel(schedule.id)
+
+    signal.signal(signal.SIGINT, stop)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, stop)
+
+    # シグナルを受け取れるよう、メインスレッドは短い間隔で待つ
+    # （制御APIを動かしているときは、スケジュールがなくなっても停止要求まで待ち受ける）
+    while not (stopping if control else all_done).wait(0.5):
+        pass
+    return 0
+
+
+def job_key(target):
+    """同じ再生対象かを比べるキー（URLリストはシャッフルで並びが変わるので順序は見ない）"""
+    urls = [target] if isinstance(target, str) else target
+    return tuple(sorted(urls))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""スケジュールを操作するローカルHTTPの制御API
+
+GUIのボタンと同じスケジューラに対して、スケジュールの作成・一覧・一時停止・再開・停止と
+状態の取得を行う。既定では 127.0.0.1 だけで待ち受け、token を設定すると
+Authorization: Bearer <token> ヘッダーのない要求を拒否する。
+
+    GET    /status                   全体の状態（スケジュール・ブラウザ数・起動の順番待ち）
+    GET    /schedules                スケジュールの一覧
+    POST   /schedules                作成 {"url": "...", "interval": "10m", "count": 3}
+                                     （"urls": [...] と "shuffle": true でURLリスト）
+    GET    /schedules/<id>           1件の状態（残り時間・回数・ブラウザのPID・直近の所要時間）
+    POST   /schedules/<id>/pause     一時停止
+    POST   /schedules/<id>/resume    再開
+    POST   /schedules/<id>/stop      停止（DELETE /schedules/<id> も同じ）
+    GET    /diagnostics              診断の状態（計測中か・書き出したファイル）
+    POST   /diagnostics/profile/start  プロファイルの計測を開始（/stop で停止して書き出す）
+    POST   /diagnostics/snapshot     メモリ確保のスナップショットと前回との差分を書き出す
+    POST   /diagnostics/stacks       全スレッドのスタックを書き出す
+
+状態の取得は要求ごとのスレッドで行い、スケジューラのロックは一覧を写す間しか持たない。
+"""
+import hmac
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from diagnostics import DIAGNOSTICS
+from process_registry import PROCESS_REGISTRY
+from repeater import parse_interval
+
+# 受け付ける要求本文の上限（バイト）
+MAX_BODY = 64 * 1024
+
+
+class ControlError(Exception):
+    """要求を処理できない（status はHTTPステータスコード）"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ControlServer:
+    """制御APIのHTTPサーバー
+
+    create_job(target, shuffle) は再生するURL（またはURLのリスト）から Repeater を作る関数で、
+    GUIやコマンドライン版が自分の設定で用意する。不正な指定なら ValueError を送出する。
+    """
+
+    def __init__(self, scheduler, create_job, host="127.0.0.1", port=0, token=None, admission=None):
+        self.scheduler = scheduler
+        self.create_job = create_job
+        self.token = token or None
+        self.admission = admission
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        """実際に待ち受けている (host, port)（port=0 なら空いている番号が選ばれる）"""
+        return self._httpd.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="control-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    # ---- 要求の処理 ----
+
+    def handle(self, method, path, body):
+        """(HTTPステータス, 応答のJSON) を返す"""
+        parts = [p for p in path.split("?", 1)[0].split("/") if p]
+        if parts == ["status"] and method == "GET":
+            return 200, self.status()
+        if parts[:1] == ["diagnostics"]:
+            return self.diagnostics(method, parts[1:])
+        if parts[:1] != ["schedules"]:
+            raise ControlError(404, "見つかりません")
+        if len(parts) == 1:
+            if method == "GET":
+                return 200, {"schedules": [self.describe(s) for s in self.scheduler.schedules()]}
+            if method == "POST":
+                return 201, self.create(body)
+            raise ControlError(405, "このメソッドは使えません")
+
+        schedule = self._schedule(parts[1])
+        action = parts[2] if len(parts) == 3 else None
+        if len(parts) > 3:
+            raise ControlError(404, "見つかりません")
+        if action is None and method == "GET":
+            return 200, self.describe(schedule)
+        if (action is None and method == "DELETE") or (action == "stop" and method == "POST"):
+            self.scheduler.cancel(schedule.id)
+        elif action == "pause" and method == "POST":
+            self.scheduler.pause(schedule.id)
+        elif action == "resume" and method == "POST":
+            self.scheduler.resume(schedule.id)
+        elif action in (None, "stop", "pause", "resume"):
+            raise ControlError(405, "このメソッドは使えません")
+        else:
+            raise ControlError(404, "見つかりません")
+        return 200, self.describe(schedule)
+
+    def status(self):
+        result = {
+            "schedules": [self.describe(s) for s in self.scheduler.schedules()],
+            "browsers": len(PROCESS_REGISTRY.roots()),
+        }
+        if self.admission is not None:
+            result["admission"] = dict(self.admission.stats)
+        return result
+
+    def diagnostics(self, method, parts):
+        """診断の切り替えと書き出し（書き出しは要求のスレッドで行い、書いたファイルを返す）"""
+        if not parts:
+            if method != "GET":
+                raise ControlError(405, "このメソッドは使えません")
+            return 200, DIAGNOSTICS.status()
+        actions = {
+            ("profile", "start"): lambda: {"started": DIAGNOSTICS.start_profile()},
+            ("profile", "stop"): lambda: {"path": DIAGNOSTICS.stop_profile()},
+            ("snapshot",): lambda: {"path": DIAGNOSTICS.snapshot()},
+            ("stacks",): lambda: {"path": DIAGNOSTICS.dump_stacks()},
+        }
+        action = actions.get(tuple(parts))
+        if action is None:
+            raise ControlError(404, "見つかりません")
+        if method != "POST":
+            raise ControlError(405, "このメソッドは使えません")
+        try:
+            result = action()
+        except OSError as e:
+            raise ControlError(500, f"診断結果を書き出せません: {e}") from None
+        result.update(DIAGNOSTICS.status())
+        return 200, result
+
+    def create(self, body):
+        """要求本文からスケジュールを作って登録し、その状態を返す"""
+        if not isinstance(body, dict):
+            raise ControlError(400, "JSONオブジェクトを送ってください")
+        urls = body.get("urls")
+        if urls is None:
+            urls = [body.get("url")]
+        if not isinstance(urls, list) or not urls or not all(isinstance(u, str) and u for u in urls):
+            raise ControlError(400, "url（または urls）を指定してください")
+        try:
+            interval = parse_interval(body.get("interval", ""))
+        except (ValueError, KeyError):
+            raise ControlError(400, f"繰り返し時間が不正です: {body.get('interval')}") from None
+        count = body.get("count")
+        if interval <= 0:
+            raise ControlError(400, "繰り返し時間は正の値で指定してください")
+        if count is not None and (not isinstance(count, int) or isinstance(count, bool) or count < 1):
+            raise ControlError(400, "回数は1以上の整数で指定してください")
+        target = urls[0] if len(urls) == 1 and "urls" not in body else urls
+        try:
+            job = self.create_job(target, bool(body.get("shuffle", False)))
+        except ValueError as e:
+            raise ControlError(400, str(e)) from None
+        schedule = job.schedule(interval, count)
+        self.scheduler.add(schedule)
+        return self.describe(schedule)
+
+    def describe(self, schedule):
+        """スケジュール1件の状態"""
+        if schedule.state == "paused":
+            remaining = schedule.paused_remaining
+        else:
+            remaining = schedule.remaining(time.monotonic())
+        result = {
+            "id": schedule.id,
+            "name": schedule.name,
+            "state": schedule.state,
+            "paused": schedule.paused,
+            "cancelled": schedule.cancelled,
+            "interval": schedule.interval,
+            "count": schedule.count,
+            "iteration": schedule.iteration,
+            "retries": schedule.retries,
+            "remaining": round(remaining, 3) if remaining is not None else None,
+        }
+        status = getattr(schedule.job, "status", None)
+        if status is not None:
+            result.update(status())
+        return result
+
+    def _schedule(self, text):
+        try:
+            schedule = self.scheduler.get(int(text))
+        except ValueError:
+            schedule = None
+        if schedule is None:
+            raise ControlError(404, f"スケジュールがありません: {text}")
+        return schedule
+
+    def authorized(self, header):
+        if self.token is None:
+            return True
+        return hmac.compare_digest(header or "", f"Bearer {self.token}")
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+        def _dispatch(self, method):
+            try:
+                if not server.authorized(self.headers.get("Authorization")):
+                    raise ControlError(401, "認証が必要です")
+                status, payload = server.handle(method, self.path, self._read_body())
+            except ControlError as e:
+                status, payload = e.status, {"error": str(e)}
+            except Exception as e:
+                print(f"制御APIの処理中にエラーが発生しました: {e}")
+                status, payload = 500, {"error": str(e)}
+            if status >= 400:
+                # 読み残した本文があっても次の要求と混ざらないよう、接続を閉じる
+                self.close_connection = True
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            if self.close_connection:
+                self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY:
+                raise ControlError(413, "要求が大きすぎます")
+            if not length:
+                return None
+            try:
+                return json.loads(self.rfile.read(length).decode("utf-8"))
+            except (UnicodeDecodeError, ValueError):
+                raise ControlError(400, "JSONとして読めません") from None
+
+        def log_message(self, format, *args):
+            # 要求ごとのアクセスログは出さない
+            pass
+
+    return Handler
+
+
+def create_control_server(config, scheduler, create_job, admission=None):
+    """設定から制御APIを作る（control_port が0なら作らない）"""
+    port = config.get("control_port", 0)
+    if not port:
+        return None
+    return ControlServer(
+        scheduler, create_job,
+        host=config.get("control_host", "127.0.0.1"),
+        port=port,
+        token=config.get("control_token") or None,
+        admission=admission,
+    )
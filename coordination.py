@@ -0,0 +1,528 @@
+"""複数のプロセス・ホストでスケジュールを分担するためのリース（期限付きの担当権）
+
+共有の保存先（SQLiteファイル、またはテスト用のメモリ上の代役）に分担するスケジュールを登録し、
+各ワーカー（ShardWorker）が期限付きのリースで担当を取る。ワーカーは再生している間
+lease_ttl の3分の1ごとにリースを延長し、進み具合（回数・再生位置・次回発火時刻）も書き込む。
+ワーカーが落ちるとリースが切れ、別のワーカーが最後の進み具合から引き継ぐ
+（遅くとも lease_ttl + 確認間隔 のうちに）。
+
+担当の数は、生きているワーカー（最近ハートビートのあったもの）で均等になるように取り、
+取り分より多く担当していて、ブラウザの数がほかのワーカーより2つ以上多いワーカーは担当を1つずつ手放す。
+
+リースの期限は time.time() 基準なので、ホストをまたぐ場合は時計を合わせておくこと
+（ずれが lease_ttl より十分小さければよい）。SQLiteのファイルを共有できるのは、
+ロックが正しく働くファイルシステム（同じマシンのローカルディスクなど）に限る。
+別の保存先を使うには、SQLiteLeases と同じメソッドを持つオブジェクトを ShardWorker に渡す。
+"""
+import os
+import json
+import math
+import time
+import socket
+import sqlite3
+import threading
+
+from process_registry import PROCESS_REGISTRY
+
+# 1回の確認で新たに取る担当の上限（起動の集中を避け、ほかのワーカーにも回す）
+CLAIM_BATCH = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    urls TEXT NOT NULL,
+    shuffle INTEGER NOT NULL DEFAULT 0,
+    interval REAL NOT NULL,
+    count INTEGER,
+    iteration INTEGER NOT NULL DEFAULT 0,
+    position INTEGER NOT NULL DEFAULT 0,
+    next_fire REAL,
+    state TEXT NOT NULL DEFAULT 'active',
+    reason TEXT,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shards_lease ON shards(lease_until) WHERE state = 'active';
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    browsers INTEGER NOT NULL DEFAULT 0,
+    owned INTEGER NOT NULL DEFAULT 0,
+    capacity INTEGER NOT NULL DEFAULT 0,
+    heartbeat REAL NOT NULL
+);
+"""
+
+_SHARD_COLUMNS = ("id", "urls", "shuffle", "interval", "count", "iteration", "position",
+                  "next_fire", "state", "reason", "owner", "lease_until")
+
+
+class SQLiteLeases:
+    """SQLiteファイルに置くリースの保存先（同じファイルを複数のプロセスから開いて使う）
+
+    担当の取得は BEGIN IMMEDIATE で書き込みを直列にするので、同じスケジュールを
+    2つのワーカーが同時に取ることはない。
+    """
+
+    def __init__(self, path, busy_timeout=10.0):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            for statement in _SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+
+    def add(self, urls, shuffle, interval, count, now=None):
+        """分担するスケジュールを登録してIDを返す"""
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO shards (urls, shuffle, interval, count, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (json.dumps(urls, ensure_ascii=False), int(shuffle), interval, count, now, now))
+            return cursor.lastrowid
+
+    def finish(self, shard_id, reason="stopped", now=None):
+        """スケジュールを終了済みにする（担当しているワーカーは次の延長で手放す）"""
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE shards SET state = 'finished', reason = ?, owner = NULL, lease_until = 0, updated = ?"
+                " WHERE id = ? AND state = 'active'", (reason, now, shard_id)).rowcount > 0
+
+    def shards(self, active_only=False):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_SHARD_COLUMNS)} FROM shards"
+                + (" WHERE state = 'active'" if active_only else "") + " ORDER BY id").fetchall()
+        return [_shard(row) for row in rows]
+
+    def heartbeat(self, worker_id, browsers, owned, capacity=0, now=None):
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO workers (id, host, pid, browsers, owned, capacity, heartbeat) VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET browsers = excluded.browsers, owned = excluded.owned,"
+                " capacity = excluded.capacity, heartbeat = excluded.heartbeat",
+                (worker_id, socket.gethostname(), os.getpid(), browsers, owned, capacity, now))
+
+    def workers(self, ttl, now=None):
+        """ttl 秒以内にハートビートのあったワーカー"""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, host, pid, browsers, owned, capacity, heartbeat FROM workers WHERE heartbeat >= ?"
+                " ORDER BY id", (now - ttl,)).fetchall()
+        return [dict(zip(("id", "host", "pid", "browsers", "owned", "capacity", "heartbeat"), row)) for row in rows]
+
+    def leave(self, worker_id):
+        """ワーカーの登録を消し、担当をすべて手放す"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE shards SET owner = NULL, lease_until = 0 WHERE owner = ?", (worker_id,))
+            conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def count_active(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM shards WHERE state = 'active'").fetchone()[0]
+
+    def claim(self, worker_id, limit, ttl, now=None):
+        """担当のない（またはリースの切れた）スケジュールを次回発火の早い順に limit 件取る"""
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(_SHARD_COLUMNS)} FROM shards WHERE state = 'active' AND lease_until < ?"
+                " ORDER BY next_fire IS NOT NULL, next_fire, id LIMIT ?", (now, limit)).fetchall()
+            for row in rows:
+                conn.execute("UPDATE shards SET owner = ?, lease_until = ? WHERE id = ?",
+                             (worker_id, now + ttl, row[0]))
+        return [dict(_shard(row), owner=worker_id, lease_until=now + ttl) for row in rows]
+
+    def renew(self, worker_id, shard_ids, ttl, now=None):
+        """リースを延長し、まだ担当しているIDの集合を返す（取られた・終了したものは含まない）"""
+        now = time.time() if now is None else now
+        if not shard_ids:
+            return set()
+        with self._transaction() as conn:
+            marks = ", ".join("?" * len(shard_ids))
+            conn.execute(
+                f"UPDATE shards SET lease_until = ? WHERE owner = ? AND state = 'active' AND id IN ({marks})",
+                (now + ttl, worker_id, *shard_ids))
+            rows = conn.execute(
+                f"SELECT id FROM shards WHERE owner = ? AND state = 'active' AND id IN ({marks})",
+                (worker_id, *shard_ids)).fetchall()
+        return {row[0] for row in rows}
+
+    def checkpoint(self, worker_id, updates, now=None):
+        """担当しているスケジュールの進み具合をまとめて書く
+
+        updates は (shard_id, iteration, position, next_fire, reason) のリストで、reason が
+        None でなければ終了済みにする。担当していないものは書かない。
+        """
+        now = time.time() if now is None else now
+        if not updates:
+            return
+        with self._transaction() as conn:
+            for shard_id, iteration, position, next_fire, reason in updates:
+                if reason is None:
+                    conn.execute(
+                        "UPDATE shards SET iteration = ?, position = ?, next_fire = ?, updated = ?"
+                        " WHERE id = ? AND owner = ?", (iteration, position, next_fire, now, shard_id, worker_id))
+                else:
+                    conn.execute(
+                        "UPDATE shards SET iteration = ?, position = ?, next_fire = NULL, state = 'finished',"
+                        " reason = ?, owner = NULL, lease_until = 0, updated = ? WHERE id = ? AND owner = ?",
+                        (iteration, position, reason, now, shard_id, worker_id))
+
+    def release(self, worker_id, shard_ids):
+        """担当を手放す（すぐにほかのワーカーが取れるようにする）"""
+        if not shard_ids:
+            return
+        with self._transaction() as conn:
+            conn.executemany("UPDATE shards SET owner = NULL, lease_until = 0 WHERE id = ? AND owner = ?",
+                             [(shard_id, worker_id) for shard_id in shard_ids])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self):
+        return _Transaction(self._conn, self._lock)
+
+
+class _Transaction:
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+
+
+class MemoryLeases:
+    """同じプロセスの中だけで使うリースの保存先（SQLiteLeases の代役、テストや1台での確認用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shards = {}
+        self._workers = {}
+        self._next_id = 1
+
+    def add(self, urls, shuffle, interval, count, now=None):
+        with self._lock:
+            shard_id, self._next_id = self._next_id, self._next_id + 1
+            self._shards[shard_id] = {
+                "id": shard_id, "urls": list(urls), "shuffle": bool(shuffle), "interval": interval,
+                "count": count, "iteration": 0, "position": 0, "next_fire": None, "state": "active",
+                "reason": None, "owner": None, "lease_until": 0.0,
+            }
+            return shard_id
+
+    def finish(self, shard_id, reason="stopped", now=None):
+        with self._lock:
+            shard = self._shards.get(shard_id)
+            if shard is None or shard["state"] != "active":
+                return False
+            shard.update(state="finished", reason=reason, owner=None, lease_until=0.0)
+            return True
+
+    def shards(self, active_only=False):
+        with self._lock:
+            return [dict(s) for _, s in sorted(self._shards.items())
+                    if not active_only or s["state"] == "active"]
+
+    def heartbeat(self, worker_id, browsers, owned, capacity=0, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._workers[worker_id] = {
+                "id": worker_id, "host": socket.gethostname(), "pid": os.getpid(),
+                "browsers": browsers, "owned": owned, "capacity": capacity, "heartbeat": now,
+            }
+
+    def workers(self, ttl, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return [dict(w) for _, w in sorted(self._workers.items()) if w["heartbeat"] >= now - ttl]
+
+    def leave(self, worker_id):
+        with self._lock:
+            for shard in self._shards.values():
+                if shard["owner"] == worker_id:
+                    shard.update(owner=None, lease_until=0.0)
+            self._workers.pop(worker_id, None)
+
+    def count_active(self):
+        with self._lock:
+            return sum(1 for s in self._shards.values() if s["state"] == "active")
+
+    def claim(self, worker_id, limit, ttl, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            free = [s for s in self._shards.values() if s["state"] == "active" and s["lease_until"] < now]
+            free.sort(key=lambda s: (s["next_fire"] is not None, s["next_fire"] or 0, s["id"]))
+            claimed = []
+            for shard in free[:limit]:
+                shard.update(owner=worker_id, lease_until=now + ttl)
+                claimed.append(dict(shard))
+            return claimed
+
+    def renew(self, worker_id, shard_ids, ttl, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            owned = set()
+            for shard_id in shard_ids:
+                shard = self._shards.get(shard_id)
+                if shard and shard["owner"] == worker_id and shard["state"] == "active":
+                    shard["lease_until"] = now + ttl
+                    owned.add(shard_id)
+            return owned
+
+    def checkpoint(self, worker_id, updates, now=None):
+        with self._lock:
+            for shard_id, iteration, position, next_fire, reason in updates:
+                shard = self._shards.get(shard_id)
+                if shard is None or shard["owner"] != worker_id:
+                    continue
+                shard.update(iteration=iteration, position=position, next_fire=next_fire)
+                if reason is not None:
+                    shard.update(next_fire=None, state="finished", reason=reason, owner=None, lease_until=0.0)
+
+    def release(self, worker_id, shard_ids):
+        with self._lock:
+            for shard_id in shard_ids:
+                shard = self._shards.get(shard_id)
+                if shard and shard["owner"] == worker_id:
+                    shard.update(owner=None, lease_until=0.0)
+
+    def close(self):
+        pass
+
+
+def _shard(row):
+    shard = dict(zip(_SHARD_COLUMNS, row))
+    shard["urls"] = json.loads(shard["urls"])
+    shard["shuffle"] = bool(shard["shuffle"])
+    return shard
+
+
+class ShardWorker:
+    """リースで担当を取ったスケジュールを、このプロセスのスケジューラで動かす
+
+    create_job(target, shuffle) は制御APIと同じジョブの作り方。capacity は同時に担当する
+    スケジュールの上限（0なら無制限）。lease_ttl 秒の3分の1ごとに、リースの延長・
+    進み具合の書き込み・ハートビート・担当の取得と手放しを行う。
+    """
+
+    def __init__(self, backend, scheduler, create_job, worker_id=None, lease_ttl=15.0, capacity=0,
+                 registry=PROCESS_REGISTRY, clock=time.time):
+        self.backend = backend
+        self.scheduler = scheduler
+        self.create_job = create_job
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ttl = lease_ttl
+        self.poll = lease_ttl / 3
+        self.capacity = capacity
+        self.registry = registry
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._owned = {}  # shard_id -> Schedule
+        self._shard_of = {}  # Schedule.id -> shard_id
+        self._pending = {}  # shard_id -> 書き込み待ちの進み具合
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._shed_at = None  # 最後に担当を手放した時刻（すぐに取り戻さないため）
+        self._joined = False
+
+    def start(self):
+        self.scheduler.add_listener(self.on_state)
+        self._thread = threading.Thread(target=self._run, name="shard-worker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """確認をやめ、担当しているスケジュールを止める（進み具合は書くが、リースはまだ手放さない）
+
+        ブラウザを終了させた後で leave() を呼ぶ。先に手放すと、ほかのワーカーが引き継いだ
+        スケジュールのブラウザと、このワーカーの終了していないブラウザが同時に動いてしまう。
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            owned, self._owned = self._owned, {}
+            self._shard_of.clear()
+        for schedule in owned.values():
+            self.scheduler.cancel(schedule.id)
+        self._flush()
+
+    def leave(self):
+        """担当をすべて手放し、ワーカーの登録を消す（ほかのワーカーがすぐに続きを取れる）"""
+        self.backend.leave(self.worker_id)
+
+    def owned(self):
+        with self._lock:
+            return sorted(self._owned)
+
+    def load(self):
+        """このワーカーの負荷（起動しているブラウザ数。まだ起動していない担当も1つと数える）"""
+        with self._lock:
+            owned = len(self._owned)
+        return max(len(self.registry.roots()), owned)
+
+    # ---- スケジューラからの通知（ロック内なので写すだけ） ----
+
+    def on_state(self, schedule, state):
+        with self._lock:
+            shard_id = self._shard_of.get(schedule.id)
+            if shard_id is None:
+                return
+            spec = schedule.job.checkpoint(schedule)
+            reason = None
+            next_fire = None
+            if state == "finished":
+                reason = "error" if schedule.error is not None else ("stopped" if schedule.cancelled else "completed")
+                self._owned.pop(shard_id, None)
+                self._shard_of.pop(schedule.id, None)
+            elif state == "waiting" and schedule.next_fire is not None:
+                next_fire = self.clock() + schedule.remaining()
+            self._pending[shard_id] = (shard_id, schedule.iteration, spec["position"], next_fire, reason)
+        if reason is not None:
+            self._wake.set()
+
+    # ---- 確認 ----
+
+    def tick(self):
+        """リースの延長・進み具合の書き込み・ハートビート・担当の調整を1回行う"""
+        now = self.clock()
+        self._flush()
+        self._renew(now)
+        owned = len(self.owned())
+        self.backend.heartbeat(self.worker_id, len(self.registry.roots()), owned, self.capacity, now)
+        if not self._joined:
+            # 同時に起動したワーカーがそろって見えるよう、最初の確認では担当を取らない
+            self._joined = True
+            return
+        self._balance(now, owned)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"分担の確認中にエラーが発生しました: {e}")
+            self._wake.wait(self.poll)
+            self._wake.clear()
+
+    def _flush(self):
+        with self._lock:
+            updates, self._pending = list(self._pending.values()), {}
+        self.backend.checkpoint(self.worker_id, updates)
+
+    def _renew(self, now):
+        with self._lock:
+            ids = list(self._owned)
+        kept = self.backend.renew(self.worker_id, ids, self.lease_ttl, now)
+        for shard_id in set(ids) - kept:
+            # ほかのワーカーに取られた（延長が遅れた）か、終了済みにされた
+            print(f"分担{shard_id}の担当を失ったので停止します")
+            self._drop(shard_id)
+
+    def _balance(self, now, owned):
+        live = self.backend.workers(self.lease_ttl, now)
+        if not any(w["id"] == self.worker_id for w in live):
+            live.append({"id": self.worker_id, "browsers": self.load(), "owned": owned})
+        total = self.backend.count_active()
+        # 取るときは均等に分けた数の切り上げまで、手放すのは切り捨てより多いときだけ
+        target = math.ceil(total / len(live))
+        if self.capacity:
+            target = min(target, self.capacity)
+        if owned < target:
+            if self._shed_at is not None and now - self._shed_at < 2 * self.poll:
+                return
+            for shard in self.backend.claim(self.worker_id, min(target - owned, CLAIM_BATCH), self.lease_ttl, now):
+                self._adopt(shard, now)
+            return
+        # 均等に分けた数より多く担当していて、負荷（ブラウザ数）がいちばん少ないワーカーより2つ以上多ければ、
+        # 1つ手放して回す（それ以下なら、終了中のブラウザで一時的に多く見えても手放さない）
+        others = [w for w in live if w["id"] != self.worker_id and
+                  (not w.get("capacity") or w.get("owned", 0) < w["capacity"])]
+        if owned > total // len(live) and others and self.load() - min(_load(w) for w in others) >= 2:
+            shard_id = self._pick_to_shed()
+            if shard_id is not None:
+                print(f"分担{shard_id}をほかのワーカーに回します")
+                self._drop(shard_id)
+                self._flush()
+                self.backend.release(self.worker_id, [shard_id])
+                self._shed_at = now
+
+    def _pick_to_shed(self):
+        # 再生処理の最中でなく、次の発火がいちばん遅いものを手放す
+        with self._lock:
+            waiting = [(s.remaining(), shard_id) for shard_id, s in self._owned.items() if s.state in ("waiting", "pending")]
+        return max(waiting)[1] if waiting else None
+
+    def _adopt(self, shard, now):
+        urls = shard["urls"]
+        try:
+            job = self.create_job(urls if len(urls) > 1 else urls[0], shard["shuffle"])
+        except (ValueError, OSError) as e:
+            print(f"分担{shard['id']}を開始できません: {e}")
+            self.backend.checkpoint(self.worker_id, [(shard["id"], shard["iteration"], shard["position"], None, "error")])
+            return
+        job.seek(shard["position"])
+        schedule = job.schedule(shard["interval"], shard["count"])
+        schedule.iteration = shard["iteration"]
+        with self._lock:
+            self._owned[shard["id"]] = schedule
+            self._shard_of[schedule.id] = shard["id"]
+        # 止まっている間に過ぎた予定時刻はすぐに発火させる（まとめて取り戻しはしない）
+        delay = max(0.0, (shard["next_fire"] or now) - now)
+        self.scheduler.add(schedule, delay)
+        print(f"分担{shard['id']}を担当します（{schedule.iteration}回目まで再生済み、{delay:.1f}秒後に再生）")
+
+    def _drop(self, shard_id):
+        # 終了済みとして書かないよう、先に対応を外してから止める（進み具合は手放す前に書いた分まで）
+        with self._lock:
+            schedule = self._owned.pop(shard_id, None)
+            if schedule is not None:
+                self._shard_of.pop(schedule.id, None)
+        if schedule is not None:
+            self.scheduler.cancel(schedule.id)
+
+
+def _load(worker):
+    # ハートビートの値から ShardWorker.load() と同じ負荷を求める
+    return max(worker.get("browsers", 0), worker.get("owned", 0))
+
+
+def default_worker_id():
+    """名前を指定しないワーカーの名前（ホスト名-PID）"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def create_lease_backend(config, base_dir, path=None):
+    """設定（shard_store）からリースの保存先を作る（"memory" ならこのプロセスの中だけの代役）"""
+    path = path or config.get("shard_store", "shards.db")
+    if path == "memory":
+        return MemoryLeases()
+    if not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    return SQLiteLeases(path)
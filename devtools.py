@@ -0,0 +1,253 @@
+"""Chrome DevTools Protocol の最小クライアント
+
+Chromeを一度だけ起動しておき、繰り返しのたびにタブを再ナビゲートする
+「ウォームブラウザ」モードで使う。外部ライブラリに依存しないよう、
+WebSocketは必要な分だけ標準ライブラリで実装している。
+"""
+import os
+import json
+import time
+import base64
+import socket
+import struct
+import itertools
+import subprocess
+import urllib.request
+from urllib.parse import urlparse, quote
+
+import telemetry
+
+# Chromeが --remote-debugging-port=0 のときにポート番号を書き出すファイル
+ACTIVE_PORT_FILE = "DevToolsActivePort"
+
+
+class DevToolsError(Exception):
+    """DevToolsとの通信に失敗した"""
+
+
+class _WebSocket:
+    """テキストフレームの送受信だけを行うWebSocketクライアント"""
+
+    def __init__(self, url, timeout=5):
+        parsed = urlparse(url)
+        self.sock = socket.create_connection((parsed.hostname, parsed.port or 80), timeout=timeout)
+        try:
+            self._handshake(parsed)
+        except BaseException:
+            # 失敗した接続を残さない（繰り返しのたびに接続し直すので、放っておくとソケットが溜まる）
+            self.sock.close()
+            raise
+
+    def _handshake(self, parsed):
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        path = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {parsed.hostname}:{parsed.port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        )
+        self.sock.sendall(request.encode("ascii"))
+        header = b""
+        while b"\r\n\r\n" not in header:
+            chunk = self.sock.recv(1024)
+            if not chunk:
+                raise DevToolsError("WebSocketハンドシェイク中に切断されました")
+            header += chunk
+        header, self._buffer = header.split(b"\r\n\r\n", 1)
+        status = header.split(b"\r\n", 1)[0]
+        if status.split()[1:2] != [b"101"]:
+            raise DevToolsError(f"WebSocketハンドシェイクに失敗しました: {status!r}")
+
+    def send(self, text):
+        payload = text.encode("utf-8")
+        head = bytes([0x81])  # FIN + テキスト
+        length = len(payload)
+        if length < 126:
+            head += bytes([0x80 | length])
+        elif length < 65536:
+            head += bytes([0x80 | 126]) + struct.pack("!H", length)
+        else:
+            head += bytes([0x80 | 127]) + struct.pack("!Q", length)
+        mask = os.urandom(4)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.sock.sendall(head + mask + masked)
+
+    def recv(self):
+        """次のテキストメッセージを返す（ping/pongは内部で処理）"""
+        message = b""
+        while True:
+            b1, b2 = self._read(2)
+            opcode = b1 & 0x0F
+            length = b2 & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._read(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._read(8))[0]
+            mask = self._read(4) if b2 & 0x80 else None
+            data = self._read(length)
+            if mask:
+                data = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+            if opcode == 0x8:
+                raise DevToolsError("WebSocketが閉じられました")
+            if opcode == 0x9:
+                self._send_control(0xA, data)
+                continue
+            if opcode == 0xA:
+                continue
+            message += data
+            if b1 & 0x80:
+                return message.decode("utf-8")
+
+    def close(self):
+        try:
+            self._send_control(0x8, b"")
+        except OSError:
+            pass
+        self.sock.close()
+
+    def _send_control(self, opcode, data):
+        mask = os.urandom(4)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+        self.sock.sendall(bytes([0x80 | opcode, 0x80 | len(data)]) + mask + masked)
+
+    def _read(self, n):
+        while len(self._buffer) < n:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise DevToolsError("WebSocketが切断されました")
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+
+class DevToolsClient:
+    """DevToolsのHTTPエンドポイントとページ用WebSocketを扱う"""
+
+    def __init__(self, port, host="127.0.0.1", timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+
+    def _http(self, path, method="GET"):
+        req = urllib.request.Request(f"http://{self.host}:{self.port}{path}", method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode("utf-8") or "null")
+        except (OSError, ValueError) as e:
+            raise DevToolsError(f"DevTools HTTPエラー ({path}): {e}") from e
+
+    def version(self):
+        return self._http("/json/version")
+
+    def targets(self):
+        return self._http("/json/list")
+
+    def page_target(self):
+        """最初のページタブを返す（なければNone）"""
+        for target in self.targets():
+            if target.get("type") == "page" and target.get("webSocketDebuggerUrl"):
+                return target
+        return None
+
+    def call(self, ws_url, method, params=None):
+        """WebSocket経由でコマンドを1つ送り、その応答を返す"""
+        msg_id = next(self._ids)
+        ws = None
+        try:
+            ws = _WebSocket(ws_url, timeout=self.timeout)
+            ws.send(json.dumps({"id": msg_id, "method": method, "params": params or {}}))
+            while True:
+                reply = json.loads(ws.recv())
+                if reply.get("id") == msg_id:
+                    break
+        except (OSError, ValueError) as e:
+            raise DevToolsError(f"DevToolsコマンドに失敗しました ({method}): {e}") from e
+        finally:
+            if ws:
+                ws.close()
+        if "error" in reply:
+            raise DevToolsError(f"{method}: {reply['error']}")
+        return reply.get("result", {})
+
+    def navigate(self, url):
+        """既存のタブを指定URLへ再ナビゲートする（タブがなければ新規に開く）"""
+        target = self.page_target()
+        if target is None:
+            self._http(f"/json/new?{quote(url, safe='')}", method="PUT")
+            return
+        self.call(target["webSocketDebuggerUrl"], "Page.navigate", {"url": url})
+
+
+def wait_for_active_port(user_data_dir, proc=None, timeout=15, stop_event=None):
+    """DevToolsActivePort ファイルが書き出されるまで待ち、ポート番号を返す
+
+    待っている間に stop_event がセットされたらNoneを返す。
+    """
+    path = os.path.join(user_data_dir, ACTIVE_PORT_FILE)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if stop_event is not None and stop_event.is_set():
+            return None
+        if proc is not None and proc.poll() is not None:
+            raise DevToolsError("ブラウザがDevToolsの準備前に終了しました")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                first_line = f.readline().strip()
+            if first_line:
+                return int(first_line)
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.05)
+    raise DevToolsError("DevToolsの待ち受けポートが見つかりません")
+
+
+class WarmBrowser:
+    """一度起動したChromeを使い回し、繰り返しごとにタブだけを再ナビゲートする"""
+
+    def __init__(self, user_data_dir, timeout=5, spawn=subprocess.Popen):
+        self.user_data_dir = user_data_dir
+        self.timeout = timeout
+        self.spawn = spawn
+        self.proc = None
+        self.client = None
+
+    def is_alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def launch(self, cmd, stop_event=None):
+        """リモートデバッグを有効にしてChromeを起動し、準備完了まで待つ
+
+        cmd は最後の要素が再生URLであるChromeのコマンドライン。
+        待っている間に stop_event がセットされたら、接続せずに起動したプロセスを返す。
+        """
+        # 前回の待ち受けポート情報が残っていると誤検出するので消しておく
+        try:
+            os.remove(os.path.join(self.user_data_dir, ACTIVE_PORT_FILE))
+        except OSError:
+            pass
+        cmd = cmd[:-1] + ["--remote-debugging-port=0", cmd[-1]]
+        with telemetry.stage("spawn"):
+            self.proc = self.spawn(cmd)
+        with telemetry.stage("ready"):
+            port = wait_for_active_port(self.user_data_dir, self.proc, timeout=max(self.timeout, 15),
+                                        stop_event=stop_event)
+        if port is None:
+            return self.proc
+        self.client = DevToolsClient(port, timeout=self.timeout)
+        return self.proc
+
+    def play(self, url):
+        """起動済みのChromeでURLを開き直す（失敗時は DevToolsError）"""
+        if not self.is_alive() or self.client is None:
+            raise DevToolsError("ウォームブラウザが起動していません")
+        with telemetry.stage("navigate"):
+            self.client.navigate(url)
+
+    def detach(self):
+        """プロセスを手放す（終了処理は呼び出し側で行う）"""
+        proc, self.proc, self.client = self.proc, None, None
+        return proc
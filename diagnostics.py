@@ -0,0 +1,325 @@
+"""長時間動かしているアプリの中を、止めずに調べるための診断機能
+
+次の3つを、設定（diagnostics）・環境変数 YTR_DIAG・シグナル・制御APIから切り替える。
+結果はいずれも diagnostics_dir に時刻入りのファイル名で書き出す。
+
+- profile: 繰り返し処理（Repeater.run_iteration と、並行して行う動画情報の取得など。Python 3.12以降は
+  プロセス全体）を cProfile で計測する。止めたときに .pstats（pstats / snakeviz で読める）と累積時間順の .txt を書く
+- tracemalloc: メモリ確保の追跡を始め、スナップショットを取るたびに前回との差分
+  （確保した場所ごと）と、型ごとの生存オブジェクト数の増減を書く（PhotoImage や
+  psutil.Process が溜まっていないかを見る）
+- stacks: 全スレッドのスタックを書く
+
+シグナル（POSIXのみ）: SIGUSR1 でプロファイルの開始・停止、SIGUSR2 でスナップショットと
+スタックの書き出し。無効な間のコストは、繰り返しごとの属性1つの確認だけ。
+
+    YTR_DIAG=profile,tracemalloc python cli.py ...
+    kill -USR2 <pid>
+"""
+import gc
+import io
+import os
+import sys
+import time
+import signal
+import threading
+import traceback
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+# 差分やプロファイルの要約に載せる件数
+TOP_LINES = 40
+# tracemalloc で保存するスタックの深さ
+TRACE_FRAMES = 25
+
+# 3.12以降の cProfile は sys.monitoring を使い、1つの Profile で全スレッドを測る（2つ目を同時に有効に
+# すると ValueError になる）。それより前はスレッドごとにしか測れない
+PROCESS_WIDE_PROFILE = sys.version_info >= (3, 12)
+
+_NOTHING = nullcontext()
+
+
+class Diagnostics:
+    """プロファイル・メモリ確保の差分・スレッドのスタックをファイルに書き出す"""
+
+    def __init__(self, out_dir="diagnostics"):
+        self.out_dir = out_dir
+        self._lock = threading.Lock()
+        self._stats = None  # 計測中なら、終わった回の結果をまとめていく pstats.Stats
+        self._profile = None  # 3.12以降で計測中なら、全スレッドを測っている cProfile.Profile
+        self._profile_runs = 0  # まとめた回数
+        self._profile_started = None
+        self._local = threading.local()  # このスレッドで計測中か（入れ子にしない）
+        self._snapshot = None  # 前回の tracemalloc スナップショット
+        self._type_counts = None
+        self.last_files = []
+
+    @property
+    def profiling(self):
+        return self._stats is not None
+
+    @property
+    def tracing(self):
+        # 使わないときは読み込まない（起動を軽くする）
+        tracemalloc = sys.modules.get("tracemalloc")
+        return tracemalloc is not None and tracemalloc.is_tracing()
+
+    def status(self):
+        return {
+            "out_dir": self.out_dir,
+            "profiling": self.profiling,
+            "tracing": self.tracing,
+            "last_files": list(self.last_files),
+        }
+
+    # ---- プロファイル ----
+
+    def profiled(self):
+        """繰り返し処理を囲む（計測中でなければ何もしない）
+
+        3.12以降は start_profile で有効にした1つの Profile が全スレッドを測るので、ここでは何もしない。
+        それより前はスレッドごとにしか測れないので、回ごとに Profile を作り、終わるたびに
+        それまでの結果にまとめる（長く計測しても、溜まるのは関数ごとの集計だけ）。
+        同じスレッドですでに測っていれば、入れ子にせずそのまま含める。
+        """
+        if self._stats is None or PROCESS_WIDE_PROFILE or getattr(self._local, "active", False):
+            return _NOTHING
+        return self._profile_one()
+
+    @contextmanager
+    def _profile_one(self):
+        import cProfile
+        import pstats
+        profile = cProfile.Profile()
+        self._local.active = True
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.active = False
+            # 集計はロックの外で作り、まとめるところだけロックを取る
+            stats = pstats.Stats(profile)
+            with self._lock:
+                if self._stats is not None:
+                    self._stats.add(stats)
+                    self._profile_runs += 1
+
+    def start_profile(self):
+        """プロファイルの計測を始める（計測中なら False）"""
+        import pstats
+        with self._lock:
+            if self._stats is not None:
+                return False
+            if PROCESS_WIDE_PROFILE:
+                import cProfile
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError as e:
+                    # デバッガやカバレッジなど、ほかの計測ツールが使っている
+                    print(f"診断: プロファイルを開始できません: {e}")
+                    return False
+                self._profile = profile
+            self._stats = pstats.Stats()
+            self._profile_runs = 0
+            self._profile_started = time.monotonic()
+        print("診断: プロファイルの計測を始めました")
+        return True
+
+    def stop_profile(self):
+        """計測をやめて結果を書き出し、書いた .txt のパスを返す（計測中でなければ None）
+
+        3.12より前は、計測中だった回の分は含まれない（その回が終わった時点で捨てる）。
+        """
+        with self._lock:
+            stats, self._stats = self._stats, None
+            profile, self._profile = self._profile, None
+            runs = self._profile_runs
+            started = self._profile_started
+        if stats is None:
+            return None
+        if profile is not None:
+            profile.disable()
+            stats.add(profile)
+        base = self._path("profile")
+        stats.dump_stats(f"{base}.pstats")
+        out = io.StringIO()
+        if PROCESS_WIDE_PROFILE:
+            out.write(f"全スレッド、{time.monotonic() - started:.1f}秒間\n\n")
+        else:
+            out.write(f"{runs}回分、{time.monotonic() - started:.1f}秒間\n\n")
+        if stats.stats:
+            stats.stream = out
+            stats.sort_stats("cumulative").print_stats(TOP_LINES)
+        path = self._write(f"{base}.txt", out.getvalue())
+        print(f"診断: プロファイルを書き出しました: {path}")
+        return path
+
+    def toggle_profile(self):
+        if not self.start_profile():
+            return self.stop_profile()
+        return None
+
+    # ---- メモリ ----
+
+    def start_tracing(self):
+        """メモリ確保の追跡を始める（追跡中なら False）"""
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(TRACE_FRAMES)
+        print("診断: メモリ確保の追跡を始めました")
+        return True
+
+    def stop_tracing(self):
+        with self._lock:
+            self._snapshot = None
+        if self.tracing:
+            sys.modules["tracemalloc"].stop()
+
+    def snapshot(self):
+        """スナップショットを取り、前回との差分を書き出してパスを返す
+
+        追跡していなければここで始める（最初の1回は、その時点からの基準になる）。
+        """
+        import tracemalloc
+        self.start_tracing()
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        counts = Counter(type(o).__qualname__ for o in gc.get_objects())
+        with self._lock:
+            previous, self._snapshot = self._snapshot, snapshot
+            previous_counts, self._type_counts = self._type_counts, counts
+
+        current, peak = tracemalloc.get_traced_memory()
+        out = io.StringIO()
+        out.write(f"追跡中のメモリ: {current / 1024:.1f} KiB（最大 {peak / 1024:.1f} KiB）\n")
+        if previous is None:
+            out.write("\n[確保した場所ごとの上位（次回からは前回との差分）]\n")
+            for stat in snapshot.statistics("lineno")[:TOP_LINES]:
+                out.write(f"{stat}\n")
+        else:
+            out.write("\n[前回からの増減（確保した場所ごと）]\n")
+            for stat in snapshot.compare_to(previous, "lineno")[:TOP_LINES]:
+                out.write(f"{stat}\n")
+            out.write("\n[最も増えた場所のスタック]\n")
+            grown = snapshot.compare_to(previous, "traceback")
+            if grown and grown[0].size_diff > 0:
+                out.write("\n".join(grown[0].traceback.format()) + "\n")
+
+        out.write("\n[型ごとの生存オブジェクト数]\n")
+        if previous_counts is None:
+            for name, n in counts.most_common(TOP_LINES):
+                out.write(f"{name}: {n}\n")
+        else:
+            delta = Counter(counts)
+            delta.subtract(previous_counts)
+            for name, n in sorted(delta.items(), key=lambda item: -abs(item[1]))[:TOP_LINES]:
+                if n:
+                    out.write(f"{name}: {counts[name]} ({n:+d})\n")
+        path = self._write(f"{self._path('tracemalloc')}.txt", out.getvalue())
+        print(f"診断: メモリのスナップショットを書き出しました: {path}")
+        return path
+
+    # ---- スレッド ----
+
+    def dump_stacks(self):
+        """全スレッドのスタックを書き出してパスを返す"""
+        names = {t.ident: t for t in threading.enumerate()}
+        out = io.StringIO()
+        for ident, frame in sys._current_frames().items():
+            thread = names.get(ident)
+            name = thread.name if thread is not None else "?"
+            daemon = " daemon" if thread is not None and thread.daemon else ""
+            out.write(f"--- {name} (ident={ident}{daemon})\n")
+            out.write("".join(traceback.format_stack(frame)))
+            out.write("\n")
+        path = self._write(f"{self._path('threads')}.txt", out.getvalue())
+        print(f"診断: スレッドのスタックを書き出しました: {path}")
+        return path
+
+    def close(self):
+        """計測中のプロファイルがあれば書き出す"""
+        self.stop_profile()
+
+    # ---- 内部処理 ----
+
+    def _path(self, kind):
+        os.makedirs(self.out_dir, exist_ok=True)
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        return os.path.join(self.out_dir, f"{kind}-{stamp}-{int(now * 1000) % 1000:03d}-{os.getpid()}")
+
+    def _write(self, path, text):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        with self._lock:
+            self.last_files = (self.last_files + [path])[-10:]
+        return path
+
+
+DIAGNOSTICS = Diagnostics()
+
+# 有効にできる診断の名前
+FEATURES = ("profile", "tracemalloc")
+
+
+def parse_features(value):
+    """"profile,tracemalloc" のような指定（またはリスト）を名前の集合にする（"all" / "1" はすべて）"""
+    if isinstance(value, str):
+        value = value.replace(" ", "").split(",")
+    names = {str(v).lower() for v in value or () if v}
+    if names & {"all", "1", "true"}:
+        return set(FEATURES)
+    unknown = names - set(FEATURES)
+    if unknown:
+        print(f"診断: 不明な指定を無視します: {', '.join(sorted(unknown))}")
+    return names & set(FEATURES)
+
+
+def setup_diagnostics(config, base_dir, environ=os.environ):
+    """設定と環境変数 YTR_DIAG から診断を準備し、シグナルを登録する"""
+    out_dir = config.get("diagnostics_dir", "diagnostics")
+    if not os.path.isabs(out_dir):
+        out_dir = os.path.join(base_dir, out_dir)
+    DIAGNOSTICS.out_dir = out_dir
+    features = parse_features(config.get("diagnostics", [])) | parse_features(environ.get("YTR_DIAG", ""))
+    if "tracemalloc" in features:
+        DIAGNOSTICS.start_tracing()
+    if "profile" in features:
+        DIAGNOSTICS.start_profile()
+    install_signal_handlers()
+    return DIAGNOSTICS
+
+
+def install_signal_handlers():
+    """SIGUSR1 / SIGUSR2 に診断を割り当てる（対応していないOSやメインスレッド以外では何もしない）"""
+    if not hasattr(signal, "SIGUSR1") or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def in_background(fn):
+        # 書き出しはメインスレッド（Tkのイベントループなど）を止めないよう別スレッドで行う
+        def handler(signum, frame):
+            threading.Thread(target=_report_errors, args=(fn,), name="diagnostics", daemon=True).start()
+        return handler
+
+    signal.signal(signal.SIGUSR1, in_background(DIAGNOSTICS.toggle_profile))
+    signal.signal(signal.SIGUSR2, in_background(_snapshot_and_stacks))
+    return True
+
+
+def _snapshot_and_stacks():
+    DIAGNOSTICS.snapshot()
+    DIAGNOSTICS.dump_stacks()
+
+
+def _report_errors(fn):
+    try:
+        fn()
+    except Exception as e:
+        print(f"診断の書き出しに失敗しました: {e}")
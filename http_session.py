@@ -0,0 +1,93 @@
+"""共有HTTPセッションと接続状態の追跡
+
+接続確認・oEmbed・サムネイルの取得はすべて1つのセッションを通すので、
+同じホストへのTCP/TLS接続は使い回され、一時的な失敗は回数を限って再試行される。
+いずれかの要求が応答を得ていれば、それを「接続できている」根拠として
+一定時間は毎回の接続確認を省く。その期間は繰り返しの間隔の分だけ延ばすので、
+間隔の長いスケジュールでも前の回の通信が根拠になる（毎回は確認しない）。
+"""
+import time
+import threading
+
+# 接続できていたとみなす期間（秒、繰り返しの間隔に足して使う）
+EVIDENCE_MAX_AGE = 60
+# 再試行する回数と間隔の基準（urllib3のRetryに渡す）
+RETRIES = 2
+RETRY_BACKOFF = 0.3
+POOL_SIZE = 8
+
+_lock = threading.Lock()
+_session = None
+
+
+class ConnectivityTracker:
+    """直近の通信結果から、接続できているかどうかを判断する"""
+
+    def __init__(self, max_age=EVIDENCE_MAX_AGE, clock=time.monotonic):
+        self.max_age = max_age
+        self.clock = clock
+        self.last_success = None
+        self.failures = 0  # 連続して失敗した回数
+
+    def record_success(self):
+        self.last_success = self.clock()
+        self.failures = 0
+
+    def record_failure(self):
+        self.last_success = None
+        self.failures += 1
+
+    def recently_online(self, interval=0):
+        """最近の応答があり、接続確認を省いてよいかどうか
+
+        interval には繰り返しの間隔を渡す（前の回の通信から max_age 以内なら省く）。
+        """
+        last = self.last_success
+        return last is not None and self.clock() - last < self.max_age + interval
+
+
+CONNECTIVITY = ConnectivityTracker()
+
+
+def get_session():
+    """共有セッションを返す（最初の呼び出しでrequestsを読み込んで作る）"""
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            retry = Retry(
+                total=RETRIES,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset({"GET", "HEAD"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def request(method, url, **kwargs):
+    """共有セッションで要求を送り、結果を接続状態に反映する"""
+    import requests
+    try:
+        resp = get_session().request(method, url, **kwargs)
+    except (requests.ConnectionError, requests.Timeout):
+        CONNECTIVITY.record_failure()
+        raise
+    # 応答が返ってきた時点で、ステータスに関係なく接続はできている
+    CONNECTIVITY.record_success()
+    return resp
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def head(url, **kwargs):
+    return request("HEAD", url, **kwargs)
@@ -0,0 +1,162 @@
+"""再生に使うブラウザの起動方法
+
+Chromium系（Chrome / Chromium / Edge / Brave など）はプロファイル・リモートデバッグ・
+起動モードに対応する。それ以外（Firefox や任意のプレーヤー）は、実行ファイルに
+追加の引数とURLを渡すだけの汎用の起動方法を使う。
+
+起動モード:
+    normal    通常のウィンドウ
+    minimal   小さなミュートのウィンドウ。バックグラウンドでの処理の間引きを止め、
+              GPU・合成・メモリの負荷を下げるオプションを付ける
+    headless  画面を出さずに再生する（無人運用向け）
+"""
+import os
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+
+LAUNCH_MODES = ("normal", "minimal", "headless")
+
+# 背面に回ってもタイマーや再生が間引かれないようにする
+_NO_THROTTLING = [
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+]
+# 再生に関係のない機能を止めてメモリとCPUを節約する
+_LOW_RESOURCE = [
+    "--mute-audio",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-features=Translate,MediaRouter,OptimizationHints",
+    "--disable-background-networking",
+    "--renderer-process-limit=2",
+]
+
+_MODE_FLAGS = {
+    "normal": [],
+    "minimal": _LOW_RESOURCE + _NO_THROTTLING + [
+        "--window-size=640,360",
+        "--disable-gpu-compositing",
+    ],
+    "headless": _LOW_RESOURCE + _NO_THROTTLING + [
+        "--headless=new",
+        "--disable-gpu",
+        "--window-size=640,360",
+    ],
+}
+
+_CHROMIUM_NAMES = ("chrome", "chromium", "msedge", "brave", "vivaldi", "opera")
+
+
+def low_quality_url(url):
+    """YouTubeに最低画質での再生を求めるURLにする（vq=tiny）"""
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    query["vq"] = ["tiny"]
+    return urlunparse(parsed._replace(query=urlencode(query, doseq=True)))
+
+
+class ChromiumLauncher:
+    """Chromium系ブラウザの起動方法"""
+
+    supports_profiles = True
+    supports_devtools = True
+
+    def __init__(self, browser_path, mode="normal", extra_args=()):
+        if mode not in _MODE_FLAGS:
+            raise ValueError(f"不明な起動モードです: {mode}")
+        self.browser_path = browser_path
+        self.mode = mode
+        self.extra_args = list(extra_args)
+
+    def build_cmd(self, play_url, user_data_dir, incognito=False):
+        """再生用のコマンドラインを組み立てる（最後の要素が再生URL）"""
+        # 独立したChromeインスタンスとして起動
+        cmd = [
+            self.browser_path,
+            "--new-window",
+            "--autoplay-policy=no-user-gesture-required",
+        ]
+        # シークレットモードが有効なら追加
+        if incognito:
+            cmd.append("--incognito")
+        # 既存のChromeに処理が引き継がれないよう、常に専用のユーザーデータディレクトリを指定
+        # （起動したプロセスツリーがそのまま再生中のブラウザになる）
+        cmd.append(f"--user-data-dir={user_data_dir}")
+        # 共通のオプションを追加
+        cmd.extend([
+            "--no-first-run",
+            "--no-default-browser-check",
+            "--disable-sync",
+            "--disable-extensions",
+        ])
+        cmd.extend(_MODE_FLAGS[self.mode])
+        cmd.extend(self.extra_args)
+        cmd.append(play_url)
+        return cmd
+
+
+class FirefoxLauncher:
+    """Firefoxの起動方法（専用プロファイルで別インスタンスとして起動する）"""
+
+    supports_profiles = True
+    supports_devtools = False
+
+    def __init__(self, browser_path, mode="normal", extra_args=()):
+        self.browser_path = browser_path
+        self.mode = mode
+        self.extra_args = list(extra_args)
+
+    def build_cmd(self, play_url, user_data_dir, incognito=False):
+        cmd = [self.browser_path, "--no-remote", "--profile", user_data_dir]
+        if incognito:
+            cmd.append("--private-window")
+        if self.mode == "headless":
+            cmd.append("--headless")
+        elif self.mode == "minimal":
+            cmd.extend(["--width", "640", "--height", "360"])
+        cmd.extend(self.extra_args)
+        cmd.append(play_url)
+        return cmd
+
+
+class GenericLauncher:
+    """任意の実行ファイルに、追加の引数とURLを渡して起動する"""
+
+    supports_profiles = False
+    supports_devtools = False
+
+    def __init__(self, browser_path, mode="normal", extra_args=()):
+        self.browser_path = browser_path
+        self.mode = mode
+        self.extra_args = list(extra_args)
+
+    def build_cmd(self, play_url, user_data_dir=None, incognito=False):
+        return [self.browser_path, *self.extra_args, play_url]
+
+
+_LAUNCHERS = {
+    "chromium": ChromiumLauncher,
+    "firefox": FirefoxLauncher,
+    "generic": GenericLauncher,
+}
+
+
+def detect_kind(browser_path):
+    """実行ファイル名からブラウザの種類を推測する"""
+    name = os.path.basename(browser_path or "").lower()
+    if any(n in name for n in _CHROMIUM_NAMES):
+        return "chromium"
+    if "firefox" in name:
+        return "firefox"
+    return "generic"
+
+
+def create_launcher(browser_path, kind="auto", mode="normal", extra_args=()):
+    """種類（auto / chromium / firefox / generic）に応じた起動方法を作る"""
+    if kind == "auto":
+        kind = detect_kind(browser_path)
+    try:
+        launcher_class = _LAUNCHERS[kind]
+    except KeyError:
+        raise ValueError(f"不明なブラウザの種類です: {kind}") from None
+    return launcher_class(browser_path, mode=mode, extra_args=extra_args)
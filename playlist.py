@@ -0,0 +1,165 @@
+"""URLリストの取り込みと動画情報の先読み
+
+URLを1行に1つ書いたテキストファイルのほか、Google TakeoutのYouTube再生リスト
+（CSV）も読める。各行から動画IDを取り出して正規化し、重複を除く。
+動画情報は上限付きのワーカープールで並行して取得し、要求の頻度も制限する。
+"""
+import csv
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from youtube_url import extract_video_id, canonical_url
+
+# 先読みの同時実行数と、1秒あたりの動画情報取得数の上限
+PREFETCH_WORKERS = 16
+PREFETCH_RATE = 50
+
+
+def parse_url_list(lines):
+    """行の並びから動画IDを取り出す
+
+    戻り値は (重複を除いた動画IDのリスト, 集計)。集計は
+    {"total", "duplicates", "invalid"} で、invalid には読めなかった行を入れる。
+    空行と「#」で始まる行は無視する。CSVの各セルも調べるので、
+    Takeoutの「動画 ID」列や、URLを含む任意の列から取り出せる。
+    """
+    video_ids = []
+    seen = set()
+    stats = {"total": 0, "duplicates": 0, "invalid": []}
+    rows = csv.reader(line for line in lines if line.strip() and not line.lstrip().startswith("#"))
+    for number, row in enumerate(rows):
+        video_id = None
+        for cell in row:
+            video_id = extract_video_id(cell.strip())
+            if video_id:
+                break
+        if video_id is None:
+            # CSVの見出し行は読めない行として数えない
+            if number > 0:
+                stats["invalid"].append(",".join(row))
+            continue
+        stats["total"] += 1
+        if video_id in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(video_id)
+        video_ids.append(video_id)
+    return video_ids, stats
+
+
+def load_url_list(path):
+    """ファイルからURLリストを読み込む（parse_url_list と同じ戻り値）"""
+    # Takeoutのファイルは BOM 付きのことがある
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return parse_url_list(f)
+
+
+class RateLimiter:
+    """呼び出しを一定の間隔に均す（複数スレッドから使える）"""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = self.clock()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            self.sleep(slot - now)
+
+
+def prefetch(video_cache, video_ids, workers=PREFETCH_WORKERS, rate=PREFETCH_RATE,
+             on_progress=None, stop_event=None):
+    """動画情報をキャッシュに読み込んでおく
+
+    期限内のキャッシュがある動画はネットワークにアクセスしない。
+    on_progress(done, total) は各動画の処理が終わるたびにワーカースレッドから呼ばれる。
+    戻り値は {"fetched", "cached", "failed"} の件数。
+    """
+    limiter = RateLimiter(rate)
+    counts = {"fetched": 0, "cached": 0, "failed": 0}
+    lock = threading.Lock()
+    total = len(video_ids)
+
+    def fetch(video_id):
+        if stop_event is not None and stop_event.is_set():
+            return
+        url = canonical_url(video_id)
+        cached = video_cache.peek(url)
+        if cached and cached["fresh"]:
+            result = "cached"
+        else:
+            limiter.wait()
+            try:
+                video_cache.get(url)
+                result = "fetched"
+            except Exception as e:
+                print(f"動画情報の先読みに失敗しました ({video_id}): {e}")
+                result = "failed"
+        with lock:
+            counts[result] += 1
+            done = sum(counts.values())
+        if on_progress:
+            on_progress(done, total)
+
+    # インデックスの書き戻しは最後に1回だけにする
+    with video_cache.batch(), ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch") as pool:
+        list(pool.map(fetch, video_ids))
+    return counts
+
+
+class PlayOrder:
+    """リストの再生順（順番どおり、または1周ごとに並べ替えるシャッフル）"""
+
+    def __init__(self, urls, shuffle=False, rng=None):
+        if not urls:
+            raise ValueError("URLがありません")
+        self.urls = list(urls)
+        self.shuffle = shuffle
+        self.rng = rng or random.Random()
+        self._order = []
+        self._position = 0
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.urls)
+
+    @property
+    def position(self):
+        """今の周で再生済みの件数"""
+        with self._lock:
+            return self._position if self._order else 0
+
+    def seek(self, position):
+        """順番どおりの再生を position 件目から続ける（シャッフルでは新しい周から始める）"""
+        if self.shuffle:
+            return
+        with self._lock:
+            self._order = list(self.urls)
+            self._position = position % len(self.urls)
+
+    def next(self):
+        """次に再生するURLを返す"""
+        with self._lock:
+            if self._position >= len(self._order):
+                self._order = list(self.urls)
+                if self.shuffle:
+                    self.rng.shuffle(self._order)
+                    # 周の変わり目で同じ動画が続かないようにする
+                    if len(self._order) > 1 and self._order[0] == self._previous:
+                        self._order[0], self._order[-1] = self._order[-1], self._order[0]
+                self._position = 0
+            url = self._order[self._position]
+            self._position += 1
+            self._previous = url
+            return url
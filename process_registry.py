@@ -0,0 +1,338 @@
+"""アプリが起動したプロセスの登録簿
+
+起動したプロセス（とその子孫）のPIDだけを記録しておき、終了処理では
+それらのプロセスだけを待つ。システム全体のプロセス一覧は走査しない。
+
+- Windows: 起動直後にジョブオブジェクトへ割り当てるので、子孫は生成時点でジョブに入る
+- Linux: 新しいセッションで起動し、/proc/<pid>/task/*/children で自分の子孫だけをたどる
+"""
+import os
+import sys
+import time
+import select
+import signal
+import threading
+import subprocess
+
+# psutil は起動時間を抑えるため、実際に使う時点で読み込む
+
+
+class _ProcessTree:
+    """ルートプロセス1つと、その子孫として記録したプロセス"""
+
+    def __init__(self, pid, popen=None, own_session=False):
+        self.pid = pid
+        self.popen = popen
+        self.own_session = own_session
+        self.job = None
+        self.known = {}
+        import psutil
+        try:
+            # PIDの再利用に備え、生成時刻を保持したProcessオブジェクトを作っておく
+            self.known[pid] = psutil.Process(pid)
+        except psutil.Error:
+            pass
+        if sys.platform == "win32":
+            self._assign_job()
+
+    def _assign_job(self):
+        try:
+            import win32api
+            import win32con
+            import win32job
+            job = win32job.CreateJobObject(None, "")
+            handle = win32api.OpenProcess(
+                win32con.PROCESS_SET_QUOTA | win32con.PROCESS_TERMINATE, False, self.pid)
+            try:
+                win32job.AssignProcessToJobObject(job, handle)
+            finally:
+                win32api.CloseHandle(handle)
+            self.job = job
+        except Exception as e:
+            print(f"ジョブオブジェクトへの割り当てに失敗しました(PID:{self.pid}): {e}")
+
+    def refresh(self):
+        """記録済みプロセスの子孫を取り込み、生きているプロセスの一覧を返す"""
+        import psutil
+        if self.job is not None:
+            import win32job
+            try:
+                pids = win32job.QueryInformationJobObject(self.job, win32job.JobObjectBasicProcessIdList)
+            except Exception:
+                pids = []
+            for pid in pids:
+                self._add(pid)
+        elif sys.platform.startswith("linux"):
+            pending = list(self.known)
+            while pending:
+                for child in _proc_children(pending.pop()):
+                    if child not in self.known and self._add(child):
+                        pending.append(child)
+        else:
+            root = self.known.get(self.pid)
+            if root is not None:
+                try:
+                    for child in root.children(recursive=True):
+                        self.known.setdefault(child.pid, child)
+                except psutil.Error:
+                    pass
+
+        alive = []
+        for pid, proc in list(self.known.items()):
+            if proc.is_running():
+                alive.append(proc)
+            else:
+                del self.known[pid]
+        return alive
+
+    def _add(self, pid):
+        if pid in self.known:
+            return True
+        import psutil
+        try:
+            self.known[pid] = psutil.Process(pid)
+            return True
+        except psutil.Error:
+            return False
+
+    def signal_all(self, procs, force=False):
+        """ツリー全体に終了（force=Trueなら強制終了）を要求する"""
+        import psutil
+        if self.job is not None:
+            import win32job
+            try:
+                win32job.TerminateJobObject(self.job, 1)
+                return
+            except Exception as e:
+                print(f"ジョブオブジェクトの終了に失敗しました: {e}")
+        if self.own_session and hasattr(os, "killpg"):
+            try:
+                os.killpg(self.pid, signal.SIGKILL if force else signal.SIGTERM)
+            except OSError:
+                pass
+        for p in procs:
+            try:
+                p.kill() if force else p.terminate()
+            except psutil.Error:
+                pass
+
+    def close(self):
+        if self.popen is not None:
+            try:
+                # ゾンビを残さないよう回収する
+                self.popen.wait(timeout=0)
+            except subprocess.TimeoutExpired:
+                pass
+        if self.job is not None:
+            import win32api
+            try:
+                win32api.CloseHandle(self.job)
+            except Exception:
+                pass
+            self.job = None
+
+
+def _proc_children(pid):
+    """Linuxで、指定プロセスの直接の子PIDを返す"""
+    children = []
+    task_dir = f"/proc/{pid}/task"
+    try:
+        tids = os.listdir(task_dir)
+    except OSError:
+        return children
+    for tid in tids:
+        try:
+            with open(f"{task_dir}/{tid}/children", "r") as f:
+                children.extend(int(c) for c in f.read().split())
+        except (OSError, ValueError):
+            pass
+    return children
+
+
+# stop_event を見ながら待つときの確認間隔（秒）
+CANCEL_POLL = 0.01
+
+
+def wait_exit(procs, timeout, stop_event=None):
+    """指定プロセスの終了を待ち、(終了したもの, 生きているもの) を返す
+
+    Linuxでは pidfd を poll して終了イベントを直接待つ（他人のゾンビの回収も待たない）。
+    それ以外では psutil.wait_procs に任せる（Windowsではプロセスハンドルを待つ）。
+    stop_event がセットされたら、その時点で待つのをやめる。
+    """
+    if not hasattr(os, "pidfd_open") or not hasattr(select, "poll"):
+        import psutil
+        if stop_event is None:
+            return psutil.wait_procs(procs, timeout=timeout)
+        gone, alive = [], list(procs)
+        deadline = time.monotonic() + timeout
+        while alive and not stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, alive = psutil.wait_procs(alive, timeout=min(remaining, CANCEL_POLL))
+            gone.extend(done)
+        return gone, alive
+
+    gone, fds = [], {}
+    poller = select.poll()
+    try:
+        for p in procs:
+            try:
+                fd = os.pidfd_open(p.pid)
+            except OSError:
+                gone.append(p)
+                continue
+            fds[fd] = p
+            poller.register(fd, select.POLLIN)
+        deadline = time.monotonic() + timeout
+        while fds:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (stop_event is not None and stop_event.is_set()):
+                break
+            if stop_event is not None:
+                remaining = min(remaining, CANCEL_POLL)
+            for fd, _ in poller.poll(remaining * 1000):
+                poller.unregister(fd)
+                os.close(fd)
+                gone.append(fds.pop(fd))
+        return gone, list(fds.values())
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def _peak_rss_linux(pid):
+    if not sys.platform.startswith("linux"):
+        return 0
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+class ProcessRegistry:
+    """アプリが起動したプロセスツリーを管理する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trees = {}
+
+    def spawn(self, cmd, **kwargs):
+        """コマンドを起動し、そのプロセスツリーを登録する"""
+        own_session = False
+        if os.name == "posix" and "start_new_session" not in kwargs:
+            # プロセスグループごとまとめて終了できるようにする
+            kwargs["start_new_session"] = True
+            own_session = True
+        proc = subprocess.Popen(cmd, **kwargs)
+        with self._lock:
+            self._trees[proc.pid] = _ProcessTree(proc.pid, proc, own_session)
+        return proc
+
+    def track(self, pid):
+        """自分で起動していないプロセスを後から登録する"""
+        with self._lock:
+            if pid not in self._trees:
+                self._trees[pid] = _ProcessTree(pid)
+
+    def roots(self):
+        with self._lock:
+            return list(self._trees)
+
+    def pids(self, root_pid=None):
+        """登録済みツリーで生きているPIDの集合を返す"""
+        with self._lock:
+            if root_pid is None:
+                trees = list(self._trees.values())
+            else:
+                trees = [self._trees[root_pid]] if root_pid in self._trees else []
+        result = set()
+        for tree in trees:
+            result.update(p.pid for p in tree.refresh())
+        return result
+
+    def memory(self, root_pid=None):
+        """ツリーの合計RSSと、各プロセスのピークRSSの合計を返す（バイト）
+
+        ピークはLinuxでは VmHWM、Windowsでは peak_wset を使う（取れなければ現在値）。
+        """
+        import psutil
+        with self._lock:
+            if root_pid is None:
+                trees = list(self._trees.values())
+            else:
+                trees = [self._trees[root_pid]] if root_pid in self._trees else []
+        rss = peak = 0
+        for tree in trees:
+            for proc in tree.refresh():
+                try:
+                    info = proc.memory_info()
+                except psutil.Error:
+                    continue
+                rss += info.rss
+                peak += max(info.rss, getattr(info, "peak_wset", 0), _peak_rss_linux(proc.pid))
+        return rss, peak
+
+    def sample(self, root_pid):
+        """ツリーのRSS合計とCPU使用率（1コア=100%）を返す（未登録のツリーならNone）
+
+        CPU使用率は前回の sample 以降の平均なので、初回は0になる。
+        """
+        import psutil
+        with self._lock:
+            tree = self._trees.get(root_pid)
+        if tree is None:
+            return None
+        procs = tree.refresh()
+        rss = cpu = 0.0
+        for proc in procs:
+            try:
+                with proc.oneshot():
+                    rss += proc.memory_info().rss
+                    cpu += proc.cpu_percent(None)
+            except psutil.Error:
+                continue
+        return {"rss": int(rss), "cpu_percent": round(cpu, 1), "procs": len(procs)}
+
+    def __contains__(self, pid):
+        with self._lock:
+            return any(pid in tree.known for tree in self._trees.values())
+
+    def terminate(self, root_pid, timeout=2.0, stop_event=None):
+        """ツリーを終了させ、終了したプロセス数を返す
+
+        対象プロセスの終了を直接待つので、全員が終了した時点ですぐに戻る。
+        穏やかな終了を待っている間に stop_event がセットされたら、待たずに強制終了する。
+        """
+        with self._lock:
+            tree = self._trees.pop(root_pid, None)
+        if tree is None:
+            # 未登録（または終了処理済み）のPIDには触れない（PID再利用で別プロセスを終了させないため）
+            return 0
+        procs = tree.refresh()
+        if not procs:
+            tree.close()
+            return 0
+
+        tree.signal_all(procs)
+        _, alive = wait_exit(procs, timeout, stop_event)
+        if alive:
+            tree.signal_all(alive, force=True)
+            _, alive = wait_exit(alive, 1)
+            if alive:
+                print(f"警告: {len(alive)}個のプロセスが終了しませんでした")
+        tree.close()
+        return len(procs) - len(alive)
+
+    def terminate_all(self, timeout=2.0):
+        """登録済みのすべてのツリーを終了させる"""
+        return sum(self.terminate(pid, timeout) for pid in self.roots())
+
+
+# アプリ全体で共有する登録簿
+PROCESS_REGISTRY = ProcessRegistry()
@@ -0,0 +1,201 @@
+"""ブラウザのプロファイル（ユーザーデータディレクトリ）のプール
+
+空のディレクトリで起動するとChromeは毎回初回起動の初期化を行い、使い終わった
+プロファイルの削除にも時間がかかる。そこで、一度だけ初期化したテンプレートを
+複製したプロファイルをあらかじめ用意しておき、返却されたものは裏で作り直す。
+
+複製は copy_file_range（対応するファイルシステムではコピーオンライト）を使う。
+ハードリンクにはしない（Chromeは Preferences などをその場で書き換えるので、テンプレートまで変わってしまう）。
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# プロファイルを複製するときに除くもの（起動中の印・キャッシュ・DevToolsのポート）
+IGNORE_PATTERNS = ("Singleton*", "DevToolsActivePort", "lockfile",
+                   "Cache", "Code Cache", "GPUCache", "ShaderCache", "GrShaderCache")
+# テンプレートの初期化が終わったとみなすファイル（どちらかがあればよい）
+TEMPLATE_MARKERS = ("Local State", os.path.join("Default", "Preferences"))
+
+
+def _copy_file(src, dst):
+    """copy_file_range でファイルを複製する（使えなければ通常のコピー）"""
+    if not hasattr(os, "copy_file_range"):
+        return shutil.copy2(src, dst)
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        shutil.copystat(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def clone_profile(template_dir, dst):
+    """テンプレートを dst に複製する"""
+    shutil.copytree(template_dir, dst, ignore=shutil.ignore_patterns(*IGNORE_PATTERNS),
+                    copy_function=_copy_file, symlinks=True)
+    return dst
+
+
+def prepare_template(browser_path, template_dir, spawn, terminate, timeout=15):
+    """ブラウザを一度ヘッドレスで起動して初期化済みのプロファイルを作る
+
+    spawn(cmd) はプロセスを返し、terminate(pid) はそのツリーを終了させる。
+    初期化が終わらなければ False を返す（テンプレートは作らない）。
+    """
+    os.makedirs(os.path.dirname(template_dir), exist_ok=True)
+    work = tempfile.mkdtemp(prefix="template_", dir=os.path.dirname(template_dir))
+    proc = spawn([
+        browser_path,
+        "--headless=new",
+        f"--user-data-dir={work}",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--disable-sync",
+        "--disable-extensions",
+        "about:blank",
+    ])
+    try:
+        initialized = _wait_initialized(work, proc, timeout)
+        if initialized:
+            # 初期化の書き込みが落ち着くまで少し待つ
+            time.sleep(1.0)
+    finally:
+        terminate(proc.pid)
+    if not initialized:
+        # ブラウザを終了させてから、書きかけのプロファイルを消す
+        shutil.rmtree(work, ignore_errors=True)
+        return False
+    # 同じテンプレートを同時に作るほかのプロセス（worker.py run）とぶつからないよう、
+    # 複製先はこのプロセス専用の一時ディレクトリの中に作ってから置き換える
+    staging_root = tempfile.mkdtemp(prefix="template_", suffix=".tmp", dir=os.path.dirname(template_dir))
+    staging = os.path.join(staging_root, "profile")
+    try:
+        clone_profile(work, staging)
+        os.replace(staging, template_dir)
+    except OSError as e:
+        if os.path.isdir(template_dir):
+            # ほかのプロセスが先に作った
+            return True
+        print(f"プロファイルのテンプレートを保存できませんでした: {e}")
+        return False
+    finally:
+        shutil.rmtree(staging_root, ignore_errors=True)
+        shutil.rmtree(work, ignore_errors=True)
+    return True
+
+
+def _wait_initialized(work, proc, timeout):
+    """初期化の印ができるまで待つ（時間切れかブラウザが終了したら False）"""
+    deadline = time.monotonic() + timeout
+    while not any(os.path.exists(os.path.join(work, m)) for m in TEMPLATE_MARKERS):
+        if time.monotonic() > deadline or proc.poll() is not None:
+            return False
+        time.sleep(0.1)
+    return True
+
+
+class ProfilePool:
+    """テンプレートから複製したプロファイルを貸し出す
+
+    acquire() で用意済みのディレクトリを受け取り、使い終わったら release() で返す。
+    返されたディレクトリは名前を変えてすぐに手放し、削除と補充は裏のスレッドで行う。
+    テンプレートがなく prepare(template_dir) が渡された場合は、補充の前に裏で作る
+    （それまでに貸し出すのは空のディレクトリ）。
+    """
+
+    def __init__(self, template_dir, size=2, work_dir=None, prepare=None):
+        self.template_dir = template_dir
+        self.prepare = prepare
+        self.size = size
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="youtube_repeater_profiles_")
+        os.makedirs(self.work_dir, exist_ok=True)
+        self._ready = []
+        self._trash = []
+        self._in_use = set()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._maintain, name="profile-pool", daemon=True)
+        self._thread.start()
+
+    def ready_count(self):
+        """すぐに貸し出せるプロファイルの数"""
+        with self._cond:
+            return len(self._ready)
+
+    @property
+    def has_template(self):
+        return os.path.isdir(self.template_dir)
+
+    def acquire(self):
+        """プロファイルのディレクトリを1つ貸し出す（用意が間に合わなければその場で作る）"""
+        with self._cond:
+            path = self._ready.pop() if self._ready else None
+            self._cond.notify()
+        if path is None:
+            path = self._create()
+        with self._cond:
+            self._in_use.add(path)
+        return path
+
+    def release(self, path):
+        """使い終わったプロファイルを返す（削除は裏で行う）"""
+        with self._cond:
+            self._in_use.discard(path)
+            try:
+                trash = f"{path}.trash"
+                os.replace(path, trash)
+            except OSError:
+                trash = path
+            self._trash.append(trash)
+            self._cond.notify()
+
+    def close(self):
+        """補充を止め、貸し出していないプロファイルをすべて削除する"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        # テンプレートの作成中なら待たない（ブラウザはプロセス登録簿の側で終了させる）
+        self._thread.join(timeout=2)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _create(self):
+        path = tempfile.mkdtemp(prefix="profile_", dir=self.work_dir)
+        if self.has_template:
+            try:
+                # mkdtemp で名前だけ確保し、中身はテンプレートから作る
+                os.rmdir(path)
+                clone_profile(self.template_dir, path)
+            except OSError as e:
+                print(f"プロファイルの複製に失敗しました: {e}")
+                os.makedirs(path, exist_ok=True)
+        return path
+
+    def _maintain(self):
+        if self.prepare is not None and not self.has_template:
+            try:
+                if self.prepare(self.template_dir):
+                    print(f"プロファイルのテンプレートを作成しました: {self.template_dir}")
+            except Exception as e:
+                print(f"プロファイルのテンプレートを作成できませんでした: {e}")
+        while True:
+            with self._cond:
+                while not self._closed and not self._trash and len(self._ready) >= self.size:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                trash = self._trash.pop() if self._trash else None
+            if trash is not None:
+                shutil.rmtree(trash, ignore_errors=True)
+                continue
+            path = self._create()
+            with self._cond:
+                self._ready.append(path)
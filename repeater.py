@@ -0,0 +1,835 @@
+"""繰り返し再生の中核処理（GUIに依存しない）
+
+設定の読み書き、ブラウザの起動・終了、1回分の再生処理をまとめている。
+Tkのウィンドウ（app.py）とコマンドライン版（cli.py）の両方から使う。
+Windows専用のモジュールは実際に必要になったときだけ読み込む。
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import telemetry
+import diagnostics
+import http_session
+from http_session import CONNECTIVITY
+from video_cache import VideoInfoCache, OEMBED_URL
+from devtools import WarmBrowser, DevToolsError, wait_for_active_port
+from process_registry import PROCESS_REGISTRY, CANCEL_POLL
+from playlist import PlayOrder
+from profile_pool import ProfilePool, prepare_template
+from watchdog import BrowserWatchdog
+from admission import AdmissionController, AdmissionTimeout
+from launchers import ChromiumLauncher, create_launcher, low_quality_url
+from scheduler import Schedule, RetryLater
+from schedule_store import ScheduleStore
+
+# 設定ファイルパス
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+# 動画情報キャッシュの保存先（設定ファイルと同じ場所）
+CACHE_DIR = os.path.join(os.path.dirname(CONFIG_PATH), 'cache')
+# 初期化済みのブラウザプロファイル（テンプレート）の保存先
+PROFILE_TEMPLATE_DIR = os.path.join(os.path.dirname(CONFIG_PATH), 'profiles', 'template')
+
+# 接続確認に使うURL（設定の probe_url で変更でき、空にすると確認しない）
+PROBE_URL = "https://www.youtube.com"
+
+TIME_UNITS = {"秒": 1, "分": 60, "時間": 3600, "日": 86400}
+# 繰り返し時間の上限（秒）。これより長い間隔はタイマーで待てないこともあるので受け付けない
+MAX_INTERVAL = 365 * 86400
+
+# 接続できないときの再試行間隔（秒）。失敗が続くたびに倍にし、上限で止める
+RETRY_BASE_DELAY = 5
+RETRY_MAX_DELAY = 300
+
+# 停止で待つのをやめられるよう、接続確認や動画情報の取得を実行するスレッド
+# （停止後の要求はそれぞれのタイムアウトまで裏で続くので、少し多めに用意する）
+_IO_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="io")
+
+# 状態の問い合わせに返すため、ジョブごとに残しておく直近の計測レコードの数
+RECENT_RECORDS = 50
+
+
+def default_config():
+    return {
+        "skip_shortcut_prompt": False,
+        "last_url": "",
+        "repeat_time": 10,
+        "time_unit": "分",
+        "repeat_count": 1,
+        "infinite_loop": True,
+        "use_incognito": False,  # シークレットモードのデフォルト設定を追加
+        "warm_browser": False,  # Chromeを使い回してタブだけ再読み込みする
+        "browser_path": "",  # 空ならChromeを自動検出する
+        "probe_url": PROBE_URL,
+        "scheduler_workers": 4,  # スケジュールの処理を実行するワーカー数
+        "cache_ttl": 86400,  # 動画情報キャッシュの有効期間（秒）
+        "cache_max_entries": 1000,
+        "cache_max_mb": 50,
+        "telemetry_log": "telemetry.jsonl",  # 繰り返しごとの計測ログ（空なら記録しない）
+        "telemetry_max_mb": 5,
+        "telemetry_backups": 3,
+        "shuffle_playlist": False,  # URLリストをシャッフルして再生する
+        "prefetch_workers": 16,  # URLリストの動画情報を先読みする同時実行数
+        "prefetch_rate": 50,  # 先読みで1秒あたりに取得する動画数の上限
+        "profile_pool_size": 2,  # 用意しておくブラウザプロファイルの数（0なら毎回空のプロファイル）
+        "watchdog_interval": 30,  # ブラウザのメモリ・CPU使用量を測る間隔（秒、0なら測らない）
+        "max_browser_mb": 0,  # ブラウザのメモリ使用量の上限（MB、超えたら作り直す。0なら無制限）
+        "max_browser_cpu": 0,  # ブラウザのCPU使用率の上限（%、1コア=100）
+        "max_browsers": 0,  # 同時に起動しておくブラウザの上限（0なら無制限）
+        "max_host_cpu": 0,  # この値（%）以上のCPU使用率ではブラウザを起動しない（0なら見ない）
+        "min_free_memory_mb": 0,  # 空きメモリがこれ未満ならブラウザを起動しない（0なら見ない）
+        "launch_stagger": 0.5,  # ブラウザを続けて起動するときの最小間隔（秒）
+        "admission_timeout": 60,  # 起動の順番待ちの上限（秒、過ぎたら後で再試行）
+        "browser_kind": "auto",  # auto / chromium / firefox / generic（autoは実行ファイル名から判断）
+        "browser_args": [],  # ブラウザに追加で渡す引数
+        "launch_mode": "normal",  # normal / minimal（小さなミュートのウィンドウ）/ headless
+        "low_quality": False,  # 最低画質（vq=tiny）での再生を求める
+        "handoff": False,  # 次のブラウザを先に起動しておき、準備ができてから切り替える
+        "handoff_lead": 5,  # 次のブラウザを予定時刻の何秒前に起動するか
+        "handoff_timeout": 15,  # 切り替え用のブラウザの準備完了を待つ上限（秒）
+        "control_port": 0,  # 制御APIの待ち受けポート（0なら起動しない）
+        "control_host": "127.0.0.1",
+        "control_token": "",  # 設定すると制御APIに Authorization: Bearer <token> を求める
+        "schedule_store": "schedules.db",  # スケジュールと再生履歴の保存先（空なら保存せず、再開もしない）
+        "diagnostics": [],  # 起動時から有効にする診断（"profile" / "tracemalloc"、環境変数 YTR_DIAG でも指定できる）
+        "diagnostics_dir": "diagnostics",  # 診断結果の書き出し先
+        "shard_store": "shards.db",  # ワーカー（worker.py）で分担するスケジュールの共有の保存先
+        "lease_ttl": 15,  # 分担のリースの期限（秒）。落ちたワーカーの分はこの時間の後に引き継ぐ
+        "worker_capacity": 0  # 1つのワーカーが同時に担当するスケジュールの上限（0なら無制限）
+    }
+
+
+def load_config(path=CONFIG_PATH, on_error=print):
+    """設定を読み込む（読み込めない場合は on_error に通知して既定値を返す）"""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError as e:
+            on_error(f"設定ファイルの読み込みに失敗しました:\n{e}")
+        except Exception as e:
+            on_error(f"設定ファイルの読み込み中にエラーが発生しました:\n{e}")
+    return default_config()
+
+
+def save_config(config, path=CONFIG_PATH, on_error=print):
+    """設定を保存する（一時ファイルに書いてから置き換えるので、途中で落ちても壊れない）"""
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception as e:
+        on_error(f"設定ファイルの保存に失敗しました:\n{e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def create_video_cache(config, cache_dir=CACHE_DIR):
+    return VideoInfoCache(
+        cache_dir,
+        ttl=config.get("cache_ttl", 86400),
+        max_entries=config.get("cache_max_entries", 1000),
+        max_bytes=int(config.get("cache_max_mb", 50) * 1024 * 1024),
+        oembed_url=config.get("oembed_url") or OEMBED_URL,
+    )
+
+
+def create_telemetry_log(config, path=None):
+    """計測ログを作る（相対パスは設定ファイルと同じ場所が基準）"""
+    if path is not None:
+        config = dict(config, telemetry_log=path)
+    return telemetry.create_telemetry_log(config, os.path.dirname(CONFIG_PATH))
+
+
+def setup_diagnostics(config):
+    """診断機能を準備する（相対パスは設定ファイルと同じ場所が基準）"""
+    return diagnostics.setup_diagnostics(config, os.path.dirname(CONFIG_PATH))
+
+
+def create_schedule_store(config, path=None):
+    """スケジュールの保存先を開く（schedule_store が空なら保存しない。相対パスは設定ファイルと同じ場所が基準）"""
+    if path is None:
+        path = config.get("schedule_store", "schedules.db")
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(CONFIG_PATH), path)
+    try:
+        return ScheduleStore(path)
+    except sqlite3.Error as e:
+        print(f"スケジュールの保存先を開けません: {e}")
+        return None
+
+
+def create_profile_pool(config, browser_path, template_dir=PROFILE_TEMPLATE_DIR):
+    """設定からプロファイルのプールを作る（profile_pool_size が0ならNone）"""
+    size = config.get("profile_pool_size", 2)
+    if not size:
+        return None
+    prepare = None
+    # テンプレートの作成はChromium系のオプションで起動するので、それ以外では空のプロファイルを使う
+    if create_browser_launcher(config, browser_path).supports_devtools:
+        def prepare(path):
+            return prepare_template(browser_path, path, PROCESS_REGISTRY.spawn, PROCESS_REGISTRY.terminate)
+    return ProfilePool(
+        template_dir,
+        size=size,
+        prepare=prepare,
+    )
+
+
+def create_watchdog(config):
+    """設定からブラウザの監視を作って始める（watchdog_interval が0ならNone）"""
+    interval = config.get("watchdog_interval", 30)
+    if not interval:
+        return None
+    return BrowserWatchdog(
+        PROCESS_REGISTRY,
+        interval=interval,
+        max_rss_mb=config.get("max_browser_mb", 0),
+        max_cpu_percent=config.get("max_browser_cpu", 0),
+    ).start()
+
+
+def create_admission(config):
+    """設定からブラウザ起動の受け付け制御を作る"""
+    return AdmissionController(
+        PROCESS_REGISTRY,
+        max_browsers=config.get("max_browsers", 0),
+        max_cpu_percent=config.get("max_host_cpu", 0),
+        min_available_mb=config.get("min_free_memory_mb", 0),
+        stagger=config.get("launch_stagger", 0.5),
+        timeout=config.get("admission_timeout", 60),
+    )
+
+
+def create_browser_launcher(config, browser_path):
+    """設定からブラウザの起動方法を作る"""
+    return create_launcher(
+        browser_path,
+        kind=config.get("browser_kind", "auto"),
+        mode=config.get("launch_mode", "normal"),
+        extra_args=config.get("browser_args", []),
+    )
+
+
+def get_chrome_path():
+    if sys.platform == "win32":
+        import winreg
+        for key in (
+            r"SOFTWARE\\Microsoft\\Windows\\CurrentVersion\\App Paths\\chrome.exe",
+            r"SOFTWARE\\WOW6432Node\\Microsoft\\Windows\\CurrentVersion\\App Paths\\chrome.exe",
+        ):
+            try:
+                with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key) as reg:
+                    return winreg.QueryValue(reg, None)
+            except FileNotFoundError:
+                continue
+        for path in (
+            r"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
+            r"C:\\Program Files (x86)\\Google\\Chrome\\Application\\chrome.exe",
+        ):
+            if os.path.exists(path):
+                return path
+        return None
+    for name in ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser"):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def resolve_browser_path(config):
+    """使用するブラウザのパス（設定 → 環境変数 YTR_BROWSER → 自動検出の順）"""
+    return config.get("browser_path") or os.environ.get("YTR_BROWSER") or get_chrome_path()
+
+
+def parse_interval(value, unit="秒"):
+    """繰り返し時間を秒に変換する（"90"、"30s"、"10m"、"2h"、"1d" 形式にも対応）
+
+    "inf"・"nan" や MAX_INTERVAL を超える値は ValueError にする。
+    """
+    text = str(value).strip().lower()
+    suffixes = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if text and text[-1] in suffixes:
+        seconds = float(text[:-1]) * suffixes[text[-1]]
+    else:
+        seconds = float(text) * TIME_UNITS[unit]
+    if not math.isfinite(seconds) or seconds > MAX_INTERVAL:
+        raise ValueError(f"繰り返し時間が範囲外です: {value}")
+    return seconds
+
+
+def kill_process_tree(pid, stop_event=None):
+    """プロセスとその子プロセスを終了させ、終了させたプロセス数を返す
+
+    stop_event がセットされていれば（またはその間にセットされたら）、穏やかな終了を待たずに強制終了する。
+    """
+    try:
+        if telemetry.active():
+            _note_browser_memory(pid)
+        # 登録簿に記録したプロセスだけを対象に、終了を直接待つ
+        with telemetry.stage("teardown"):
+            killed = PROCESS_REGISTRY.terminate(pid, stop_event=stop_event)
+        telemetry.note("killed", killed)
+        return killed
+    except Exception as e:
+        print(f"プロセス終了エラー: {e}")
+        return 0
+
+
+def _note_browser_memory(pid=None):
+    """終了させる前のブラウザツリーのメモリ使用量を計測レコードに書く"""
+    rss, peak = PROCESS_REGISTRY.memory(pid)
+    telemetry.note("browser_rss_mb", round(rss / 1024 / 1024, 1))
+    telemetry.note("browser_peak_rss_mb", round(peak / 1024 / 1024, 1))
+
+
+def kill_chrome_processes(proc_pid=None):
+    """アプリが起動したChromeのプロセスツリーを終了させる（ユーザーのウィンドウには触れない）
+
+    proc_pid を省略すると、登録簿にあるすべてのツリーが対象になる。
+    """
+    try:
+        print(f"Chrome終了処理開始: 対象PID={proc_pid}")
+        if telemetry.active():
+            _note_browser_memory(proc_pid)
+        with telemetry.stage("teardown"):
+            if proc_pid:
+                killed = PROCESS_REGISTRY.terminate(proc_pid)
+            else:
+                killed = PROCESS_REGISTRY.terminate_all()
+        telemetry.note("killed", killed)
+        print(f"Chrome終了処理が完了しました（{killed}個のプロセスを終了）")
+        return killed
+    except Exception as e:
+        print(f"Chrome終了エラー: {e}")
+        return 0
+
+
+def build_chrome_cmd(browser_path, play_url, user_data_dir, incognito=False, mode="normal"):
+    """再生用Chromeのコマンドラインを組み立てる"""
+    return ChromiumLauncher(browser_path, mode).build_cmd(play_url, user_data_dir, incognito)
+
+
+def retry_delay(retries, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """retries 回連続で失敗した後の再試行までの秒数（指数バックオフ）"""
+    return min(cap, base * 2 ** retries)
+
+
+def submit_io(fn, *args):
+    """fn をI/O用のスレッドで実行し始め、その Future を返す
+
+    fn の中で記録した計測値は別のレコードに貯めておき、wait_cancelable で待ち終えたときに
+    待っている側のレコードへ移す（停止して待つのをやめたレコードが後から書き換わらないように）。
+    """
+    notes = {}
+
+    def call():
+        with telemetry.bound(notes), diagnostics.DIAGNOSTICS.profiled():
+            return fn(*args)
+
+    future = _IO_POOL.submit(call)
+    future.notes = notes
+    return future
+
+
+def wait_cancelable(stop_event, future):
+    """submit_io の結果を待って返す（待っている間に stop_event がセットされたら IterationCancelled）
+
+    停止した場合、実行中の処理は裏で終わるに任せる。
+    """
+    while True:
+        try:
+            future.exception(timeout=CANCEL_POLL)
+            break
+        except FutureTimeout:
+            if stop_event.is_set():
+                future.cancel()
+                raise IterationCancelled() from None
+    for key, value in future.notes.items():
+        telemetry.note(key, value)
+    return future.result()
+
+
+def autoplay_url(url):
+    if 'youtube.com/watch' in url:
+        sep = '&' if '?' in url else '?'
+        return f"{url}{sep}autoplay=1"
+    return url
+
+
+class RunAborted(Exception):
+    """エラーを通知済みで、繰り返しを中止する"""
+
+
+class IterationCancelled(Exception):
+    """停止されたので、この回の残りの段階を行わない"""
+
+
+class Repeater:
+    """1つのURL（またはURLのリスト）を繰り返し再生するジョブ
+
+    url にリストを渡すと、繰り返しのたびに次のURLを再生する（shuffle なら1周ごとに並べ替える）。
+
+    各段階の結果はコールバックで通知する（いずれもワーカースレッドかI/O用のスレッドから呼ばれる）。
+    - on_info(info): 動画情報（{"video_id", "title", "thumbnail_bytes"}）を取得したとき
+      （取得はブラウザの起動と並行して行うので、起動の前後どちらで呼ばれるかは決まっていない）
+    - on_error(title, message): 利用者に知らせるべきエラーが起きたとき
+    - on_finish(reason): 後片付けが終わったとき
+
+    launcher はブラウザの起動方法（省略時は browser_path から推測する）。
+    low_quality なら再生URLに最低画質の指定を加える。
+    handoff なら2回目以降は予定時刻の handoff_lead 秒前に次のブラウザを別のプロファイルで起動し、
+    準備ができた時点で切り替えて、前のブラウザは別スレッドで終了させる（再生の途切れをなくす）。
+    admission を渡すと、ブラウザを起動する前にその受け付け制御で順番を待つ。
+    watchdog を渡すと起動したブラウザを監視させ、上限を超えたら次の繰り返しを待たずに
+    作り直して同じURLを再生し直す。
+
+    繰り返しごとに各段階の所要時間などを計測し、直近の分を recent に残す（status で集計する）。
+    telemetry を渡すと、そのレコードを1件ずつ書き出す。
+    終了処理（teardown）は次の繰り返しの起動直前か、スケジュール終了時に行うので、
+    そのレコードに含まれる teardown_ms と killed は直前のブラウザに対するもの。
+    """
+
+    def __init__(self, url, browser_path, video_cache=None, incognito=False, warm=False,
+                 probe_url=PROBE_URL, on_info=None, on_error=None, on_finish=None,
+                 telemetry_log=None, shuffle=False, profile_pool=None, watchdog=None,
+                 admission=None, launcher=None, low_quality=False, handoff=False,
+                 handoff_lead=5.0, handoff_timeout=15.0):
+        self.order = PlayOrder([url] if isinstance(url, str) else url, shuffle)
+        self.url = self.order.urls[0]  # 再生中（直前に再生した）URL
+        self.browser_path = browser_path
+        self.launcher = launcher or create_launcher(browser_path)
+        self.low_quality = low_quality
+        self.video_cache = video_cache
+        self.incognito = incognito
+        self.probe_url = probe_url
+        self.on_info = on_info
+        self.on_error = on_error or (lambda title, message: print(f"{title}: {message}"))
+        self.on_finish = on_finish
+        self.telemetry_log = telemetry_log
+        # Chromeのユーザーデータ用ディレクトリ（プールがあれば初期化済みのものを借りる）
+        self.profile_pool = profile_pool if self.launcher.supports_profiles else None
+        self.temp_dir = self._acquire_profile()
+        # タブの再ナビゲートにはDevToolsが必要なので、対応していないブラウザでは毎回起動する
+        if warm and self.launcher.supports_devtools:
+            self.warm_browser = WarmBrowser(self.temp_dir, spawn=PROCESS_REGISTRY.spawn)
+        else:
+            self.warm_browser = None
+        self.chrome_proc = None
+        self.watchdog = watchdog
+        self.admission = admission
+        # タブを開き直すウォームブラウザには途切れがないので、切り替えは使わない
+        self.handoff = handoff and self.warm_browser is None
+        self.handoff_lead = handoff_lead
+        self.handoff_timeout = handoff_timeout
+        self._retiring = []  # 切り替え前のブラウザを終了させているスレッド
+        self.recent = deque(maxlen=RECENT_RECORDS)
+        self.schedule_id = None
+        # ブラウザの起動・終了は、繰り返しの処理と監視による作り直しの間で排他にする
+        self._browser_lock = threading.Lock()
+
+    def schedule(self, interval, count=None):
+        """このジョブを駆動するスケジュールを作る"""
+        schedule = Schedule(self.run_iteration, interval, count, on_finish=self.finish, name=self.url,
+                            lead=self.handoff_lead if self.handoff else 0.0, job=self)
+        self.schedule_id = schedule.id
+        return schedule
+
+    def run_iteration(self, schedule):
+        """1回分の再生（Chromeの起動と、並行した接続確認・動画情報の取得）"""
+        # 再試行のときは同じURLをやり直す
+        if schedule.retries == 0:
+            self.url = self.order.next()
+        telemetry.begin(
+            event="iteration",
+            schedule_id=schedule.id,
+            iteration=schedule.iteration + 1,
+            url=self.url,
+            # 予定時刻（前倒しした場合はその時刻）から実際に処理が始まるまでの遅れ
+            drift_ms=round((time.monotonic() - schedule.last_fire + schedule.early) * 1000, 3),
+        )
+        status = "error"
+        try:
+            with diagnostics.DIAGNOSTICS.profiled():
+                self._run_iteration(schedule)
+            status = "cancelled" if schedule.cancelled else "ok"
+        except RetryLater as e:
+            status = f"retry:{e.reason}"
+            raise
+        except RunAborted as e:
+            status = f"aborted:{e}"
+            raise
+        finally:
+            record = telemetry.end()
+            record["status"] = status
+            self.recent.append(record)
+            if self.telemetry_log is not None:
+                self.telemetry_log.write(record)
+
+    def status(self):
+        """再生中のURL・ブラウザのPID・直近の所要時間の集計を返す（どのスレッドからでも呼べる）"""
+        proc = self.chrome_proc
+        pids = sorted(PROCESS_REGISTRY.pids(proc.pid)) if proc is not None else []
+        return {
+            "url": self.url,
+            "browser_pid": proc.pid if proc is not None else None,
+            "browser_pids": pids,
+            "recent": telemetry.summarize(list(self.recent)),
+        }
+
+    def checkpoint(self, schedule):
+        """再開に必要な値（URL・シャッフル・再生位置）と直前の回の計測レコードを返す"""
+        position = self.order.position
+        if schedule.retries:
+            # やり直し待ちの回は、再開したときにもう一度同じURLから始める
+            position -= 1
+        return {
+            "urls": self.order.urls,
+            "shuffle": self.order.shuffle,
+            "position": max(0, position),
+            "record": self.recent[-1] if self.recent else None,
+        }
+
+    def seek(self, position):
+        """保存した再生位置から続ける"""
+        self.order.seek(position)
+
+    def _run_iteration(self, schedule):
+        """1回分の段階（起動、起動と並行して接続確認と動画情報の取得）を行う
+
+        接続確認と動画情報の取得はI/O用のスレッドで始めておき、起動を待たせない（YouTubeの
+        応答が遅くても、つながらなくても再生の開始は遅れない）。起動の後で接続確認の結果を
+        確かめ、つながっていなければこの回を後でやり直す。動画情報の取得の完了を待つのは、
+        所要時間を同じレコードに残すためだけ。各段階は所要時間を計測し、停止されたらその段階の
+        途中でも待つのをやめて戻る（前のブラウザの終了も、停止されたら穏やかな終了を待たずに強制終了する）。
+        """
+        started = time.perf_counter()
+        probing = self._start_probe(schedule)
+        fetching = self._start_fetch(schedule)
+        # 発火処理の開始から起動に取りかかるまで（ネットワークの遅さには左右されない）
+        telemetry.note("launch_delay_ms", round((time.perf_counter() - started) * 1000, 3))
+        self._launch(schedule)
+        if schedule.cancelled:
+            return
+        try:
+            if probing is not None:
+                self._check_probe(schedule, probing)
+            if fetching is not None:
+                wait_cancelable(schedule.stop_event, fetching)
+        except IterationCancelled:
+            pass
+
+    def _start_probe(self, schedule):
+        """接続確認をI/O用のスレッドで始める（確認しない・前の回から通信が成功していれば None）"""
+        if not self.probe_url:
+            return None
+        if CONNECTIVITY.recently_online(schedule.interval):
+            telemetry.note("probe", "skipped")
+            return None
+        return submit_io(self._probe)
+
+    def _probe(self):
+        with telemetry.stage("probe"):
+            http_session.head(self.probe_url, timeout=5)
+
+    def _check_probe(self, schedule, probing):
+        """接続確認の結果を待ち、つながらなければこの回を後でやり直す"""
+        import requests
+        try:
+            wait_cancelable(schedule.stop_event, probing)
+        except requests.RequestException:
+            delay = retry_delay(schedule.retries)
+            if schedule.retries == 0:
+                # 再試行のたびにダイアログを出さないよう、最初の1回だけ知らせる
+                self.on_error("ネットワークエラー",
+                    "YouTubeサーバーに接続できません。ネットワーク接続を確認してください。\n"
+                    "接続できるまで間隔を空けて再試行します。")
+            raise RetryLater(delay, "network")
+
+    def _start_fetch(self, schedule):
+        """動画情報の取得をI/O用のスレッドで始める（キャッシュがなければ None）"""
+        if self.video_cache is None:
+            return None
+        return submit_io(self._fetch, schedule, self.url)
+
+    def _fetch(self, schedule, url):
+        # I/O用のスレッドで動く。停止された後は画面を更新しない
+        if schedule.cancelled:
+            return None
+        try:
+            with telemetry.stage("fetch"):
+                info = self.video_cache.get(url)
+        except Exception as e:
+            print(f"Error fetching video info: {e}")
+            if schedule.cancelled:
+                return None
+            self.on_error("エラー", f"動画情報の取得に失敗しました:\n{e}")
+            info = {"video_id": None, "title": "-", "thumbnail_bytes": None}
+        if schedule.cancelled:
+            return None
+        if self.on_info:
+            self.on_info(info)
+        # 毎回の表示はせず、計測レコードに残す
+        telemetry.note("cache_hit_ratio", round(self.video_cache.hit_ratio(), 3))
+        return info
+
+    def _launch(self, schedule):
+        play_url = self.play_url()
+        cmd = self.launcher.build_cmd(play_url, self.temp_dir, self.incognito)
+        try:
+            with telemetry.stage("launch"), self._browser_lock:
+                mode = None
+                if self.handoff and self.chrome_proc is not None and self.chrome_proc.poll() is None:
+                    mode = self.hand_off(play_url, schedule)
+                if mode is None:
+                    # 前倒しで発火していれば、前のブラウザを予定時刻まで再生させておく
+                    if schedule.stop_event.wait(max(0.0, schedule.last_fire - time.monotonic())):
+                        return
+                    mode = self.launch(cmd, play_url, schedule.stop_event)
+            telemetry.note("mode", mode)
+            if mode == "cancelled":
+                return
+            if schedule.iteration > 0:
+                # 前回の再生終了（今回の発火予定時刻）から再生要求の完了まで
+                # （切り替えでは、予定時刻より前に次のブラウザの準備ができていれば0）
+                gap = max(0.0, time.monotonic() - schedule.last_fire)
+                telemetry.note("gap_ms", round(gap * 1000, 3))
+        except AdmissionTimeout as e:
+            # マシンの余裕ができるまで、この回を後でやり直す
+            print(e)
+            raise RetryLater(retry_delay(schedule.retries), "admission")
+        except FileNotFoundError:
+            self.on_error("ブラウザエラー", "Chromeが見つかりません。パスが正しいか確認してください。")
+            raise RunAborted("browser")
+        except PermissionError:
+            self.on_error("権限エラー", "Chromeを起動する権限がありません。")
+            raise RunAborted("permission")
+        except Exception as e:
+            self.on_error("実行エラー", f"Chrome起動に失敗しました:\n{e}")
+            raise RunAborted("launch")
+
+    def play_url(self):
+        """ブラウザに渡す再生URL"""
+        url = autoplay_url(self.url)
+        return low_quality_url(url) if self.low_quality else url
+
+    def launch(self, cmd, play_url, stop_event=None):
+        """Chromeで再生を始め、使った方式（"warm" / "cold"）を返す
+
+        起動の順番待ちの間に stop_event がセットされたら、起動せずに "cancelled" を返す。
+        """
+        if self.warm_browser and self.warm_browser.is_alive():
+            # 起動済みのChromeでタブだけを開き直す
+            try:
+                self.warm_browser.play(play_url)
+                return "warm"
+            except DevToolsError as e:
+                print(f"ブラウザの再利用に失敗したため再起動します: {e}")
+
+        # 前回のプロセスが残っていれば終了（プロセスがすべて終了した時点で戻る）
+        if self.chrome_proc:
+            kill_process_tree(self.chrome_proc.pid, stop_event)
+            self.chrome_proc = None
+            if stop_event is not None and stop_event.is_set():
+                return "cancelled"
+
+        with self._admitted(stop_event) as admitted:
+            if not admitted:
+                return "cancelled"
+            if self.warm_browser:
+                try:
+                    self.chrome_proc = self.warm_browser.launch(cmd, stop_event)
+                except DevToolsError as e:
+                    # 再生自体は続け、次回は従来どおり再起動する
+                    print(f"DevToolsに接続できませんでした: {e}")
+                    self.chrome_proc = self.warm_browser.detach()
+                if stop_event is not None and stop_event.is_set():
+                    # 起動したプロセスはスケジュールの終了処理で片付ける
+                    return "cancelled"
+            else:
+                with telemetry.stage("spawn"):
+                    self.chrome_proc = PROCESS_REGISTRY.spawn(cmd)
+        if self.watchdog is not None and self.chrome_proc is not None:
+            self.watchdog.watch(self.chrome_proc.pid, on_sample=self.on_sample, on_exceed=self.recycle)
+        return "cold"
+
+    def hand_off(self, play_url, schedule):
+        """次のブラウザを別のプロファイルで起動し、準備ができたら切り替えて "handoff" を返す
+
+        前のブラウザは切り替えた後に別スレッドで終了させる。起動の順番待ちが時間切れになるか、
+        準備完了の知らせがないときは None を返す（呼び出し側で従来どおり終了・起動する）。
+        """
+        user_data_dir = self._acquire_profile()
+        cmd = self.launcher.build_cmd(play_url, user_data_dir, self.incognito)
+        if self.launcher.supports_devtools:
+            # 準備完了は DevToolsActivePort の書き出しで知る
+            cmd = cmd[:-1] + ["--remote-debugging-port=0", cmd[-1]]
+        proc = None
+        switched = False
+        try:
+            with self._admitted(schedule.stop_event) as admitted:
+                if not admitted:
+                    return "cancelled"
+                with telemetry.stage("spawn"):
+                    proc = PROCESS_REGISTRY.spawn(cmd)
+            with telemetry.stage("ready"):
+                if self.launcher.supports_devtools:
+                    port = wait_for_active_port(user_data_dir, proc, self.handoff_timeout, schedule.stop_event)
+                else:
+                    # 準備完了を知る手段がないので、予定時刻まで前のブラウザと並べておく
+                    schedule.stop_event.wait(max(0.0, schedule.last_fire - time.monotonic()))
+                    port = 0
+            if port is None or schedule.cancelled:
+                return "cancelled"
+
+            previous, previous_dir = self.chrome_proc, self.temp_dir
+            self.chrome_proc, self.temp_dir = proc, user_data_dir
+            switched = True
+            if self.watchdog is not None:
+                self.watchdog.unwatch(previous.pid)
+                self.watchdog.watch(proc.pid, on_sample=self.on_sample, on_exceed=self.recycle)
+            self._retiring = [t for t in self._retiring if t.is_alive()]
+            thread = threading.Thread(target=self._retire, args=(previous, previous_dir, schedule.stop_event),
+                                      name="retire-browser", daemon=True)
+            self._retiring.append(thread)
+            thread.start()
+            return "handoff"
+        except (AdmissionTimeout, DevToolsError) as e:
+            print(f"切り替え用のブラウザを用意できなかったため、従来どおり起動し直します: {e}")
+            return None
+        finally:
+            if not switched:
+                if proc is not None:
+                    PROCESS_REGISTRY.terminate(proc.pid)
+                self._release_profile(user_data_dir)
+
+    @contextmanager
+    def _admitted(self, stop_event=None):
+        """起動の順番を待ち、通ったかどうかを渡す（停止されたら False）
+
+        ブロックの中でブラウザを起動させ、抜けるまで（登録簿に載るか、起動しなかったと決まるまで）
+        受け付け制御の枠を確保しておく。
+        """
+        if self.admission is None:
+            yield True
+            return
+        with telemetry.stage("admission"):
+            waited = self.admission.acquire(stop_event)
+        if waited is None:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self.admission.release()
+
+    def _retire(self, proc, user_data_dir, stop_event=None):
+        """切り替え前のブラウザを終了し、そのプロファイルを片付ける（別スレッド）"""
+        if self.telemetry_log is not None:
+            telemetry.begin(event="retire", schedule_id=self.schedule_id, url=self.url)
+        try:
+            kill_process_tree(proc.pid, stop_event)
+            self._release_profile(user_data_dir)
+        finally:
+            if self.telemetry_log is not None:
+                self.telemetry_log.write(telemetry.end())
+
+    def _acquire_profile(self):
+        """ブラウザのユーザーデータ用ディレクトリを用意する（プールがあれば借りる）"""
+        if self.profile_pool is not None:
+            return self.profile_pool.acquire()
+        return tempfile.mkdtemp(prefix="youtube_repeater_")
+
+    def _release_profile(self, user_data_dir):
+        """ユーザーデータ用ディレクトリをプールに返すか削除する"""
+        if self.profile_pool is not None:
+            self.profile_pool.release(user_data_dir)
+        elif os.path.exists(user_data_dir):
+            shutil.rmtree(user_data_dir, ignore_errors=True)
+
+    def on_sample(self, sample):
+        """監視で測ったブラウザの使用量を計測ログに書く（監視スレッド）"""
+        if self.telemetry_log is None:
+            return
+        telemetry.begin(
+            event="sample",
+            schedule_id=self.schedule_id,
+            url=self.url,
+            rss_mb=round(sample["rss"] / 1024 / 1024, 1),
+            cpu_percent=sample["cpu_percent"],
+            procs=sample["procs"],
+        )
+        self.telemetry_log.write(telemetry.end())
+
+    def recycle(self, root_pid, sample, reason):
+        """上限を超えたブラウザを終了し、同じURLで起動し直す（監視スレッド）"""
+        with self._browser_lock:
+            if self.chrome_proc is None or self.chrome_proc.pid != root_pid:
+                # すでに次の繰り返しで入れ替わっているか、終了済み
+                return
+            print(f"ブラウザの使用量が上限を超えたため作り直します（{reason}: "
+                  f"{sample['rss'] / 1024 / 1024:.0f}MB, CPU {sample['cpu_percent']}%）")
+            if self.telemetry_log is not None:
+                telemetry.begin(event="recycle", schedule_id=self.schedule_id, url=self.url, status=reason)
+            try:
+                kill_process_tree(root_pid)
+                self.chrome_proc = None
+                if self.warm_browser:
+                    self.warm_browser.detach()
+                play_url = self.play_url()
+                self.launch(self.launcher.build_cmd(play_url, self.temp_dir, self.incognito), play_url)
+            except Exception as e:
+                print(f"ブラウザの作り直しに失敗しました: {e}")
+            finally:
+                if self.telemetry_log is not None:
+                    self.telemetry_log.write(telemetry.end())
+
+    def finish(self, schedule, reason):
+        """スケジュール終了時の後片付け"""
+        if self.telemetry_log is not None:
+            telemetry.begin(event="finish", schedule_id=schedule.id, iteration=schedule.iteration,
+                            url=self.url, status=reason)
+            try:
+                self.close(schedule.stop_event)
+            finally:
+                self.telemetry_log.write(telemetry.end())
+        else:
+            self.close(schedule.stop_event)
+        error = schedule.error
+        if reason == "error" and not isinstance(error, RunAborted):
+            self.on_error("予期せぬエラー", f"実行中に予期せぬエラーが発生しました:\n{error}")
+        if self.on_finish:
+            self.on_finish(reason)
+
+    def close(self, stop_event=None):
+        """Chromeを終了し、ユーザーデータ用ディレクトリを片付ける（プールに返すか削除する）
+
+        停止されたスケジュールの stop_event を渡すと、穏やかな終了を待たずに強制終了する。
+        """
+        with self._browser_lock:
+            if self.chrome_proc:
+                kill_process_tree(self.chrome_proc.pid, stop_event)
+                self.chrome_proc = None
+            if self.temp_dir:
+                self._release_profile(self.temp_dir)
+            self.temp_dir = None
+            # 切り替え前のブラウザの終了処理が残っていれば、終わるまで待つ
+            for thread in self._retiring:
+                thread.join()
+            self._retiring = []
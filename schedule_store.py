@@ -0,0 +1,270 @@
+"""スケジュールと再生履歴の保存先（SQLite、WALモード）
+
+スケジューラの状態通知を受けるたびに、スケジュールの回数・再生位置・次回発火時刻を
+書き込んでおく。アプリが落ちても、次の起動時に途中だったスケジュールを最後の
+チェックポイントから再開できる（正常に停止したものは終了済みとして残る）。
+
+書き込みは専用のスレッドがまとめて1つのトランザクションで行うので、状態通知
+（スケジューラのロック内）では値を写してキューに積むだけになる。
+次回発火時刻は再起動をまたげるよう、単調時計ではなく time.time() 基準で保存する。
+IDは書き込みのトランザクションの中でSQLiteが決めるので、1つのファイルを複数のプロセスで共有してもぶつからない。
+"""
+import json
+import time
+import queue
+import sqlite3
+import threading
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    id INTEGER PRIMARY KEY,
+    urls TEXT NOT NULL,
+    shuffle INTEGER NOT NULL DEFAULT 0,
+    interval REAL NOT NULL,
+    count INTEGER,
+    iteration INTEGER NOT NULL DEFAULT 0,
+    position INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    next_fire REAL,
+    remaining REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS schedules_next_fire ON schedules(next_fire) WHERE state != 'finished';
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    schedule_id INTEGER NOT NULL,
+    iteration INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    status TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_schedule ON runs(schedule_id, id);
+"""
+
+# 再開の対象になる（終了していない）状態
+_ACTIVE = ("waiting", "running", "paused")
+
+
+class ScheduleStore:
+    """スケジュールのチェックポイントと再生履歴を保存する
+
+    Scheduler の listener として on_state を登録して使う。保存するのは job に
+    checkpoint() があるスケジュール（Repeater）だけ。再生履歴は max_runs 件を超えた古いものから消す。
+    """
+
+    def __init__(self, path, max_runs=100000):
+        self.path = path
+        self.max_runs = max_runs
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WALなら NORMAL でもアプリの異常終了では失われない（失われうるのは電源断の直前の分だけ）
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writes = 0
+        self._inserting = set()  # 追加を積んだが、まだIDが決まっていないスケジュールの Schedule.id
+        self._recorded = {}  # Schedule.id -> 履歴に書いた最後の計測レコード
+        self._thread = threading.Thread(target=self._run, name="schedule-store", daemon=True)
+        self._thread.start()
+
+    # ---- スケジューラからの通知（ロック内なので写してキューに積むだけ） ----
+
+    def on_state(self, schedule, state):
+        checkpoint = getattr(schedule.job, "checkpoint", None)
+        if checkpoint is None:
+            return
+        now = time.time()
+        # IDは書き込みのスレッドが行を追加したときに決まる（それまでの更新は Schedule を通して同じ行に書く）
+        if schedule.store_id is None and schedule.id not in self._inserting:
+            if state == "finished":
+                return
+            self._inserting.add(schedule.id)
+            spec = checkpoint(schedule)
+            self._queue.put(("insert", (
+                schedule, json.dumps(spec["urls"], ensure_ascii=False), int(spec["shuffle"]),
+                schedule.interval, schedule.count, now)))
+        else:
+            spec = checkpoint(schedule)
+
+        next_fire = remaining = None
+        if state == "waiting" and schedule.next_fire is not None:
+            next_fire = now + schedule.remaining()
+        elif state == "paused":
+            remaining = schedule.paused_remaining
+        self._queue.put(("update", (
+            schedule, schedule.iteration, spec["position"], state, next_fire, remaining, now)))
+
+        # 発火を終えたら、その回の計測レコードを履歴に残す
+        record = spec.get("record")
+        if record is not None and record is not self._recorded.get(schedule.id):
+            self._recorded[schedule.id] = record
+            self._queue.put(("run", (
+                schedule, record.get("iteration", schedule.iteration), record.get("ts", now),
+                record.get("status"), json.dumps(record, ensure_ascii=False))))
+        if state == "finished":
+            self._recorded.pop(schedule.id, None)
+
+    # ---- 読み出し ----
+
+    def active(self):
+        """再開の対象になるスケジュールを次回発火時刻の早い順に返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, urls, shuffle, interval, count, iteration, position, state, next_fire, remaining"
+                " FROM schedules WHERE state IN (?, ?, ?) ORDER BY next_fire",
+                _ACTIVE).fetchall()
+        return [_row(r) for r in rows]
+
+    def runs(self, schedule_id, limit=100):
+        """スケジュールの再生履歴を新しい順に返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT iteration, ts, status, data FROM runs WHERE schedule_id = ? ORDER BY id DESC LIMIT ?",
+                (schedule_id, limit)).fetchall()
+        return [{"iteration": i, "ts": ts, "status": s, "record": json.loads(d) if d else None}
+                for i, ts, s, d in rows]
+
+    # ---- 再開 ----
+
+    def restore(self, scheduler, create_job):
+        """途中だったスケジュールを作り直してスケジューラに登録し、そのスケジュールの一覧を返す
+
+        create_job(target, shuffle) は制御APIと同じジョブの作り方で、保存済みのURLは
+        検証済みなのでそのまま渡す（動画情報も再生する回になるまで取得しない）。
+        """
+        restored = []
+        now = time.time()
+        for row in self.active():
+            urls = row["urls"]
+            try:
+                job = create_job(urls if len(urls) > 1 else urls[0], row["shuffle"])
+            except (ValueError, OSError) as e:
+                print(f"保存済みのスケジュール{row['id']}を再開できません: {e}")
+                self.discard(row["id"])
+                continue
+            job.seek(row["position"])
+            schedule = job.schedule(row["interval"], row["count"])
+            schedule.iteration = row["iteration"]
+            schedule.store_id = row["id"]
+            if row["state"] == "paused":
+                delay = row["remaining"] or 0.0
+            else:
+                # 停止中に過ぎた予定時刻はすぐに発火させる（まとめて取り戻しはしない）
+                delay = max(0.0, (row["next_fire"] or now) - now)
+            scheduler.add(schedule, delay, paused=row["state"] == "paused")
+            restored.append(schedule)
+        return restored
+
+    def discard(self, store_id=None):
+        """保存済みのスケジュール（省略時は途中のものすべて）を終了済みにする"""
+        now = time.time()
+        if store_id is None:
+            self._queue.put(("sql", ("UPDATE schedules SET state = 'finished', updated = ?"
+                                     " WHERE state IN (?, ?, ?)", (now, *_ACTIVE))))
+        else:
+            self._queue.put(("sql", ("UPDATE schedules SET state = 'finished', updated = ? WHERE id = ?",
+                                     (now, store_id))))
+        self.flush()
+
+    # ---- 書き込み ----
+
+    def flush(self):
+        """積まれている書き込みが終わるまで待つ"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        with self._lock:
+            self._conn.close()
+
+    def _run(self):
+        while True:
+            ops = [self._queue.get()]
+            # 積まれている分はまとめて1つのトランザクションで書く
+            while True:
+                try:
+                    ops.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in ops
+            try:
+                self._write([op for op in ops if op is not None])
+            except sqlite3.Error as e:
+                print(f"スケジュールの保存に失敗しました: {e}")
+            finally:
+                for _ in ops:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, ops):
+        if not ops:
+            return
+        runs = 0
+        inserted = {}  # Schedule -> このトランザクションで決まったID
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                for kind, args in ops:
+                    if kind == "sql":
+                        conn.execute(*args)
+                        continue
+                    schedule, *values = args
+                    if kind == "insert":
+                        cursor = conn.execute(
+                            "INSERT INTO schedules (urls, shuffle, interval, count, state, created, updated)"
+                            " VALUES (?, ?, ?, ?, 'waiting', ?, ?)", (*values, values[-1]))
+                        inserted[schedule] = cursor.lastrowid
+                        continue
+                    store_id = inserted.get(schedule, schedule.store_id)
+                    if store_id is None:
+                        # 追加が書けなかった（次の状態通知で追加し直す）
+                        continue
+                    if kind == "update":
+                        conn.execute(
+                            "UPDATE schedules SET iteration = ?, position = ?, state = ?, next_fire = ?,"
+                            " remaining = ?, updated = ? WHERE id = ?", (*values, store_id))
+                    elif kind == "run":
+                        conn.execute(
+                            "INSERT INTO runs (schedule_id, iteration, ts, status, data) VALUES (?, ?, ?, ?, ?)",
+                            (store_id, *values))
+                        runs += 1
+                self._writes += runs
+                if self.max_runs and self._writes >= 1000:
+                    # 履歴の上限は時々まとめて適用する
+                    self._writes = 0
+                    conn.execute("DELETE FROM runs WHERE id <= (SELECT MAX(id) FROM runs) - ?", (self.max_runs,))
+                conn.execute("COMMIT")
+                for schedule, store_id in inserted.items():
+                    schedule.store_id = store_id
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                # 書けたものはIDが付き、書けなかったものは次の状態通知で追加し直す
+                for kind, args in ops:
+                    if kind == "insert":
+                        self._inserting.discard(args[0].id)
+
+
+def _row(row):
+    (store_id, urls, shuffle, interval, count, iteration, position, state, next_fire, remaining) = row
+    return {
+        "id": store_id,
+        "urls": json.loads(urls),
+        "shuffle": bool(shuffle),
+        "interval": interval,
+        "count": count,
+        "iteration": iteration,
+        "position": position,
+        "state": state,
+        "next_fire": next_fire,
+        "remaining": remaining,
+    }
@@ -0,0 +1,286 @@
+"""複数の繰り返しスケジュールを1つのタイマーヒープで駆動するスケジューラ
+
+各スケジュールの次回発火時刻（単調時計）を優先度付きキューで管理し、
+スケジューラのスレッドは最も早い発火時刻まで眠るだけなので、登録数に関係なく
+待機中のCPU使用はほぼゼロになる。発火した処理は上限付きのワーカープールで実行する。
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_schedule_ids = itertools.count(1)
+
+
+class RetryLater(Exception):
+    """action が送出すると、回数を進めずに delay 秒後にもう一度発火させる"""
+
+    def __init__(self, delay, reason=""):
+        super().__init__(reason or f"retry in {delay:g}s")
+        self.delay = delay
+        self.reason = reason
+
+
+class Schedule:
+    """1つの繰り返し設定（URL・間隔・回数）とその進行状況
+
+    action(schedule) は発火ごとにワーカースレッドで呼ばれる。
+    count 回の発火が終わると、さらに interval 後に on_finish(schedule, "completed") が呼ばれる。
+    停止時は "cancelled"、action が例外を送出した場合は "error" になる。
+    ただし RetryLater の場合は終了せず、指定の時間後に同じ回をやり直す。
+
+    pause で一時停止すると、残り時間を保ったまま発火しなくなり、resume で再開する。
+
+    lead を指定すると、2回目以降の発火を予定時刻より lead 秒早める（次の再生の準備を
+    前倒しするため）。last_fire / next_fire は早める前の予定時刻のまま。
+    """
+
+    def __init__(self, action, interval, count=None, on_finish=None, name=None, lead=0.0, job=None):
+        self.id = next(_schedule_ids)
+        self.name = name
+        self.job = job  # このスケジュールで動かしている処理（Repeaterなど、状態の表示に使う）
+        self.store_id = None  # 保存先（ScheduleStore）でのID
+        self.action = action
+        self.on_finish = on_finish
+        self.interval = interval
+        self.count = count
+        self.lead = min(lead, interval)
+        self.iteration = 0
+        self.retries = 0  # 連続して RetryLater になった回数
+        self.next_fire = None  # 次回発火時刻（time.monotonic基準）
+        self.last_fire = None  # 直前の発火予定時刻
+        self.early = 0.0  # 直前の発火を予定時刻より早めた秒数
+        self.state = "pending"  # pending / waiting / running / paused / finished
+        self.paused = False
+        self.paused_remaining = None  # 一時停止した時点での次回発火までの残り秒数
+        self.error = None
+        self.stop_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.stop_event.is_set()
+
+    def remaining(self, now=None):
+        """次回発火までの残り秒数"""
+        if self.next_fire is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.next_fire - now)
+
+
+class Scheduler:
+    """スケジュールの発火時刻をヒープで管理し、ワーカープールへ振り分ける"""
+
+    def __init__(self, max_workers=4, clock=time.monotonic, listener=None):
+        self.clock = clock
+        # listener(schedule, state) は状態が変わるたびに呼ばれる（ロック内なので軽い処理に限る）
+        self._listeners = [listener] if listener else []
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._schedules = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="repeater")
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+                self._thread.start()
+        return self
+
+    def add_listener(self, listener):
+        """状態の通知を受ける関数を追加する"""
+        with self._cond:
+            self._listeners.append(listener)
+
+    def add(self, schedule, delay=0.0, paused=False):
+        """スケジュールを登録する（delay秒後に最初の発火。paused なら一時停止した状態で登録する）"""
+        with self._cond:
+            self._schedules[schedule.id] = schedule
+            if paused:
+                schedule.paused = True
+                self._park(schedule, delay)
+            else:
+                self._push(schedule, self.clock() + delay)
+        return schedule.id
+
+    def get(self, schedule_id):
+        with self._cond:
+            return self._schedules.get(schedule_id)
+
+    def schedules(self):
+        with self._cond:
+            return list(self._schedules.values())
+
+    def cancel(self, schedule_id):
+        """スケジュールを停止する（実行中なら処理の終了後に on_finish が呼ばれる）"""
+        with self._cond:
+            schedule = self._schedules.get(schedule_id)
+            if schedule is None or schedule.cancelled:
+                return False
+            schedule.stop_event.set()
+            if schedule.state != "running":
+                # ヒープ上のエントリは発火時に読み捨てる
+                schedule.next_fire = None
+                self._executor.submit(self._finish, schedule, "cancelled")
+            self._cond.notify()
+        return True
+
+    def pause(self, schedule_id):
+        """スケジュールを一時停止する（実行中なら処理の終了後に止まる）"""
+        with self._cond:
+            schedule = self._schedules.get(schedule_id)
+            if schedule is None or schedule.cancelled or schedule.paused:
+                return False
+            schedule.paused = True
+            if schedule.state == "waiting":
+                self._park(schedule, schedule.remaining(self.clock()))
+        return True
+
+    def resume(self, schedule_id):
+        """一時停止したスケジュールを、止めたときの残り時間から再開する"""
+        with self._cond:
+            schedule = self._schedules.get(schedule_id)
+            if schedule is None or schedule.cancelled or not schedule.paused:
+                return False
+            schedule.paused = False
+            if schedule.state == "paused":
+                remaining, schedule.paused_remaining = schedule.paused_remaining, None
+                self._push(schedule, self.clock() + remaining, self._lead(schedule))
+        return True
+
+    def shutdown(self, wait=True):
+        """すべてのスケジュールを停止し、スケジューラを終了する"""
+        for schedule in self.schedules():
+            self.cancel(schedule.id)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._executor.shutdown(wait=wait)
+
+    # ---- 内部処理 ----
+
+    def _push(self, schedule, deadline, lead=0.0):
+        schedule.next_fire = deadline
+        schedule.state = "waiting"
+        heapq.heappush(self._heap, (deadline - lead, next(self._seq), schedule, deadline))
+        self._cond.notify()
+        self._notify(schedule)
+
+    @staticmethod
+    def _lead(schedule):
+        # 最初の回・再試行と、回数を終えた後の発火（終了処理だけ）は前倒ししない
+        if schedule.iteration == 0 or schedule.retries or (schedule.count is not None and schedule.iteration >= schedule.count):
+            return 0.0
+        return schedule.lead
+
+    def _park(self, schedule, remaining):
+        # ヒープ上のエントリは next_fire と一致しなくなるので、発火時に読み捨てられる
+        schedule.paused_remaining = remaining
+        schedule.next_fire = None
+        schedule.state = "paused"
+        self._notify(schedule)
+
+    def _notify(self, schedule):
+        for listener in self._listeners:
+            try:
+                listener(schedule, schedule.state)
+            except Exception as e:
+                print(f"スケジュール通知でエラーが発生しました: {e}")
+
+    def _run(self):
+        with self._cond:
+            while not self._stopping:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                fire_at, _, schedule, deadline = self._heap[0]
+                try:
+                    if schedule.cancelled or schedule.next_fire != deadline:
+                        heapq.heappop(self._heap)
+                        continue
+                    delay = fire_at - self.clock()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    heapq.heappop(self._heap)
+                    schedule.state = "running"
+                    schedule.last_fire = deadline
+                    schedule.early = deadline - fire_at
+                    schedule.next_fire = None
+                    self._notify(schedule)
+                    self._executor.submit(self._fire, schedule)
+                except Exception as e:
+                    # 1件の不正な値（待てない発火時刻など）でタイマーのスレッドごと止まらないよう、そのスケジュールだけを終える
+                    print(f"スケジュール{schedule.id}の発火でエラーが発生しました: {e}")
+                    self._discard(schedule, e)
+
+    def _discard(self, schedule, error):
+        if self._heap and self._heap[0][2] is schedule:
+            heapq.heappop(self._heap)
+        schedule.error = error
+        schedule.next_fire = None
+        schedule.stop_event.set()
+        try:
+            self._executor.submit(self._finish, schedule, "error")
+        except RuntimeError:
+            # 終了処理の途中（ワーカープールはもう止まっている）
+            pass
+
+    def _fire(self, schedule):
+        if schedule.count is not None and schedule.iteration >= schedule.count:
+            self._finish(schedule, "completed")
+            return
+        if not schedule.cancelled:
+            try:
+                schedule.action(schedule)
+                schedule.iteration += 1
+                schedule.retries = 0
+            except RetryLater as e:
+                schedule.retries += 1
+                print(f"スケジュール{schedule.id}を{e.delay:g}秒後に再試行します: {e}")
+                with self._cond:
+                    if schedule.paused and not schedule.cancelled:
+                        self._park(schedule, e.delay)
+                        return
+                    if not schedule.cancelled:
+                        self._push(schedule, self.clock() + e.delay)
+                        return
+                self._finish(schedule, "cancelled")
+                return
+            except Exception as e:
+                schedule.error = e
+                print(f"スケジュール{schedule.id}の実行中にエラーが発生しました: {e}")
+                self._finish(schedule, "error")
+                return
+
+        with self._cond:
+            if schedule.cancelled:
+                finish = True
+            else:
+                finish = False
+                # 予定時刻を基準に次回を決める（処理時間の分だけずれていかない）
+                deadline = max(schedule.last_fire + schedule.interval, self.clock())
+                if schedule.paused:
+                    self._park(schedule, deadline - self.clock())
+                else:
+                    self._push(schedule, deadline, self._lead(schedule))
+        if finish:
+            self._finish(schedule, "cancelled")
+
+    def _finish(self, schedule, reason):
+        with self._cond:
+            if schedule.state == "finished":
+                return
+            schedule.state = "finished"
+            schedule.next_fire = None
+            self._schedules.pop(schedule.id, None)
+            self._notify(schedule)
+        if schedule.on_finish:
+            try:
+                schedule.on_finish(schedule, reason)
+            except Exception as e:
+                print(f"スケジュール{schedule.id}の終了処理でエラーが発生しました: {e}")
@@ -0,0 +1,185 @@
+"""繰り返し1回ごとの計測ログ（JSONL）と集計
+
+計測中のレコードはスレッドごとに保持するので、kill_process_tree や
+動画情報キャッシュのような下位の処理からも、引数を増やさずに値を書き込める。
+記録中でなければ stage / note は何もしない。
+
+集計:
+    python telemetry.py telemetry.jsonl
+"""
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+_local = threading.local()
+
+
+class TelemetryLog:
+    """計測レコードを1行1件のJSONで書き出す（サイズ上限でローテーション）"""
+
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backup_count=3):
+        self.path = path
+        self._handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        self._handler.handle(logging.LogRecord("telemetry", logging.INFO, "", 0, line, None, None))
+
+    def close(self):
+        self._handler.close()
+
+
+def create_telemetry_log(config, base_dir):
+    """設定からログを作る（telemetry_log が空なら記録しない）"""
+    path = config.get("telemetry_log", "telemetry.jsonl")
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    return TelemetryLog(
+        path,
+        max_bytes=int(config.get("telemetry_max_mb", 5) * 1024 * 1024),
+        backup_count=config.get("telemetry_backups", 3),
+    )
+
+
+# ---- 計測中レコード（スレッドごと） ----
+
+def begin(**fields):
+    """このスレッドで新しいレコードの記録を始める"""
+    record = {"ts": round(time.time(), 3)}
+    record.update(fields)
+    _local.record = record
+    return record
+
+
+def end():
+    """記録中のレコードを取り出して記録を終える"""
+    record = getattr(_local, "record", None)
+    _local.record = None
+    return record
+
+
+def active():
+    """このスレッドでレコードを記録中かどうか"""
+    return getattr(_local, "record", None) is not None
+
+
+def current():
+    """このスレッドで記録中のレコード（なければNone）"""
+    return getattr(_local, "record", None)
+
+
+@contextmanager
+def bound(record):
+    """別のスレッドで記録中のレコードに、このスレッドからも書き込めるようにする"""
+    previous = getattr(_local, "record", None)
+    _local.record = record
+    try:
+        yield
+    finally:
+        _local.record = previous
+
+
+def note(key, value):
+    record = getattr(_local, "record", None)
+    if record is not None:
+        record[key] = value
+
+
+@contextmanager
+def stage(name):
+    """処理時間を「<name>_ms」として記録する（同じ名前は加算）"""
+    record = getattr(_local, "record", None)
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        key = f"{name}_ms"
+        record[key] = round(record.get(key, 0) + (time.perf_counter() - start) * 1000, 3)
+
+
+# ---- 集計 ----
+
+def read_records(path):
+    """ログとローテーション済みのファイル（古い順）からレコードを読む"""
+    paths = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        paths.insert(0, f"{path}.{index}")
+        index += 1
+    if os.path.exists(path):
+        paths.append(path)
+    for p in paths:
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def percentile(sorted_values, q):
+    """最近傍順位法によるパーセンタイル"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(records, percentiles=(50, 90, 99)):
+    """数値項目ごとに件数・パーセンタイル・最大値を求める"""
+    values = {}
+    for record in records:
+        for key, value in record.items():
+            if key in ("ts", "schedule_id", "iteration") or isinstance(value, bool):
+                continue
+            if isinstance(value, (int, float)):
+                values.setdefault(key, []).append(value)
+    summary = {}
+    for key, vals in sorted(values.items()):
+        vals.sort()
+        row = {"count": len(vals)}
+        for q in percentiles:
+            row[f"p{q}"] = percentile(vals, q)
+        row["max"] = vals[-1]
+        summary[key] = row
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="計測ログ（JSONL）のパーセンタイル集計")
+    parser.add_argument("log", help="計測ログのパス（ローテーション済みの .1, .2 ... も読む）")
+    parser.add_argument("--json", action="store_true", help="JSONで出力する")
+    args = parser.parse_args(argv)
+
+    records = list(read_records(args.log))
+    summary = summarize(records)
+    if args.json:
+        print(json.dumps({"records": len(records), "metrics": summary}, ensure_ascii=False, indent=2))
+        return 0
+
+    print(f"レコード数: {len(records)}")
+    print(f"{'項目':<24}{'件数':>8}{'p50':>12}{'p90':>12}{'p99':>12}{'最大':>12}")
+    for key, row in summary.items():
+        cells = "".join(f"{row[c]:>12.3f}" for c in ("p50", "p90", "p99", "max"))
+        print(f"{key:<24}{row['count']:>8}{cells}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
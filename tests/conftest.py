@@ -0,0 +1,5 @@
+import os
+import sys
+
+# モジュールはリポジトリ直下に並んでいるので、どこから pytest を実行しても読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,93 @@
+"""ブラウザ起動の受け付け制御のテスト"""
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+
+from run_bench import make_launcher  # noqa: E402
+from admission import AdmissionController, AdmissionTimeout  # noqa: E402
+from process_registry import PROCESS_REGISTRY  # noqa: E402
+from repeater import Repeater  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+
+
+class FakeRegistry:
+    def __init__(self):
+        self.trees = {}  # root -> 生きているPIDの集合
+
+    def roots(self):
+        return list(self.trees)
+
+    def pids(self, root_pid=None):
+        return set(self.trees.get(root_pid, ()))
+
+
+def test_admitted_launches_are_reserved_until_released():
+    registry = FakeRegistry()
+    admission = AdmissionController(registry, max_browsers=2, stagger=0, timeout=0.2, poll=0.01)
+    assert admission.acquire() is not None
+    assert admission.acquire() is not None
+    # まだ1つも登録されていなくても、通した2つで上限
+    with pytest.raises(AdmissionTimeout):
+        admission.acquire()
+    # 1つ目が登録された（枠は登録簿のツリーとして数える）
+    registry.trees[100] = {100, 101}
+    admission.release()
+    with pytest.raises(AdmissionTimeout):
+        admission.acquire()
+    # 2つ目は起動しなかった
+    admission.release()
+    assert admission.acquire() is not None
+
+
+def test_dead_trees_do_not_count():
+    registry = FakeRegistry()
+    registry.trees = {100: set(), 200: {200}}
+    admission = AdmissionController(registry, max_browsers=2, stagger=0, timeout=0.2, poll=0.01)
+    assert admission.acquire() is not None
+    with pytest.raises(AdmissionTimeout):
+        admission.acquire()
+
+
+def test_simultaneous_schedules_never_exceed_max_browsers(tmp_path):
+    browser = make_launcher(str(tmp_path))
+    max_browsers = 2
+    schedules = 6
+    admission = AdmissionController(PROCESS_REGISTRY, max_browsers=max_browsers, stagger=0, poll=0.01)
+    scheduler = Scheduler(max_workers=schedules).start()
+    peak = 0
+    sampling = True
+
+    def sample():
+        nonlocal peak
+        while sampling:
+            live = sum(1 for root in PROCESS_REGISTRY.roots() if PROCESS_REGISTRY.pids(root))
+            peak = max(peak, live)
+            time.sleep(0.002)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    done = threading.Semaphore(0)
+    reasons = []
+    try:
+        for i in range(schedules):
+            job = Repeater(f"https://www.youtube.com/watch?v=adm{i:08d}", browser, probe_url=None,
+                           admission=admission,
+                           on_finish=lambda reason: (reasons.append(reason), done.release()))
+            # 1回再生して、少し後に終了処理でブラウザを閉じる
+            scheduler.add(job.schedule(0.2, count=1))
+        for _ in range(schedules):
+            assert done.acquire(timeout=30)
+    finally:
+        sampling = False
+        sampler.join()
+        scheduler.shutdown(wait=True)
+    assert reasons == ["completed"] * schedules
+    assert admission.stats["admitted"] == schedules
+    assert admission.stats["waited"] >= schedules - max_browsers
+    assert 0 < peak <= max_browsers
+    assert PROCESS_REGISTRY.roots() == []
@@ -0,0 +1,163 @@
+"""コマンドライン版の再起動のテスト（偽ブラウザで実際に起動し、途中で強制終了して起動し直す）"""
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import subprocess
+
+import psutil
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from run_bench import make_launcher  # noqa: E402
+
+URL = "https://www.youtube.com/watch?v=aaaaaaaaaaa"
+
+
+@pytest.fixture
+def work_dir(tmp_path):
+    config = {"telemetry_log": "", "profile_pool_size": 0, "watchdog_interval": 0,
+              "launch_stagger": 0, "diagnostics": [], "control_port": 0}
+    with open(tmp_path / "config.json", "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return tmp_path
+
+
+def start(work_dir, browser, store):
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "cli.py"), "--config", str(work_dir / "config.json"),
+         "--url", URL, "--interval", "1h", "--store", store, "--browser", browser,
+         "--no-probe", "--no-metadata"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=str(work_dir))
+
+
+def active_rows(store):
+    conn = sqlite3.connect(store)
+    try:
+        return conn.execute(
+            "SELECT id, iteration, updated FROM schedules WHERE state IN ('waiting', 'running', 'paused')").fetchall()
+    except sqlite3.OperationalError:
+        # まだ表が作られていない
+        return []
+    finally:
+        conn.close()
+
+
+def wait_until(predicate, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def crash(proc):
+    """後片付けをさせずに落とす（起動したブラウザはプロセスグループごと片付ける）"""
+    proc.send_signal(signal.SIGSTOP)
+    groups = {os.getpgid(p.pid) for p in psutil.Process(proc.pid).children()}
+    proc.kill()
+    proc.wait()
+    for pgid in groups:
+        try:
+            os.killpg(pgid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def test_restart_resumes_instead_of_duplicating(work_dir):
+    browser = make_launcher(str(work_dir))
+    store = str(work_dir / "schedules.db")
+    proc = start(work_dir, browser, store)
+    try:
+        # 1回目を再生し終えて、次の回を待っている
+        assert wait_until(lambda: [r[1] for r in active_rows(store)] == [1])
+        for _ in range(3):
+            crash(proc)
+            restarted = time.time()
+            proc = start(work_dir, browser, store)
+            # 再開したスケジュールの状態が書き込まれるまで待つ
+            assert wait_until(lambda: any(r[2] > restarted for r in active_rows(store)))
+            time.sleep(0.5)
+            rows = active_rows(store)
+            assert len(rows) == 1, rows
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+
+
+class FakeDiagnostics:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """main が作った診断と保存先を記録する"""
+    import cli
+    opened = {}
+
+    def setup_diagnostics(config):
+        opened["diagnostics"] = FakeDiagnostics()
+        return opened["diagnostics"]
+
+    def create_schedule_store(config, path=None):
+        opened["store"] = create(config, path)
+        return opened["store"]
+
+    create = cli.create_schedule_store
+    monkeypatch.setattr(cli, "setup_diagnostics", setup_diagnostics)
+    monkeypatch.setattr(cli, "create_schedule_store", create_schedule_store)
+    monkeypatch.setattr(cli, "resolve_browser_path", lambda config: None)
+    return opened
+
+
+def early_exit_args(work_dir, case):
+    if case == "interval":
+        return ["--url", URL, "--interval", "abc"]
+    if case == "count":
+        return ["--url", URL, "--interval", "1h", "--count", "0"]
+    if case == "browser":
+        return ["--url", URL, "--interval", "1h"]
+    if case == "url_file":
+        (work_dir / "empty.txt").write_text("# 空のリスト\n", encoding="utf-8")
+        return ["--url-file", str(work_dir / "empty.txt"), "--interval", "1h"]
+    raise ValueError(case)
+
+
+@pytest.mark.parametrize("case", ["interval", "count", "browser", "url_file"])
+def test_early_exit_closes_store_and_diagnostics(work_dir, opened, case):
+    import cli
+    args = ["--config", str(work_dir / "config.json"), "--store", str(work_dir / "schedules.db")]
+    assert cli.main(args + early_exit_args(work_dir, case)) == 2
+    assert opened["diagnostics"].closed
+    assert not opened["store"]._thread.is_alive()
+
+
+def test_control_server_error_cleans_up(work_dir, opened):
+    import socket
+    import cli
+    from process_registry import PROCESS_REGISTRY
+    # 制御APIのポートを先にふさいでおく
+    busy = socket.socket()
+    busy.bind(("127.0.0.1", 0))
+    busy.listen(1)
+    try:
+        code = cli.main([
+            "--config", str(work_dir / "config.json"), "--store", str(work_dir / "schedules.db"),
+            "--url", URL, "--interval", "1h", "--browser", make_launcher(str(work_dir)),
+            "--no-probe", "--no-metadata", "--control-port", str(busy.getsockname()[1])])
+    finally:
+        busy.close()
+    assert code == 2
+    assert opened["diagnostics"].closed
+    assert not opened["store"]._thread.is_alive()
+    # 制御APIより先に始めたスケジュールのブラウザも残さない
+    assert PROCESS_REGISTRY.roots() == []
@@ -0,0 +1,179 @@
+"""制御APIのテスト（127.0.0.1 の空いているポートで実際に待ち受ける）"""
+import json
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from control_server import ControlServer
+from repeater import parse_interval
+from scheduler import Schedule, Scheduler
+
+TOKEN = "secret"
+
+
+class FakeJob:
+    """Repeater の代わりに、発火の回数だけを数える"""
+
+    def __init__(self, target, shuffle):
+        self.target = target
+        self.shuffle = shuffle
+        self.runs = 0
+
+    def schedule(self, interval, count=None):
+        return Schedule(self.run, interval, count, name=str(self.target), job=self)
+
+    def run(self, schedule):
+        self.runs += 1
+
+
+def create_job(target, shuffle):
+    urls = target if isinstance(target, list) else [target]
+    if not all(url.startswith(("http://", "https://")) for url in urls):
+        raise ValueError("URLは http:// または https:// で始めてください")
+    return FakeJob(target, shuffle)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler(max_workers=2).start()
+    yield scheduler
+    scheduler.shutdown(wait=True)
+
+
+@pytest.fixture
+def server(scheduler):
+    server = ControlServer(scheduler, create_job, port=0, token=TOKEN).start()
+    yield server
+    server.stop()
+
+
+def call(server, method, path, body=None, token=TOKEN, raw=None):
+    """(ステータス, 応答のJSON) を返す"""
+    host, port = server.address
+    data = raw if raw is not None else (json.dumps(body).encode("utf-8") if body is not None else None)
+    req = urllib.request.Request(f"http://{host}:{port}{path}", data=data, method=method)
+    if token is not None:
+        req.add_header("Authorization", f"Bearer {token}")
+    if data is not None:
+        req.add_header("Content-Type", "application/json")
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status, json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        with e:
+            return e.code, json.loads(e.read().decode("utf-8"))
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_requires_token(server):
+    assert call(server, "GET", "/status", token=None)[0] == 401
+    assert call(server, "GET", "/status", token="wrong")[0] == 401
+    status, payload = call(server, "GET", "/status")
+    assert status == 200
+    assert payload["schedules"] == []
+
+
+def test_not_found(server):
+    assert call(server, "GET", "/nothing")[0] == 404
+    assert call(server, "GET", "/schedules/999")[0] == 404
+    assert call(server, "GET", "/schedules/abc")[0] == 404
+    assert call(server, "POST", "/schedules/999/pause")[0] == 404
+
+
+def test_method_not_allowed(server):
+    assert call(server, "DELETE", "/schedules")[0] == 405
+    assert call(server, "DELETE", "/status")[0] == 404
+
+
+@pytest.mark.parametrize("body", [
+    [1, 2],
+    {"interval": "10m"},
+    {"url": "ftp://example.com/", "interval": "10m"},
+    {"url": "https://youtu.be/aaaaaaaaaaa", "interval": "soon"},
+    {"url": "https://youtu.be/aaaaaaaaaaa", "interval": "0"},
+    {"url": "https://youtu.be/aaaaaaaaaaa", "interval": "10m", "count": 0},
+    {"url": "https://youtu.be/aaaaaaaaaaa", "interval": "10m", "count": True},
+])
+def test_create_rejects_bad_request(server, scheduler, body):
+    status, payload = call(server, "POST", "/schedules", body)
+    assert status == 400
+    assert payload["error"]
+    assert scheduler.schedules() == []
+
+
+def test_create_rejects_broken_json(server):
+    assert call(server, "POST", "/schedules", raw=b"{not json")[0] == 400
+
+
+@pytest.mark.parametrize("interval", ["inf", "nan", "-inf", "infm", "1e300", "400d"])
+def test_create_rejects_out_of_range_interval(server, scheduler, interval):
+    body = {"url": "https://youtu.be/aaaaaaaaaaa", "interval": interval}
+    assert call(server, "POST", "/schedules", body)[0] == 400
+    assert scheduler.schedules() == []
+    # スケジューラのスレッドは動き続け、その後の作成も受け付ける
+    body["interval"] = "10m"
+    assert call(server, "POST", "/schedules", body)[0] == 201
+    assert scheduler._thread.is_alive()
+
+
+def test_create_pause_resume_delete(server, scheduler):
+    status, created = call(server, "POST", "/schedules",
+                           {"url": "https://youtu.be/aaaaaaaaaaa", "interval": "10m", "count": 3})
+    assert status == 201
+    assert created["interval"] == 600
+    assert created["count"] == 3
+    path = f"/schedules/{created['id']}"
+
+    # 最初の回はすぐに発火し、次の回を待つ状態になる
+    assert wait_for(lambda: call(server, "GET", path)[1]["state"] == "waiting"
+                    and call(server, "GET", path)[1]["iteration"] == 1)
+
+    status, paused = call(server, "POST", f"{path}/pause")
+    assert status == 200
+    assert paused["paused"] and paused["state"] == "paused"
+    assert 0 < paused["remaining"] <= 600
+
+    status, resumed = call(server, "POST", f"{path}/resume")
+    assert status == 200
+    assert not resumed["paused"] and resumed["state"] == "waiting"
+
+    status, stopped = call(server, "DELETE", path)
+    assert status == 200
+    assert stopped["cancelled"]
+    assert wait_for(lambda: call(server, "GET", path)[0] == 404)
+    assert scheduler.schedules() == []
+
+
+def test_create_url_list(server):
+    status, created = call(server, "POST", "/schedules", {
+        "urls": ["https://youtu.be/aaaaaaaaaaa", "https://youtu.be/bbbbbbbbbbb"],
+        "shuffle": True, "interval": 30,
+    })
+    assert status == 201
+    assert created["interval"] == 30
+    assert created["name"].startswith("[")
+
+
+@pytest.mark.parametrize("value", ["inf", "-inf", "nan", "infs", "nanm", "1e400", "366d"])
+def test_parse_interval_rejects_non_finite_and_huge(value):
+    with pytest.raises(ValueError):
+        parse_interval(value)
+
+
+def test_parse_interval_units():
+    assert parse_interval("90") == 90
+    assert parse_interval("30s") == 30
+    assert parse_interval("10m") == 600
+    assert parse_interval("2h") == 7200
+    assert parse_interval("1d") == 86400
+    assert parse_interval(5, "分") == 300
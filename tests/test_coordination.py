@@ -0,0 +1,146 @@
+"""リースの保存先（メモリ・SQLite）とワーカーの停止順のテスト"""
+import pytest
+
+from coordination import MemoryLeases, SQLiteLeases, ShardWorker
+from scheduler import Schedule, Scheduler
+
+TTL = 15.0
+T0 = 1000.0  # 登録した時刻（リースのないスケジュールの期限は0なので、それより後）
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    backend = MemoryLeases() if request.param == "memory" else SQLiteLeases(str(tmp_path / "shards.db"))
+    yield backend
+    backend.close()
+
+
+def test_claim_takes_free_shards_once(backend):
+    first = backend.add(["https://youtu.be/aaaaaaaaaaa"], False, 60, None, now=T0)
+    second = backend.add(["https://youtu.be/bbbbbbbbbbb"], False, 60, 3, now=T0)
+    claimed = backend.claim("w1", 1, TTL, now=T0 + 100)
+    assert [s["id"] for s in claimed] == [first]
+    assert claimed[0]["owner"] == "w1"
+    assert claimed[0]["lease_until"] == T0 + 100 + TTL
+    # 取られているものは、ほかのワーカーには渡さない
+    assert [s["id"] for s in backend.claim("w2", 5, TTL, now=T0 + 101)] == [second]
+    assert backend.claim("w3", 5, TTL, now=T0 + 102) == []
+    owners = {s["id"]: s["owner"] for s in backend.shards()}
+    assert owners == {first: "w1", second: "w2"}
+
+
+def test_claim_orders_by_next_fire(backend):
+    late = backend.add(["https://youtu.be/aaaaaaaaaaa"], False, 60, None, now=T0)
+    early = backend.add(["https://youtu.be/bbbbbbbbbbb"], False, 60, None, now=T0)
+    backend.claim("w1", 2, TTL, now=T0)
+    backend.checkpoint("w1", [(late, 1, 1, 500.0, None), (early, 1, 1, 200.0, None)])
+    backend.release("w1", [late, early])
+    assert [s["id"] for s in backend.claim("w2", 2, TTL, now=T0 + 1)] == [early, late]
+
+
+def test_renew_extends_lease_until_expiry(backend):
+    shard_id = backend.add(["https://youtu.be/aaaaaaaaaaa"], False, 60, None, now=T0)
+    backend.claim("w1", 1, TTL, now=T0)
+    assert backend.renew("w1", [shard_id], TTL, now=T0 + 10) == {shard_id}
+    # 延長したので、最初の期限を過ぎても取られない
+    assert backend.claim("w2", 1, TTL, now=T0 + TTL + 1) == []
+    assert backend.renew("w1", [shard_id], TTL, now=T0 + TTL + 2) == {shard_id}
+
+
+def test_expired_lease_is_taken_over_with_progress(backend):
+    shard_id = backend.add(["https://youtu.be/aaaaaaaaaaa", "https://youtu.be/bbbbbbbbbbb"], True, 60, 5, now=T0)
+    backend.claim("w1", 1, TTL, now=T0)
+    backend.checkpoint("w1", [(shard_id, 2, 1, 70.0, None)])
+    # w1 が延長しないまま期限が切れた
+    taken = backend.claim("w2", 1, TTL, now=T0 + TTL + 1)
+    assert len(taken) == 1
+    shard = taken[0]
+    assert (shard["id"], shard["owner"], shard["iteration"], shard["position"]) == (shard_id, "w2", 2, 1)
+    assert shard["urls"] == ["https://youtu.be/aaaaaaaaaaa", "https://youtu.be/bbbbbbbbbbb"]
+    assert shard["shuffle"] is True
+    # 遅れて戻った w1 は延長も進み具合の書き込みもできない
+    assert backend.renew("w1", [shard_id], TTL, now=T0 + TTL + 2) == set()
+    backend.checkpoint("w1", [(shard_id, 9, 0, None, "completed")])
+    shard = backend.shards()[0]
+    assert (shard["state"], shard["iteration"], shard["owner"]) == ("active", 2, "w2")
+
+
+def test_checkpoint_with_reason_finishes_shard(backend):
+    shard_id = backend.add(["https://youtu.be/aaaaaaaaaaa"], False, 60, 1, now=T0)
+    backend.claim("w1", 1, TTL, now=T0)
+    backend.checkpoint("w1", [(shard_id, 1, 1, None, "completed")])
+    shard = backend.shards()[0]
+    assert (shard["state"], shard["reason"], shard["owner"]) == ("finished", "completed", None)
+    assert backend.count_active() == 0
+    assert backend.claim("w2", 1, TTL, now=T0 + TTL + 1) == []
+    assert backend.renew("w1", [shard_id], TTL, now=T0 + 1) == set()
+
+
+def test_finished_shard_is_dropped_on_renew(backend):
+    shard_id = backend.add(["https://youtu.be/aaaaaaaaaaa"], False, 60, None, now=T0)
+    backend.claim("w1", 1, TTL, now=T0)
+    assert backend.finish(shard_id)
+    assert not backend.finish(shard_id)
+    assert backend.renew("w1", [shard_id], TTL, now=T0 + 1) == set()
+
+
+def test_leave_releases_leases_and_worker(backend):
+    shard_id = backend.add(["https://youtu.be/aaaaaaaaaaa"], False, 60, None, now=T0)
+    backend.heartbeat("w1", 1, 1, now=T0)
+    backend.claim("w1", 1, TTL, now=T0)
+    assert [w["id"] for w in backend.workers(TTL, now=T0 + 1)] == ["w1"]
+    backend.leave("w1")
+    assert backend.workers(TTL, now=T0 + 1) == []
+    # 期限を待たずに取れる
+    assert [s["id"] for s in backend.claim("w2", 1, TTL, now=T0 + 1)] == [shard_id]
+
+
+def test_workers_expire_without_heartbeat(backend):
+    backend.heartbeat("w1", 2, 1, capacity=4, now=T0)
+    backend.heartbeat("w2", 0, 0, now=T0 + 10)
+    assert [w["id"] for w in backend.workers(TTL, now=T0 + 12)] == ["w1", "w2"]
+    assert [w["id"] for w in backend.workers(TTL, now=T0 + TTL + 5)] == ["w2"]
+
+
+class FakeJob:
+    def __init__(self, target, shuffle=False):
+        self.position = 0
+
+    def schedule(self, interval, count=None):
+        return Schedule(lambda s: None, interval, count, job=self)
+
+    def checkpoint(self, schedule):
+        return {"position": self.position}
+
+    def seek(self, position):
+        self.position = position
+
+
+class FakeRegistry:
+    def roots(self):
+        return []
+
+
+def test_worker_keeps_leases_until_leave():
+    backend = MemoryLeases()
+    shard_id = backend.add(["https://youtu.be/aaaaaaaaaaa"], False, 3600, None)
+    scheduler = Scheduler(max_workers=1).start()
+    try:
+        worker = ShardWorker(backend, scheduler, FakeJob, worker_id="w1", registry=FakeRegistry())
+        scheduler.add_listener(worker.on_state)
+        # 最初の確認では担当を取らない
+        worker.tick()
+        worker.tick()
+        assert worker.owned() == [shard_id]
+        worker.stop()
+        # スケジュールは止めたが、ブラウザを終了させるまではリースを持ったまま
+        assert worker.owned() == []
+        assert scheduler.schedules() == [] or all(s.cancelled for s in scheduler.schedules())
+        shard = backend.shards()[0]
+        assert (shard["state"], shard["owner"]) == ("active", "w1")
+        assert backend.claim("w2", 1, TTL) == []
+        worker.leave()
+        assert backend.shards()[0]["owner"] is None
+        assert [s["id"] for s in backend.claim("w2", 1, TTL)] == [shard_id]
+    finally:
+        scheduler.shutdown(wait=True)
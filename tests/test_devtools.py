@@ -0,0 +1,87 @@
+"""DevToolsのWebSocketクライアントのテスト（ハンドシェイクに失敗した接続を残さない）"""
+import os
+import sys
+import json
+import socket
+import threading
+
+import pytest
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+sys.path.insert(0, BENCH_DIR)
+
+import devtools  # noqa: E402
+from devtools import DevToolsError, _WebSocket  # noqa: E402
+from fake_chrome import _DevToolsStandIn  # noqa: E402
+
+
+class OneShotServer:
+    """接続を1つ受け、要求を読んでから reply を返す（None なら何も返さずに待つ、b"" なら切断する）"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(1)
+        self.url = f"ws://127.0.0.1:{self.sock.getsockname()[1]}/devtools/page/1"
+        self.done = threading.Event()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self.sock.accept()
+        with conn:
+            data = b""
+            while b"\r\n\r\n" not in data:
+                data += conn.recv(1024)
+            if self.reply is None:
+                self.done.wait(5)
+            else:
+                conn.sendall(self.reply)
+
+    def close(self):
+        self.done.set()
+        self.sock.close()
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """_WebSocket が作ったソケットを記録する"""
+    sockets = []
+    create_connection = socket.create_connection
+
+    def recording(*args, **kwargs):
+        sock = create_connection(*args, **kwargs)
+        sockets.append(sock)
+        return sock
+
+    monkeypatch.setattr(devtools.socket, "create_connection", recording)
+    return sockets
+
+
+@pytest.mark.parametrize("reply, error", [
+    (b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n", DevToolsError),
+    (b"HTTP/1.1 200 OK\r\n", DevToolsError),
+    (b"", DevToolsError),
+    (None, socket.timeout),
+])
+def test_failed_handshake_closes_socket(opened, reply, error):
+    server = OneShotServer(reply)
+    try:
+        with pytest.raises(error):
+            _WebSocket(server.url, timeout=0.5)
+    finally:
+        server.close()
+    assert len(opened) == 1
+    assert opened[0].fileno() == -1
+
+
+def test_handshake_and_navigate():
+    standin = _DevToolsStandIn("about:blank")
+    ws = _WebSocket(f"ws://127.0.0.1:{standin.port}/devtools/page/1")
+    try:
+        ws.send(json.dumps({"id": 1, "method": "Page.navigate", "params": {"url": "https://example.com/"}}))
+        reply = json.loads(ws.recv())
+        assert reply["id"] == 1
+    finally:
+        ws.close()
+    assert ws.sock.fileno() == -1
@@ -0,0 +1,114 @@
+"""診断（プロファイル）のテスト"""
+import os
+import sys
+import pstats
+import threading
+
+import pytest
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+sys.path.insert(0, BENCH_DIR)
+
+import diagnostics  # noqa: E402
+from diagnostics import Diagnostics  # noqa: E402
+from fake_youtube import FakeYouTube  # noqa: E402
+from run_bench import make_launcher  # noqa: E402
+from process_registry import PROCESS_REGISTRY  # noqa: E402
+from repeater import Repeater  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from video_cache import VideoInfoCache  # noqa: E402
+
+
+@pytest.fixture
+def diag(tmp_path, monkeypatch):
+    diag = Diagnostics(str(tmp_path / "diagnostics"))
+    monkeypatch.setattr(diagnostics, "DIAGNOSTICS", diag)
+    yield diag
+    diag.close()
+
+
+def test_iteration_runs_while_profiling(tmp_path, diag):
+    """計測中でも繰り返しが最後まで動き、別スレッドでの動画情報の取得も結果に含まれる"""
+    fake = FakeYouTube().start()
+    scheduler = Scheduler(max_workers=2).start()
+    try:
+        cache = VideoInfoCache(str(tmp_path / "cache"), oembed_url=f"{fake.base_url}/oembed")
+        finished = []
+        done = threading.Event()
+        job = Repeater(
+            "https://www.youtube.com/watch?v=aaaaaaaaaaa", make_launcher(str(tmp_path)),
+            video_cache=cache, probe_url=None,
+            on_finish=lambda reason: (finished.append(reason), done.set()),
+        )
+        assert diag.start_profile()
+        assert not diag.start_profile()
+        scheduler.add(job.schedule(0.01, count=1))
+        assert done.wait(10)
+        path = diag.stop_profile()
+    finally:
+        scheduler.shutdown(wait=True)
+        fake.stop()
+
+    assert finished == ["completed"]
+    assert [r["status"] for r in job.recent] == ["ok"]
+    assert job.recent[0]["metadata_source"] == "network"
+    assert PROCESS_REGISTRY.roots() == []
+    assert not diag.profiling
+    assert os.path.exists(path)
+    stats = pstats.Stats(path[:-len(".txt")] + ".pstats")
+    functions = {name for _, _, name in stats.stats}
+    assert "_run_iteration" in functions
+    assert "_fetch" in functions
+
+
+def test_profiled_does_not_nest(diag):
+    assert diag.profiled() is diagnostics._NOTHING
+    assert diag.start_profile()
+    errors = []
+
+    def work():
+        try:
+            with diag.profiled():
+                with diag.profiled():
+                    sum(range(1000))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert diag.stop_profile() is not None
+    assert diag.stop_profile() is None
+
+
+def busy():
+    return sum(range(1000))
+
+
+@pytest.mark.skipif(diagnostics.PROCESS_WIDE_PROFILE, reason="3.12以降は1つの Profile で全スレッドを測る")
+def test_profiles_are_merged_as_they_finish(diag):
+    assert diag.start_profile()
+
+    def run(n):
+        for _ in range(n):
+            with diag.profiled():
+                busy()
+
+    run(10)
+    functions = len(diag._stats.stats)
+    threads = [threading.Thread(target=run, args=(50,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 回数が増えても、持っているのは関数ごとの集計だけ
+    assert len(diag._stats.stats) == functions
+    path = diag.stop_profile()
+    with open(path, encoding="utf-8") as f:
+        assert f.read().startswith("210回分")
+    stats = pstats.Stats(path[:-len(".txt")] + ".pstats")
+    calls = {name: ncalls for (_, _, name), (_, ncalls, *_) in stats.stats.items()}
+    assert calls["busy"] == 210
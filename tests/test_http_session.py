@@ -0,0 +1,118 @@
+"""共有セッションの再試行と接続状態の追跡のテスト（ローカルのHTTPサーバーを使う）"""
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_session
+from http_session import CONNECTIVITY, RETRIES, RETRY_BACKOFF, ConnectivityTracker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyServer:
+    """最初の failures 回は status を返し、その後は200を返す"""
+
+    def __init__(self, failures, status=503):
+        self.failures = failures
+        self.times = []  # 要求を受けた時刻
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.times.append(time.monotonic())
+                code = status if len(server.times) <= server.failures else 200
+                self.send_response(code)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            do_HEAD = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def forget_connectivity():
+    CONNECTIVITY.record_failure()
+    yield
+    CONNECTIVITY.record_failure()
+
+
+@pytest.mark.parametrize("method", ["GET", "HEAD"])
+def test_retries_server_errors_with_backoff(method):
+    with FlakyServer(failures=RETRIES) as server:
+        resp = http_session.request(method, server.url, timeout=5)
+    assert resp.status_code == 200
+    assert len(server.times) == RETRIES + 1
+    # urllib3 は2回目以降の再試行の前に backoff_factor * 2**(n-1) 秒待つ
+    gaps = [b - a for a, b in zip(server.times, server.times[1:])]
+    assert gaps[-1] >= RETRY_BACKOFF * 2 ** (RETRIES - 1) * 0.9
+    assert CONNECTIVITY.recently_online()
+
+
+def test_gives_up_after_retries_and_returns_last_response():
+    with FlakyServer(failures=RETRIES + 5) as server:
+        resp = http_session.get(server.url, timeout=5)
+    assert resp.status_code == 503
+    assert len(server.times) == RETRIES + 1
+    # 応答は返っているので、接続はできている
+    assert CONNECTIVITY.recently_online()
+
+
+def test_client_errors_are_not_retried():
+    with FlakyServer(failures=1, status=404) as server:
+        resp = http_session.get(server.url, timeout=5)
+    assert resp.status_code == 404
+    assert len(server.times) == 1
+
+
+def test_connection_error_records_failure():
+    CONNECTIVITY.record_success()
+    # 誰も待ち受けていないポート
+    with pytest.raises(requests.ConnectionError):
+        http_session.head("http://127.0.0.1:1/", timeout=5)
+    assert not CONNECTIVITY.recently_online()
+    assert CONNECTIVITY.failures == 1
+
+
+def test_session_is_shared():
+    assert http_session.get_session() is http_session.get_session()
+
+
+def test_evidence_is_extended_by_interval():
+    clock = FakeClock()
+    tracker = ConnectivityTracker(max_age=60, clock=clock)
+    assert not tracker.recently_online()
+    tracker.record_success()
+    clock.now = 59
+    assert tracker.recently_online()
+    clock.now = 61
+    assert not tracker.recently_online()
+    # 600秒間隔なら、前の回（600秒と少し前）の通信も根拠になる
+    clock.now = 610
+    assert tracker.recently_online(interval=600)
+    clock.now = 661
+    assert not tracker.recently_online(interval=600)
+    tracker.record_failure()
+    assert not tracker.recently_online(interval=600)
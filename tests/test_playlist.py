@@ -0,0 +1,192 @@
+"""URLの正規化・URLリストの取り込みと重複除去・再生順のテスト"""
+import random
+
+import pytest
+
+from playlist import PlayOrder, RateLimiter, load_url_list, parse_url_list, prefetch
+from youtube_url import canonical_url, extract_video_id
+
+VIDEO_ID = "dQw4w9WgXcQ"
+
+
+@pytest.mark.parametrize("url", [
+    VIDEO_ID,
+    f"https://www.youtube.com/watch?v={VIDEO_ID}",
+    f"https://youtube.com/watch?v={VIDEO_ID}",
+    f"http://m.youtube.com/watch?v={VIDEO_ID}",
+    f"https://music.youtube.com/watch?v={VIDEO_ID}",
+    f"www.youtube.com/watch?v={VIDEO_ID}",
+    f"https://www.youtube.com/watch/?v={VIDEO_ID}",
+    f"https://www.youtube.com/watch?v={VIDEO_ID}&t=42s",
+    f"https://www.youtube.com/watch?t=42&v={VIDEO_ID}",
+    f"https://www.youtube.com/watch?v={VIDEO_ID}&list=PLabcdefghijklmnop&index=3",
+    f"https://youtu.be/{VIDEO_ID}",
+    f"https://youtu.be/{VIDEO_ID}?t=42",
+    f"https://youtu.be/{VIDEO_ID}?si=abcdef&t=1m2s",
+    f"youtu.be/{VIDEO_ID}",
+    f"https://www.youtube.com/shorts/{VIDEO_ID}",
+    f"https://www.youtube.com/embed/{VIDEO_ID}?start=10",
+    f"https://www.youtube-nocookie.com/embed/{VIDEO_ID}",
+    f"https://www.youtube.com/live/{VIDEO_ID}?feature=share",
+    f"  https://YouTube.com/watch?v={VIDEO_ID}  ",
+])
+def test_extract_video_id(url):
+    assert extract_video_id(url) == VIDEO_ID
+
+
+@pytest.mark.parametrize("url", [
+    None,
+    "",
+    "https://www.youtube.com/playlist?list=PLabcdefghijklmnop",
+    "https://www.youtube.com/watch?list=PLabcdefghijklmnop",
+    "https://www.youtube.com/watch?v=short",
+    f"https://www.youtube.com/watch?v={VIDEO_ID}x",
+    "https://www.youtube.com/@channel",
+    "https://www.youtube.com/channel/UCabcdefghijklmnopqrstuv",
+    f"https://example.com/watch?v={VIDEO_ID}",
+    f"https://notyoutu.be/{VIDEO_ID}",
+    "not a url",
+    "http://[invalid",
+])
+def test_extract_video_id_rejects(url):
+    assert extract_video_id(url) is None
+
+
+@pytest.mark.parametrize("url", [
+    f"https://youtu.be/{VIDEO_ID}?t=42",
+    f"https://www.youtube.com/watch?v={VIDEO_ID}&t=42s&list=PLabcdefghijklmnop",
+    f"https://m.youtube.com/shorts/{VIDEO_ID}",
+])
+def test_canonical_url_round_trip(url):
+    canonical = canonical_url(extract_video_id(url))
+    assert canonical == f"https://www.youtube.com/watch?v={VIDEO_ID}"
+    assert extract_video_id(canonical) == VIDEO_ID
+
+
+def test_parse_url_list_dedupes_across_forms():
+    lines = [
+        "# お気に入り\n",
+        f"https://www.youtube.com/watch?v={VIDEO_ID}\n",
+        "\n",
+        f"https://youtu.be/{VIDEO_ID}?t=10\n",
+        "https://youtu.be/aaaaaaaaaaa\n",
+        f"https://www.youtube.com/watch?v={VIDEO_ID}&list=PLabcdefghijklmnop\n",
+        "https://www.youtube.com/playlist?list=PLabcdefghijklmnop\n",
+        "bbbbbbbbbbb\n",
+        "https://youtu.be/aaaaaaaaaaa\n",
+    ]
+    video_ids, stats = parse_url_list(lines)
+    # 最初に出てきた順を保つ
+    assert video_ids == [VIDEO_ID, "aaaaaaaaaaa", "bbbbbbbbbbb"]
+    assert stats["total"] == 6
+    assert stats["duplicates"] == 3
+    assert stats["invalid"] == ["https://www.youtube.com/playlist?list=PLabcdefghijklmnop"]
+
+
+def test_parse_url_list_reads_any_csv_column():
+    lines = [
+        "動画 ID,動画の追加日時\n",
+        f"{VIDEO_ID},2024-01-01T00:00:00+00:00\n",
+        "メモ,https://youtu.be/aaaaaaaaaaa\n",
+        f"{VIDEO_ID},2024-01-02T00:00:00+00:00\n",
+        "読めない行,なし\n",
+    ]
+    video_ids, stats = parse_url_list(lines)
+    assert video_ids == [VIDEO_ID, "aaaaaaaaaaa"]
+    # 見出し行は読めない行に数えない
+    assert stats["invalid"] == ["読めない行,なし"]
+    assert stats["duplicates"] == 1
+
+
+def test_load_url_list_with_bom(tmp_path):
+    path = tmp_path / "takeout.csv"
+    path.write_text(f"動画 ID,動画の追加日時\r\n{VIDEO_ID},2024-01-01\r\n", encoding="utf-8-sig")
+    assert load_url_list(str(path)) == ([VIDEO_ID], {"total": 1, "duplicates": 0, "invalid": []})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_rate_limiter_spaces_calls():
+    clock = FakeClock()
+    limiter = RateLimiter(10, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        limiter.wait()
+    assert clock.slept == pytest.approx([0.1, 0.1])
+    # 間が空いていれば待たない
+    clock.now += 5
+    limiter.wait()
+    assert len(clock.slept) == 2
+
+
+class FakeCache:
+    def __init__(self, fresh=(), failing=()):
+        self.fresh = set(fresh)
+        self.failing = set(failing)
+        self.fetched = []
+        self.batches = 0
+
+    def peek(self, url):
+        return {"fresh": True} if extract_video_id(url) in self.fresh else None
+
+    def get(self, url):
+        video_id = extract_video_id(url)
+        if video_id in self.failing:
+            raise OSError("offline")
+        self.fetched.append(video_id)
+
+    def batch(self):
+        cache = self
+
+        class Batch:
+            def __enter__(self):
+                cache.batches += 1
+
+            def __exit__(self, *exc):
+                return False
+
+        return Batch()
+
+
+def test_prefetch_skips_fresh_entries():
+    cache = FakeCache(fresh={"aaaaaaaaaaa"}, failing={"ccccccccccc"})
+    progress = []
+    counts = prefetch(cache, ["aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"], workers=2, rate=0,
+                      on_progress=lambda done, total: progress.append((done, total)))
+    assert counts == {"fetched": 1, "cached": 1, "failed": 1}
+    assert cache.fetched == ["bbbbbbbbbbb"]
+    assert cache.batches == 1
+    assert sorted(progress) == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_play_order_in_sequence_and_seek():
+    order = PlayOrder(["a", "b", "c"])
+    assert [order.next() for _ in range(4)] == ["a", "b", "c", "a"]
+    assert order.position == 1
+    order.seek(2)
+    assert [order.next() for _ in range(2)] == ["c", "a"]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_shuffle_covers_each_round_without_repeating_at_boundary(seed):
+    urls = ["a", "b", "c", "d"]
+    order = PlayOrder(urls, shuffle=True, rng=random.Random(seed))
+    played = [order.next() for _ in range(len(urls) * 5)]
+    for start in range(0, len(played), len(urls)):
+        assert sorted(played[start:start + len(urls)]) == urls
+    assert all(a != b for a, b in zip(played, played[1:]))
+
+
+def test_play_order_requires_urls():
+    with pytest.raises(ValueError):
+        PlayOrder([])
@@ -0,0 +1,156 @@
+"""プロファイルのプールのテスト（テンプレートの作成は bench の偽ブラウザで行う）"""
+import os
+import sys
+import time
+
+import pytest
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+sys.path.insert(0, BENCH_DIR)
+
+import profile_pool  # noqa: E402
+from profile_pool import ProfilePool, clone_profile, prepare_template  # noqa: E402
+from process_registry import PROCESS_REGISTRY  # noqa: E402
+from run_bench import make_launcher  # noqa: E402
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def template(tmp_path):
+    """初期化済みのプロファイルと、複製しないもの（起動中の印・キャッシュ）を置いたテンプレート"""
+    path = str(tmp_path / "template")
+    write(os.path.join(path, "Local State"), '{"browser": {}}')
+    write(os.path.join(path, "Default", "Preferences"), '{"profile": {}}')
+    write(os.path.join(path, "Default", "Cache", "data_0"), "cache")
+    write(os.path.join(path, "DevToolsActivePort"), "9222\n")
+    os.symlink("host-1234", os.path.join(path, "SingletonLock"))
+    return path
+
+
+def test_clone_copies_files_instead_of_linking(tmp_path, template):
+    clone = clone_profile(template, str(tmp_path / "clone"))
+    prefs = os.path.join(clone, "Default", "Preferences")
+    assert read(prefs) == '{"profile": {}}'
+    original = os.stat(os.path.join(template, "Default", "Preferences"))
+    copied = os.stat(prefs)
+    assert copied.st_nlink == 1
+    assert copied.st_ino != original.st_ino
+    # 起動中の印・キャッシュ・DevToolsのポートは複製しない
+    assert sorted(os.listdir(clone)) == ["Default", "Local State"]
+    assert os.listdir(os.path.join(clone, "Default")) == ["Preferences"]
+    # 複製を書き換えても、テンプレートは変わらない
+    write(prefs, '{"changed": true}')
+    assert read(os.path.join(template, "Default", "Preferences")) == '{"profile": {}}'
+
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="copy_file_range がない")
+def test_clone_uses_copy_file_range(monkeypatch, tmp_path, template):
+    calls = []
+    real = os.copy_file_range
+
+    def counting(src, dst, count, *args):
+        calls.append(count)
+        return real(src, dst, count, *args)
+
+    monkeypatch.setattr(os, "copy_file_range", counting)
+    clone = clone_profile(template, str(tmp_path / "clone"))
+    assert len(calls) == 2
+    assert read(os.path.join(clone, "Local State")) == '{"browser": {}}'
+
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="copy_file_range がない")
+def test_clone_falls_back_to_copy(monkeypatch, tmp_path, template):
+    def unsupported(*args):
+        raise OSError(95, "Operation not supported")
+
+    monkeypatch.setattr(os, "copy_file_range", unsupported)
+    clone = clone_profile(template, str(tmp_path / "clone"))
+    assert read(os.path.join(clone, "Default", "Preferences")) == '{"profile": {}}'
+    assert os.stat(os.path.join(clone, "Default", "Preferences")).st_nlink == 1
+
+
+def test_prepare_template_with_fake_browser(tmp_path):
+    profiles = tmp_path / "profiles"
+    path = str(profiles / "template")
+    assert prepare_template(make_launcher(str(tmp_path)), path, PROCESS_REGISTRY.spawn, PROCESS_REGISTRY.terminate)
+    assert os.path.exists(os.path.join(path, "Local State"))
+    assert os.path.exists(os.path.join(path, "Default", "Preferences"))
+    # 作業用・複製用の一時ディレクトリは残さず、ブラウザも終了させている
+    assert os.listdir(profiles) == ["template"]
+    assert PROCESS_REGISTRY.roots() == []
+
+
+def test_prepare_template_fails_when_browser_exits(tmp_path):
+    profiles = tmp_path / "profiles"
+    path = str(profiles / "template")
+    assert not prepare_template("/bin/true", path, PROCESS_REGISTRY.spawn, PROCESS_REGISTRY.terminate, timeout=5)
+    assert os.listdir(profiles) == []
+
+
+def test_prepare_template_keeps_template_made_by_another_process(monkeypatch, tmp_path, template):
+    # 初期化を待っている間に、ほかのプロセスが同じテンプレートを作った
+    def spawn(cmd):
+        write(os.path.join(str(tmp_path / "profiles" / "template"), "Local State"), "other")
+        return PROCESS_REGISTRY.spawn(cmd)
+
+    monkeypatch.setattr(profile_pool.time, "sleep", lambda seconds: None)
+    path = str(tmp_path / "profiles" / "template")
+    assert prepare_template(make_launcher(str(tmp_path)), path, spawn, PROCESS_REGISTRY.terminate)
+    assert read(os.path.join(path, "Local State")) == "other"
+    assert os.listdir(tmp_path / "profiles") == ["template"]
+
+
+def test_pool_lends_clones_and_cleans_up(tmp_path, template):
+    work_dir = str(tmp_path / "pool")
+    pool = ProfilePool(template, size=2, work_dir=work_dir)
+    try:
+        assert wait_for(lambda: pool.ready_count() == 2)
+        path = pool.acquire()
+        assert read(os.path.join(path, "Default", "Preferences")) == '{"profile": {}}'
+        assert not os.path.exists(os.path.join(path, "SingletonLock"))
+        # 貸し出した分はすぐに補充する
+        assert wait_for(lambda: pool.ready_count() == 2)
+        pool.release(path)
+        assert not os.path.exists(path)
+        # 返したものは裏で削除する
+        assert wait_for(lambda: len(os.listdir(work_dir)) == 2)
+    finally:
+        pool.close()
+    assert not os.path.exists(work_dir)
+
+
+def test_pool_without_template_lends_empty_dirs(tmp_path):
+    prepared = []
+
+    def prepare(path):
+        prepared.append(path)
+        return False
+
+    pool = ProfilePool(str(tmp_path / "missing"), size=1, work_dir=str(tmp_path / "pool"), prepare=prepare)
+    try:
+        path = pool.acquire()
+        assert os.path.isdir(path)
+        assert os.listdir(path) == []
+        assert wait_for(lambda: prepared == [str(tmp_path / "missing")])
+    finally:
+        pool.close()
+    assert not os.path.exists(tmp_path / "pool")
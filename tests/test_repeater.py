@@ -0,0 +1,151 @@
+"""Repeater の段階ごとの停止のテスト（bench の偽ブラウザを使い、実際のChromeは使わない）"""
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+sys.path.insert(0, BENCH_DIR)
+
+from run_bench import make_launcher  # noqa: E402
+from fake_youtube import FakeYouTube  # noqa: E402
+from admission import AdmissionController  # noqa: E402
+from http_session import CONNECTIVITY  # noqa: E402
+from process_registry import PROCESS_REGISTRY, CANCEL_POLL  # noqa: E402
+from repeater import Repeater  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+
+# 停止してから繰り返しの処理が戻るまでの上限（待ちを CANCEL_POLL ごとに確かめるので、その数回分と後片付け）
+CANCEL_BOUND = 0.5
+
+
+@pytest.fixture
+def browser(tmp_path):
+    return make_launcher(str(tmp_path))
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler(max_workers=2).start()
+    yield scheduler
+    scheduler.shutdown(wait=True)
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(CANCEL_POLL)
+    return False
+
+
+def run_and_cancel(scheduler, job, interval, in_stage):
+    """スケジュールを始め、in_stage() が真になったら止めて (処理が戻るまで, 終了までの秒数, 理由) を返す"""
+    finished = []
+    done = threading.Event()
+    job.on_finish = lambda reason: (finished.append(reason), done.set())
+    schedule = job.schedule(interval)
+    scheduler.add(schedule)
+    assert wait_for(in_stage)
+    records = len(job.recent)
+    cancelled_at = time.monotonic()
+    assert scheduler.cancel(schedule.id)
+    assert wait_for(lambda: len(job.recent) > records)
+    returned = time.monotonic() - cancelled_at
+    assert done.wait(10)
+    return returned, time.monotonic() - cancelled_at, finished
+
+
+def test_cancel_while_waiting_for_devtools(monkeypatch, scheduler, browser):
+    # ブラウザの準備（DevToolsActivePort）に5秒かかる
+    monkeypatch.setenv("FAKE_CHROME_STARTUP_MS", "5000")
+    job = Repeater("https://www.youtube.com/watch?v=aaaaaaaaaaa", browser, warm=True, probe_url=None)
+    returned, elapsed, finished = run_and_cancel(
+        scheduler, job, 60, lambda: bool(PROCESS_REGISTRY.roots()))
+    assert returned < CANCEL_BOUND
+    assert elapsed < CANCEL_BOUND
+    assert finished == ["cancelled"]
+    assert job.recent[-1]["status"] == "cancelled"
+    assert PROCESS_REGISTRY.roots() == []
+
+
+def test_cancel_while_tearing_down(monkeypatch, scheduler, browser):
+    # SIGTERM を無視するので、前のブラウザの終了は穏やかな終了の待ち時間（2秒）いっぱいかかる
+    monkeypatch.setenv("FAKE_CHROME_IGNORE_TERM", "1")
+    job = Repeater("https://www.youtube.com/watch?v=aaaaaaaaaaa", browser, probe_url=None)
+    first = []
+
+    def tearing_down():
+        if not first and job.recent:
+            first.append(time.monotonic())
+        # 2回目の発火から少し経てば、前のブラウザの終了を待っている
+        return bool(first) and time.monotonic() - first[0] > 0.5
+
+    returned, elapsed, finished = run_and_cancel(scheduler, job, 0.2, tearing_down)
+    assert returned < CANCEL_BOUND
+    assert elapsed < CANCEL_BOUND
+    assert finished == ["cancelled"]
+    assert job.recent[-1]["status"] == "cancelled"
+    assert PROCESS_REGISTRY.roots() == []
+
+
+def test_cancel_while_waiting_for_admission(scheduler, browser):
+    # 起動中のブラウザがなくても通さない受け付け制御（上限の確認は毎回 blocked）
+    admission = AdmissionController(PROCESS_REGISTRY, stagger=3600, timeout=60, poll=CANCEL_POLL)
+    admission._last_admit = time.monotonic()
+    job = Repeater("https://www.youtube.com/watch?v=aaaaaaaaaaa", browser, probe_url=None, admission=admission)
+    returned, elapsed, finished = run_and_cancel(
+        scheduler, job, 60, lambda: len(admission._queue) == 1)
+    assert returned < CANCEL_BOUND
+    assert finished == ["cancelled"]
+    assert job.recent[-1]["status"] == "cancelled"
+    assert job.chrome_proc is None
+    assert PROCESS_REGISTRY.roots() == []
+
+
+@pytest.fixture
+def offline():
+    # 直近の通信の成功を忘れさせ、毎回接続確認を行わせる
+    CONNECTIVITY.record_failure()
+    yield
+    CONNECTIVITY.record_failure()
+
+
+def run_first(scheduler, job):
+    """1回目の発火を終えたら止めて、その回の計測レコードを返す"""
+    done = threading.Event()
+    job.on_finish = lambda reason: done.set()
+    schedule = job.schedule(60)
+    scheduler.add(schedule)
+    assert wait_for(lambda: job.recent)
+    scheduler.cancel(schedule.id)
+    assert done.wait(10)
+    return job.recent[0]
+
+
+def test_slow_probe_does_not_delay_launch(offline, scheduler, browser):
+    fake = FakeYouTube(latency=1.0).start()
+    try:
+        job = Repeater("https://www.youtube.com/watch?v=aaaaaaaaaaa", browser, probe_url=f"{fake.base_url}/")
+        record = run_first(scheduler, job)
+    finally:
+        fake.stop()
+    assert record["status"] == "ok"
+    assert record["probe_ms"] >= 1000
+    assert record["launch_delay_ms"] < 100
+    assert record["mode"] == "cold"
+
+
+def test_failed_probe_retries_after_launch(offline, scheduler, browser):
+    errors = []
+    # 誰も待ち受けていないポート（接続はすぐに拒否される）
+    job = Repeater("https://www.youtube.com/watch?v=aaaaaaaaaaa", browser, probe_url="http://127.0.0.1:1/",
+                   on_error=lambda title, message: errors.append(title))
+    record = run_first(scheduler, job)
+    assert record["status"] == "retry:network"
+    assert record["launch_delay_ms"] < 100
+    assert "mode" in record
+    assert errors == ["ネットワークエラー"]
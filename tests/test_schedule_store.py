@@ -0,0 +1,171 @@
+"""スケジュールの保存先のテスト（チェックポイント・異常終了からの再開・IDの割り当て）"""
+import time
+
+import pytest
+
+from schedule_store import ScheduleStore
+from scheduler import Schedule, Scheduler
+
+
+class FakeClock:
+    """進めたときだけ進む単調時計"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeJob:
+    """Repeater の代わりに、保存と再開に必要なところだけを持つ"""
+
+    def __init__(self, target, shuffle=False):
+        self.urls = [target] if isinstance(target, str) else list(target)
+        self.shuffle = shuffle
+        self.position = 0
+        self.record = None
+
+    def schedule(self, interval, count=None):
+        return Schedule(lambda s: None, interval, count, job=self)
+
+    def checkpoint(self, schedule):
+        return {"urls": self.urls, "shuffle": self.shuffle, "position": self.position, "record": self.record}
+
+    def seek(self, position):
+        self.position = position
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "schedules.db")
+
+
+def notify(store, schedule, state, **attrs):
+    """スケジューラの状態通知と同じように on_state を呼び、書き込みが終わるまで待つ"""
+    schedule.state = state
+    for name, value in attrs.items():
+        setattr(schedule, name, value)
+    store.on_state(schedule, state)
+    store.flush()
+
+
+def test_ids_are_assigned_by_sqlite_across_processes(path):
+    # 1つのファイルを2つのプロセス（ここでは2つの接続）で共有する
+    first, second = ScheduleStore(path), ScheduleStore(path)
+    try:
+        a = FakeJob("https://youtu.be/aaaaaaaaaaa").schedule(60)
+        b = FakeJob("https://youtu.be/bbbbbbbbbbb").schedule(60)
+        notify(first, a, "waiting")
+        notify(second, b, "waiting")
+        c = FakeJob("https://youtu.be/ccccccccccc").schedule(60)
+        notify(first, c, "waiting")
+        assert len({a.store_id, b.store_id, c.store_id}) == 3
+        urls = {row["id"]: row["urls"] for row in first.active()}
+        assert urls == {a.store_id: a.job.urls, b.store_id: b.job.urls, c.store_id: c.job.urls}
+    finally:
+        first.close()
+        second.close()
+
+
+def test_updates_before_the_insert_is_written_go_to_the_same_row(path):
+    store = ScheduleStore(path)
+    try:
+        schedule = FakeJob(["https://youtu.be/aaaaaaaaaaa", "https://youtu.be/bbbbbbbbbbb"], True).schedule(30, 5)
+        # 書き込みのスレッドが追いつく前に続けて通知が来る
+        schedule.state = "waiting"
+        store.on_state(schedule, "waiting")
+        schedule.state = "running"
+        store.on_state(schedule, "running")
+        schedule.iteration = 1
+        schedule.job.position = 1
+        schedule.state = "paused"
+        schedule.paused_remaining = 12.5
+        store.on_state(schedule, "paused")
+        store.flush()
+        [row] = store.active()
+        assert row["id"] == schedule.store_id
+        assert row["shuffle"] is True
+        assert (row["interval"], row["count"], row["iteration"], row["position"]) == (30, 5, 1, 1)
+        assert (row["state"], row["remaining"]) == ("paused", 12.5)
+    finally:
+        store.close()
+
+
+def test_finished_schedules_are_not_resumed(path):
+    store = ScheduleStore(path)
+    try:
+        done = FakeJob("https://youtu.be/aaaaaaaaaaa").schedule(60)
+        notify(store, done, "waiting")
+        notify(store, done, "finished")
+        # 一度も保存していないまま終わったものは書かない
+        notify(store, FakeJob("https://youtu.be/bbbbbbbbbbb").schedule(60), "finished")
+        assert store.active() == []
+    finally:
+        store.close()
+
+
+def test_resume_after_crash(path):
+    clock = FakeClock()
+    store = ScheduleStore(path)
+    waiting = FakeJob("https://youtu.be/aaaaaaaaaaa").schedule(600, 10)
+    notify(store, waiting, "waiting")
+    waiting.job.position = 3
+    waiting.job.record = {"iteration": 3, "ts": 1.0, "status": "ok"}
+    waiting.next_fire = time.monotonic() + 300
+    notify(store, waiting, "waiting", iteration=3)
+    paused = FakeJob("https://youtu.be/bbbbbbbbbbb").schedule(600)
+    notify(store, paused, "waiting")
+    notify(store, paused, "paused", paused_remaining=42.0)
+    # 終了済みにせずに閉じる（アプリが落ちたのと同じ）
+    store.close()
+
+    store = ScheduleStore(path)
+    scheduler = Scheduler(max_workers=1, clock=clock).start()
+    try:
+        created = []
+
+        def create_job(target, shuffle):
+            job = FakeJob(target, shuffle)
+            created.append(job)
+            return job
+
+        restored = {s.store_id: s for s in store.restore(scheduler, create_job)}
+        assert set(restored) == {waiting.store_id, paused.store_id}
+
+        again = restored[waiting.store_id]
+        assert again.iteration == 3
+        assert again.job.position == 3
+        assert (again.interval, again.count) == (600, 10)
+        assert again.state == "waiting"
+        # 保存した時刻からの経過（テストの実行時間）だけ短くなる
+        assert 290 < again.remaining(clock()) <= 300
+
+        again = restored[paused.store_id]
+        assert again.state == "paused"
+        assert again.paused_remaining == 42.0
+
+        assert [r["status"] for r in store.runs(waiting.store_id)] == ["ok"]
+        # 再開しても新しい行は作らない
+        scheduler.add_listener(store.on_state)
+        assert scheduler.resume(again.id)
+        store.flush()
+        assert len(store.active()) == 2
+    finally:
+        scheduler.shutdown(wait=True)
+        store.close()
+
+
+def test_discard(path):
+    store = ScheduleStore(path)
+    try:
+        a = FakeJob("https://youtu.be/aaaaaaaaaaa").schedule(60)
+        b = FakeJob("https://youtu.be/bbbbbbbbbbb").schedule(60)
+        notify(store, a, "waiting")
+        notify(store, b, "waiting")
+        store.discard(a.store_id)
+        assert [row["id"] for row in store.active()] == [b.store_id]
+        store.discard()
+        assert store.active() == []
+    finally:
+        store.close()
@@ -0,0 +1,142 @@
+"""スケジューラのテスト"""
+import time
+import threading
+
+from scheduler import Schedule, Scheduler
+
+
+def test_unwaitable_deadline_does_not_stop_the_timer_thread():
+    scheduler = Scheduler(max_workers=2).start()
+    try:
+        finished = {}
+        done = threading.Event()
+
+        def on_finish(schedule, reason):
+            finished[schedule.name] = reason
+            if schedule.name == "good":
+                done.set()
+
+        # 待てない発火時刻（Condition.wait が OverflowError を送出する）
+        bad = Schedule(lambda s: None, 60, name="bad", on_finish=on_finish)
+        scheduler.add(bad, delay=float("inf"))
+        good = Schedule(lambda s: None, 0.01, count=1, name="good", on_finish=on_finish)
+        scheduler.add(good)
+
+        assert done.wait(5)
+        assert finished == {"bad": "error", "good": "completed"}
+        assert isinstance(bad.error, OverflowError)
+        assert scheduler._thread.is_alive()
+    finally:
+        scheduler.shutdown(wait=True)
+
+
+class FakeClock:
+    """進めたときだけ進む単調時計"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_count_fires_exactly_n_times_then_completes():
+    scheduler = Scheduler(max_workers=2).start()
+    try:
+        fired = []
+        finished = []
+        done = threading.Event()
+
+        def on_finish(schedule, reason):
+            finished.append(reason)
+            done.set()
+
+        schedule = Schedule(lambda s: fired.append(s.iteration), 0.01, count=3, on_finish=on_finish)
+        scheduler.add(schedule)
+
+        assert done.wait(5)
+        assert fired == [0, 1, 2]
+        assert finished == ["completed"]
+        assert schedule.iteration == 3
+        assert schedule.state == "finished"
+        assert scheduler.schedules() == []
+        # 終わった後に余分な発火はない
+        time.sleep(0.05)
+        assert fired == [0, 1, 2]
+    finally:
+        scheduler.shutdown(wait=True)
+
+
+def test_cancel_while_running_finishes_cancelled():
+    scheduler = Scheduler(max_workers=2).start()
+    try:
+        started = threading.Event()
+        finished = []
+        done = threading.Event()
+
+        def action(schedule):
+            started.set()
+            # 段階の待ち時間と同じく、停止されたらすぐに戻る
+            schedule.stop_event.wait(10)
+
+        def on_finish(schedule, reason):
+            finished.append(reason)
+            done.set()
+
+        schedule = Schedule(action, 60, on_finish=on_finish)
+        scheduler.add(schedule)
+        assert started.wait(5)
+        cancelled_at = time.monotonic()
+        assert scheduler.cancel(schedule.id)
+        assert done.wait(5)
+        assert time.monotonic() - cancelled_at < 1.0
+        assert finished == ["cancelled"]
+        assert schedule.iteration == 1
+    finally:
+        scheduler.shutdown(wait=True)
+
+
+def test_pause_and_resume_keep_the_remaining_time():
+    clock = FakeClock()
+    scheduler = Scheduler(max_workers=2, clock=clock).start()
+    try:
+        fired = []
+        schedule = Schedule(lambda s: fired.append(s.iteration), 100)
+        scheduler.add(schedule, delay=100)
+        assert schedule.next_fire == 1100
+
+        clock.now += 30
+        assert scheduler.pause(schedule.id)
+        assert schedule.state == "paused"
+        assert schedule.paused_remaining == 70
+        assert schedule.next_fire is None
+        # 一時停止中は二重に止められない
+        assert not scheduler.pause(schedule.id)
+
+        # 止めている間に時間が過ぎても、発火も残り時間の減少もしない
+        clock.now += 500
+        assert schedule.paused_remaining == 70
+
+        assert scheduler.resume(schedule.id)
+        assert schedule.state == "waiting"
+        assert schedule.next_fire == 1600
+        assert schedule.remaining(clock()) == 70
+        assert not scheduler.resume(schedule.id)
+        assert fired == []
+    finally:
+        scheduler.shutdown(wait=True)
+
+
+def test_paused_schedule_can_be_added_and_resumed():
+    clock = FakeClock()
+    scheduler = Scheduler(max_workers=2, clock=clock).start()
+    try:
+        schedule = Schedule(lambda s: None, 100)
+        scheduler.add(schedule, delay=40, paused=True)
+        assert schedule.state == "paused"
+        assert schedule.paused_remaining == 40
+        clock.now += 1000
+        assert scheduler.resume(schedule.id)
+        assert schedule.next_fire == 2040
+    finally:
+        scheduler.shutdown(wait=True)
@@ -0,0 +1,150 @@
+"""動画情報キャッシュのテスト（bench の代役サーバーを使い、YouTubeにはアクセスしない）"""
+import os
+import sys
+import json
+import threading
+
+import pytest
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+sys.path.insert(0, BENCH_DIR)
+
+from fake_youtube import FakeYouTube  # noqa: E402
+from video_cache import INDEX_FILE, VideoInfoCache  # noqa: E402
+
+A = "https://www.youtube.com/watch?v=aaaaaaaaaaa"
+B = "https://youtu.be/bbbbbbbbbbb"
+C = "https://www.youtube.com/watch?v=ccccccccccc&t=30"
+
+
+@pytest.fixture
+def fake():
+    fake = FakeYouTube().start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def make_cache(fake, cache_dir, **kwargs):
+    return VideoInfoCache(cache_dir, oembed_url=f"{fake.base_url}/oembed", **kwargs)
+
+
+def read_index(cache_dir):
+    with open(os.path.join(cache_dir, INDEX_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_memory_and_disk_hits(fake, cache_dir):
+    cache = make_cache(fake, cache_dir)
+    info = cache.get(A)
+    assert info["video_id"] == "aaaaaaaaaaa"
+    assert info["title"] == "Fake video aaaaaaaaaaa"
+    assert info["thumbnail_bytes"].startswith(b"\x89PNG")
+    assert cache.get(A) == info
+    assert (cache.stats["misses"], cache.stats["memory_hits"]) == (1, 1)
+
+    # 別のインスタンス（再起動）はディスクから読み、ネットワークにはアクセスしない
+    restarted = make_cache(fake, cache_dir)
+    assert restarted.get(A) == info
+    assert restarted.stats["disk_hits"] == 1
+    assert fake.requests["oembed"] == 1
+    assert fake.requests["thumbnail"] == 1
+    assert restarted.hit_ratio() == 1.0
+
+
+def test_index_on_disk(fake, cache_dir):
+    cache = make_cache(fake, cache_dir)
+    cache.get(A)
+    cache.get(B)
+    index = read_index(cache_dir)
+    assert sorted(index) == ["aaaaaaaaaaa", "bbbbbbbbbbb"]
+    entry = index["aaaaaaaaaaa"]
+    assert entry["thumbnail_format"] == "png"
+    assert entry["thumbnail_etag"] == fake.etag
+    with open(os.path.join(cache_dir, "aaaaaaaaaaa.png"), "rb") as f:
+        assert len(f.read()) == entry["thumbnail_size"]
+    # 一時ファイルは残らない
+    assert sorted(os.listdir(cache_dir)) == ["aaaaaaaaaaa.png", "bbbbbbbbbbb.png", INDEX_FILE]
+
+    cache.clear()
+    assert read_index(cache_dir) == {}
+    assert os.listdir(cache_dir) == [INDEX_FILE]
+
+
+def test_broken_index_is_ignored(fake, cache_dir):
+    os.makedirs(cache_dir)
+    with open(os.path.join(cache_dir, INDEX_FILE), "w", encoding="utf-8") as f:
+        f.write("{broken")
+    cache = make_cache(fake, cache_dir)
+    assert cache.get(A)["title"] == "Fake video aaaaaaaaaaa"
+    assert sorted(read_index(cache_dir)) == ["aaaaaaaaaaa"]
+
+
+def test_expired_entry_is_revalidated_with_etag(fake, cache_dir):
+    cache = make_cache(fake, cache_dir, ttl=0)
+    first = cache.get(A)
+    second = cache.get(A)
+    assert second == first
+    # サムネイルは If-None-Match で確かめ、304なら取り直さない
+    assert fake.requests["thumbnail"] == 1
+    assert fake.requests["not_modified"] == 1
+    assert cache.stats["revalidated"] == 1
+    assert cache.stats["refreshed"] == 1
+
+
+def test_stale_entry_is_served_when_offline(fake, cache_dir):
+    cache = make_cache(fake, cache_dir, ttl=0, timeout=1)
+    info = cache.get(A)
+    # 誰も待ち受けていないポート（共有セッションの接続が残っていても使わない）
+    cache.oembed_url = "http://127.0.0.1:1/oembed"
+    assert cache.get(A) == info
+    assert cache.stats["stale_served"] == 1
+    assert cache.stats["errors"] == 1
+    with pytest.raises(Exception):
+        cache.get(B)
+
+
+def test_least_recently_used_is_evicted(fake, cache_dir):
+    cache = make_cache(fake, cache_dir, max_entries=2, memory_entries=1)
+    cache.get(A)
+    cache.get(B)
+    cache.get(A)  # A を使ったので、いちばん古いのは B
+    cache.get(C)
+    assert sorted(read_index(cache_dir)) == ["aaaaaaaaaaa", "ccccccccccc"]
+    assert not os.path.exists(os.path.join(cache_dir, "bbbbbbbbbbb.png"))
+    assert cache.stats["evictions"] == 1
+
+
+def test_access_order_survives_restart(fake, cache_dir):
+    cache = make_cache(fake, cache_dir, max_entries=2)
+    cache.get(A)
+    cache.get(B)
+    cache.get(A)
+    cache.close()
+    # 再起動した後も、直前に使った A ではなく B を追い出す
+    restarted = make_cache(fake, cache_dir, max_entries=2)
+    restarted.get(C)
+    assert sorted(read_index(cache_dir)) == ["aaaaaaaaaaa", "ccccccccccc"]
+
+
+def test_stats_are_consistent_across_threads(fake, cache_dir):
+    cache = make_cache(fake, cache_dir)
+    urls = [f"https://youtu.be/{c * 11}" for c in "abcde"]
+
+    def work():
+        for i in range(20):
+            cache.get(urls[i % len(urls)])
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats
+    assert stats["memory_hits"] + stats["disk_hits"] + stats["misses"] == 8 * 20
+    assert stats["refreshed"] == stats["misses"]
+    assert stats["errors"] == 0
@@ -0,0 +1,28 @@
+"""worker.py の計測ログのファイル名のテスト"""
+import os
+import socket
+
+from worker import host_slot_path, worker_path
+
+
+def test_worker_path():
+    assert worker_path("telemetry.jsonl", "w1") == "telemetry-w1.jsonl"
+    assert worker_path("", "w1") == ""
+
+
+def test_host_slot_is_reused_after_restart(tmp_path):
+    path = str(tmp_path / "telemetry.jsonl")
+    host = socket.gethostname()
+    first, first_lock = host_slot_path(path)
+    second, second_lock = host_slot_path(path)
+    # 同時に動くワーカーは別のファイルに書く
+    assert first == str(tmp_path / f"telemetry-{host}-0.jsonl")
+    assert second == str(tmp_path / f"telemetry-{host}-1.jsonl")
+    # 落ちた（ロックを外した）ワーカーの番号は、次に起動したワーカーが使う
+    first_lock.close()
+    again, again_lock = host_slot_path(path)
+    assert again == first
+    again_lock.close()
+    second_lock.close()
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [f"telemetry-{host}-0.jsonl.lock", f"telemetry-{host}-1.jsonl.lock"])
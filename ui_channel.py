@@ -0,0 +1,42 @@
+"""ワーカースレッドからTkスレッドへUI更新を受け渡すチャネル
+
+ワーカー側は post / post_event で積むだけで、Tkには一切触れない。
+Tkスレッド側が定期的に drain して反映する。同じキーの更新は最新の値だけが残るので、
+ウィンドウが最小化されていて反映が遅れても、古い更新を順に処理するむだがない。
+"""
+import threading
+from collections import OrderedDict, deque
+
+
+class UpdateChannel:
+    """キーごとに最新値だけを保持する更新キュー"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = OrderedDict()
+        self._events = deque()
+        self.posted = 0
+        self.coalesced = 0
+
+    def post(self, key, value):
+        """状態の更新を積む（同じキーの未反映の値は置き換える）"""
+        with self._lock:
+            self.posted += 1
+            if key in self._latest:
+                self.coalesced += 1
+            self._latest[key] = value
+
+    def post_event(self, kind, value):
+        """まとめてはいけない通知（エラー表示など）を積む"""
+        with self._lock:
+            self.posted += 1
+            self._events.append((kind, value))
+
+    def drain(self):
+        """積まれた更新を取り出す（状態の更新, 通知）の組を返す"""
+        with self._lock:
+            if not self._latest and not self._events:
+                return [], []
+            latest, self._latest = list(self._latest.items()), OrderedDict()
+            events, self._events = list(self._events), deque()
+        return latest, events
@@ -0,0 +1,422 @@
+"""動画情報（タイトル・サムネイル）の二段キャッシュ
+
+メモリ上のLRUと、config.jsonと同じ場所に置くディスク上のストアで構成する。
+キーは正規化した動画IDで、TTLを過ぎたエントリはETag/Last-Modifiedで再検証する。
+サムネイルは取得時に表示サイズまで縮小し、Tkがそのまま読めるPNGで保持する。
+
+ディスク上のストアは複数のプロセス（同じマシンの worker.py run）で共有してよい。書き込みは
+一時ファイルからの置き換えなので壊れたファイルは読まないが、インデックスは最後に書いたプロセスの
+内容になる（ほかのプロセスが加えたエントリが落ちても、次に取得し直すだけ）。
+"""
+import io
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import quote
+
+import telemetry
+import http_session
+from youtube_url import extract_video_id, canonical_url
+
+OEMBED_URL = "https://www.youtube.com/oembed"
+INDEX_FILE = "index.json"
+# 表示用サムネイルの大きさと保存形式（形式が違う古いエントリは取り直す）
+THUMBNAIL_SIZE = (256, 144)
+THUMBNAIL_FORMAT = "png"
+# キャッシュから返しただけのとき（最終アクセス時刻の更新だけ）は、インデックスの書き戻しをこの秒数に1回にまとめる
+TOUCH_SAVE_INTERVAL = 60
+
+
+def shrink_thumbnail(data, size=THUMBNAIL_SIZE):
+    """サムネイル画像を表示サイズに縮小し、PNGのバイト列にする
+
+    JPEGはdraftモードで縮小しながらデコードするので、maxresの画像でも
+    元の大きさのビットマップを展開しない。
+    """
+    # Pillowは起動を速くするため、最初に必要になった時点で読み込む
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("RGB", size)
+        img = img.convert("RGB").resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    buf = io.BytesIO()
+    # 圧縮率を上げても縮小後の画像ではほとんど小さくならないので、速さを優先する
+    img.save(buf, "PNG", compress_level=1)
+    return buf.getvalue()
+
+
+class VideoInfoCache:
+    """動画情報のキャッシュ（メモリLRU + ディスク）"""
+
+    def __init__(self, cache_dir, ttl=24 * 3600, memory_entries=64,
+                 max_entries=1000, max_bytes=50 * 1024 * 1024, timeout=5, oembed_url=OEMBED_URL,
+                 thumbnail_size=THUMBNAIL_SIZE):
+        self.cache_dir = cache_dir
+        self.oembed_url = oembed_url
+        self.thumbnail_size = thumbnail_size
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        # key -> (エントリ, サムネイルのバイト列)
+        self._memory = OrderedDict()
+        self._index = None
+        # batch() の入れ子の深さと、書き戻しを保留しているかどうか
+        self._batch_depth = 0
+        self._index_dirty = False
+        self._index_saved_at = time.monotonic()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "refreshed": 0,
+            "stale_served": 0,
+            "evictions": 0,
+            "errors": 0,
+        }
+
+    # ---- 公開API ----
+
+    def get(self, url):
+        """動画情報を返す（{"video_id", "title", "thumbnail_bytes"}、サムネイルは縮小済みのPNG）
+
+        ネットワークエラー時、古いエントリがあればそれを返し、なければ例外を送出する。
+        """
+        key = self.key_for(url)
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached and self._is_fresh(cached[0], now):
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                self._touch(key, now)
+                telemetry.note("metadata_source", "memory")
+                return self._to_info(*cached)
+
+            if cached is None:
+                cached = self._load_from_disk(key)
+                if cached and self._is_fresh(cached[0], now):
+                    self.stats["disk_hits"] += 1
+                    self._remember(key, *cached)
+                    self._touch(key, now)
+                    telemetry.note("metadata_source", "disk")
+                    return self._to_info(*cached)
+
+        # ここから先はネットワークアクセス（ロックは保持しない。集計だけロックを取って数える）
+        try:
+            if cached:
+                telemetry.note("metadata_source", "revalidate")
+                entry, thumb = self._revalidate(url, key, *cached)
+            else:
+                telemetry.note("metadata_source", "network")
+                self._count("misses")
+                entry, thumb = self._fetch(url, key)
+        except Exception:
+            self._count("errors")
+            if cached:
+                self._count("stale_served")
+                telemetry.note("metadata_source", "stale")
+                return self._to_info(*cached)
+            raise
+
+        with self._lock:
+            entry = self._store(key, entry, thumb)
+        return self._to_info(entry, thumb)
+
+    def peek(self, url):
+        """ネットワークにアクセスせず、期限切れも含めてキャッシュ済みの動画情報を返す（なければNone）
+
+        戻り値には期限内かどうかを表す "fresh" を含める。
+        """
+        key = self.key_for(url)
+        with self._lock:
+            cached = self._memory.get(key) or self._load_from_disk(key)
+            if cached is None:
+                return None
+            self._remember(key, *cached)
+        info = self._to_info(*cached)
+        info["fresh"] = self._is_fresh(cached[0], time.time())
+        return info
+
+    def hit_ratio(self):
+        """ヒット率（メモリ＋ディスク）を返す"""
+        with self._lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def clear(self):
+        """キャッシュをすべて削除する"""
+        with self._lock:
+            self._memory.clear()
+            for key in list(self._get_index()):
+                self._remove_from_disk(key)
+            self._save_index()
+
+    @contextmanager
+    def batch(self):
+        """まとめて取得する間、インデックスの書き戻しを最後の1回にまとめる"""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._flush_index()
+
+    def close(self):
+        """書き戻していない最終アクセス時刻をインデックスに書く"""
+        with self._lock:
+            self._flush_index()
+
+    @staticmethod
+    def key_for(url):
+        """キャッシュキー（動画ID。取り出せない場合はURLのハッシュ）"""
+        video_id = extract_video_id(url)
+        if video_id:
+            return video_id
+        return "url-" + hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    # ---- ネットワーク ----
+
+    def _oembed_url(self, url, key):
+        target = canonical_url(key) if not key.startswith("url-") else url
+        return f"{self.oembed_url}?url={quote(target, safe='')}&format=json"
+
+    def _fetch(self, url, key):
+        with telemetry.stage("oembed"):
+            resp = http_session.get(self._oembed_url(url, key), timeout=self.timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        entry = {
+            "title": data.get("title", "-"),
+            "thumbnail_url": data.get("thumbnail_url"),
+            "oembed_etag": resp.headers.get("ETag"),
+            "oembed_last_modified": resp.headers.get("Last-Modified"),
+        }
+        thumb = None
+        if entry["thumbnail_url"]:
+            with telemetry.stage("thumbnail"):
+                t_resp = http_session.get(entry["thumbnail_url"], timeout=self.timeout)
+            t_resp.raise_for_status()
+            thumb = self._shrink(t_resp.content)
+            entry["thumbnail_etag"] = t_resp.headers.get("ETag")
+            entry["thumbnail_last_modified"] = t_resp.headers.get("Last-Modified")
+        self._count("refreshed")
+        return entry, thumb
+
+    def _revalidate(self, url, key, old_entry, old_thumb):
+        """期限切れエントリを条件付きGETで再検証する"""
+        entry = dict(old_entry)
+        with telemetry.stage("oembed"):
+            resp = http_session.get(
+                self._oembed_url(url, key),
+                headers=self._conditional_headers(old_entry, "oembed"),
+                timeout=self.timeout,
+            )
+        if resp.status_code != 304:
+            resp.raise_for_status()
+            data = resp.json()
+            entry["title"] = data.get("title", "-")
+            entry["thumbnail_url"] = data.get("thumbnail_url")
+            entry["oembed_etag"] = resp.headers.get("ETag")
+            entry["oembed_last_modified"] = resp.headers.get("Last-Modified")
+
+        thumb = old_thumb
+        if entry.get("thumbnail_url"):
+            # URLが変わった場合は無条件で取り直す
+            same_url = entry["thumbnail_url"] == old_entry.get("thumbnail_url")
+            headers = self._conditional_headers(old_entry, "thumbnail") if same_url and old_thumb else {}
+            with telemetry.stage("thumbnail"):
+                t_resp = http_session.get(entry["thumbnail_url"], headers=headers, timeout=self.timeout)
+            if t_resp.status_code != 304:
+                t_resp.raise_for_status()
+                thumb = self._shrink(t_resp.content)
+                entry["thumbnail_etag"] = t_resp.headers.get("ETag")
+                entry["thumbnail_last_modified"] = t_resp.headers.get("Last-Modified")
+                self._count("refreshed")
+            else:
+                self._count("revalidated")
+        else:
+            thumb = None
+        return entry, thumb
+
+    def _shrink(self, data):
+        """取得したサムネイルを縮小する（画像として読めなければサムネイルなし）"""
+        with telemetry.stage("thumbnail_decode"):
+            try:
+                return shrink_thumbnail(data, self.thumbnail_size)
+            except Exception as e:
+                print(f"サムネイルの変換に失敗しました: {e}")
+                return None
+
+    @staticmethod
+    def _conditional_headers(entry, prefix):
+        headers = {}
+        if entry.get(f"{prefix}_etag"):
+            headers["If-None-Match"] = entry[f"{prefix}_etag"]
+        if entry.get(f"{prefix}_last_modified"):
+            headers["If-Modified-Since"] = entry[f"{prefix}_last_modified"]
+        return headers
+
+    # ---- メモリ / ディスク ----
+
+    def _is_fresh(self, entry, now):
+        return now - entry.get("fetched_at", 0) < self.ttl
+
+    @staticmethod
+    def _to_info(entry, thumb):
+        return {
+            "video_id": entry.get("video_id"),
+            "title": entry.get("title", "-"),
+            "thumbnail_bytes": thumb,
+        }
+
+    def _remember(self, key, entry, thumb):
+        self._memory[key] = (entry, thumb)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _touch(self, key, now):
+        # 最終アクセス時刻はディスク側の追い出し順序に使うので、再起動しても残るよう書き戻す
+        # （ヒットのたびには書かず、TOUCH_SAVE_INTERVAL 秒に1回か、次の取得・close() のときにまとめて）
+        index = self._get_index()
+        if key in index:
+            index[key]["accessed_at"] = now
+            self._index_dirty = True
+            if not self._batch_depth and time.monotonic() - self._index_saved_at >= TOUCH_SAVE_INTERVAL:
+                self._flush_index()
+
+    def _store(self, key, entry, thumb):
+        now = time.time()
+        entry = dict(entry)
+        entry["video_id"] = None if key.startswith("url-") else key
+        entry["fetched_at"] = now
+        entry["accessed_at"] = now
+        entry["thumbnail_size"] = len(thumb) if thumb else 0
+        entry["thumbnail_format"] = THUMBNAIL_FORMAT
+        self._remember(key, entry, thumb)
+
+        index = self._get_index()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            thumb_path = self._thumb_path(key)
+            old = index.get(key)
+            # サムネイルが変わった場合だけ書き直す
+            if thumb and (not old or old.get("thumbnail_size") != entry["thumbnail_size"]
+                          or not os.path.exists(thumb_path)
+                          or old.get("thumbnail_etag") != entry.get("thumbnail_etag")):
+                self._atomic_write(thumb_path, thumb)
+            elif not thumb and os.path.exists(thumb_path):
+                os.remove(thumb_path)
+            index[key] = entry
+            self._evict(index)
+            if self._batch_depth:
+                self._index_dirty = True
+            else:
+                self._save_index()
+        except OSError as e:
+            print(f"キャッシュ書き込みエラー: {e}")
+        return entry
+
+    def _evict(self, index):
+        """件数・合計サイズの上限を超えたら最終アクセスが古い順に追い出す"""
+        total = sum(e.get("thumbnail_size", 0) for e in index.values())
+        if len(index) <= self.max_entries and total <= self.max_bytes:
+            return
+        for key in sorted(index, key=lambda k: index[k].get("accessed_at", 0)):
+            if len(index) <= self.max_entries and total <= self.max_bytes:
+                break
+            total -= index[key].get("thumbnail_size", 0)
+            self._remove_from_disk(key)
+            self._memory.pop(key, None)
+            self.stats["evictions"] += 1
+
+    def _load_from_disk(self, key):
+        entry = self._get_index().get(key)
+        if not entry:
+            return None
+        if entry.get("thumbnail_format") != THUMBNAIL_FORMAT:
+            # 縮小前の画像を保存していた古い形式のエントリは、取り直して置き換える
+            self._remove_from_disk(key)
+            try:
+                os.remove(os.path.join(self.cache_dir, f"{key}.jpg"))
+            except OSError:
+                pass
+            return None
+        thumb = None
+        if entry.get("thumbnail_size"):
+            try:
+                with open(self._thumb_path(key), "rb") as f:
+                    thumb = f.read()
+            except OSError:
+                # サムネイルが失われていればエントリごと無効扱い
+                return None
+        return entry, thumb
+
+    def _remove_from_disk(self, key):
+        index = self._get_index()
+        index.pop(key, None)
+        try:
+            os.remove(self._thumb_path(key))
+        except OSError:
+            pass
+
+    def _thumb_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.{THUMBNAIL_FORMAT}")
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = {}
+            path = os.path.join(self.cache_dir, INDEX_FILE)
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        self._index = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"キャッシュインデックスの読み込みに失敗しました: {e}")
+        return self._index
+
+    def _flush_index(self):
+        """書き戻しを保留していればインデックスを書く（書けなくても続ける）"""
+        if not self._index_dirty:
+            return
+        try:
+            self._save_index()
+        except OSError as e:
+            print(f"キャッシュ書き込みエラー: {e}")
+
+    def _save_index(self):
+        self._index_dirty = False
+        self._index_saved_at = time.monotonic()
+        data = json.dumps(self._get_index(), ensure_ascii=False).encode("utf-8")
+        self._atomic_write(os.path.join(self.cache_dir, INDEX_FILE), data)
+
+    @staticmethod
+    def _atomic_write(path, data):
+        # 同じディレクトリを使うほかのプロセス（worker.py run）と一時ファイルがぶつからないよう、名前は毎回作る
+        fd, tmp = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,91 @@
+"""ブラウザのメモリ・CPU使用量の監視
+
+登録簿（PROCESS_REGISTRY）にあるツリーのうち、監視を頼まれたものだけを一定間隔で
+調べる。システム全体のプロセス一覧は走査しない。上限を続けて超えたツリーは
+on_exceed で利用者に知らせ、ブラウザの作り直しを任せる。
+"""
+import threading
+
+
+class _Watch:
+    def __init__(self, on_sample, on_exceed):
+        self.on_sample = on_sample
+        self.on_exceed = on_exceed
+        self.breaches = 0
+        self.latest = None
+
+
+class BrowserWatchdog:
+    """プロセスツリーのRSSとCPU使用率を定期的に測り、上限を超えたら知らせる
+
+    max_rss_mb / max_cpu_percent は0なら制限しない。sustain 回続けて超えた時点で
+    on_exceed(root_pid, sample, reason) を呼び、そのツリーの監視をやめる。
+    on_sample(sample) は測るたびに呼ばれる（どちらも監視スレッドから）。
+    """
+
+    def __init__(self, registry, interval=30, max_rss_mb=0, max_cpu_percent=0, sustain=2):
+        self.registry = registry
+        self.interval = interval
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.max_cpu_percent = max_cpu_percent
+        self.sustain = sustain
+        self._watches = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def watch(self, root_pid, on_sample=None, on_exceed=None):
+        with self._lock:
+            self._watches[root_pid] = _Watch(on_sample, on_exceed)
+
+    def unwatch(self, root_pid):
+        with self._lock:
+            self._watches.pop(root_pid, None)
+
+    def samples(self):
+        """監視中のツリーごとの最新の測定値 {root_pid: sample}"""
+        with self._lock:
+            return {pid: w.latest for pid, w in self._watches.items() if w.latest is not None}
+
+    def check(self):
+        """監視中のツリーを1回ずつ測る"""
+        with self._lock:
+            watches = list(self._watches.items())
+        for root_pid, watch in watches:
+            sample = self.registry.sample(root_pid)
+            if sample is None:
+                # 終了済み（登録簿から外れた）ツリー
+                self.unwatch(root_pid)
+                continue
+            watch.latest = sample
+            if watch.on_sample:
+                watch.on_sample(sample)
+            reason = self._exceeded(sample)
+            watch.breaches = watch.breaches + 1 if reason else 0
+            if reason and watch.breaches >= self.sustain:
+                self.unwatch(root_pid)
+                if watch.on_exceed:
+                    watch.on_exceed(root_pid, sample, reason)
+
+    def _exceeded(self, sample):
+        if self.max_rss and sample["rss"] > self.max_rss:
+            return "memory"
+        if self.max_cpu_percent and sample["cpu_percent"] > self.max_cpu_percent:
+            return "cpu"
+        return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"ブラウザの監視中にエラーが発生しました: {e}")
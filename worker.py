@@ -0,0 +1,286 @@
+"""複数のプロセス・ホストでスケジュールを分担するワーカー（coordination.py のリースを使う）
+
+共有の保存先（SQLiteファイル）にスケジュールを登録しておき、各マシンで run を動かすと、
+ワーカー同士で担当を分け合って再生する。ワーカーが落ちると、そのスケジュールは
+リースが切れたあと別のワーカーが続きから引き継ぐ。
+
+使い方の例:
+    python worker.py add --url https://youtu.be/XXXXXXXXXXX --interval 10m --count 3
+    python worker.py add --url-file playlist.csv --shuffle --interval 5m
+    python worker.py run --browser /usr/bin/chromium --capacity 8
+    python worker.py status
+    python worker.py stop 3
+"""
+import os
+import sys
+import signal
+import socket
+import argparse
+import threading
+
+import repeater
+from repeater import (
+    Repeater,
+    create_admission,
+    create_browser_launcher,
+    create_profile_pool,
+    create_telemetry_log,
+    create_video_cache,
+    create_watchdog,
+    kill_chrome_processes,
+    parse_interval,
+    resolve_browser_path,
+    setup_diagnostics,
+)
+from scheduler import Scheduler
+from launchers import LAUNCH_MODES
+from coordination import ShardWorker, create_lease_backend, default_worker_id
+from playlist import load_url_list
+from youtube_url import canonical_url
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="スケジュールを複数のワーカーで分担して再生する")
+    parser.add_argument("--config", default=repeater.CONFIG_PATH, help="設定ファイルのパス")
+    parser.add_argument("--db", help="共有の保存先（SQLite、省略時は設定の shard_store）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="分担するスケジュールを登録する")
+    add.add_argument("--url", action="append", help="再生するURL（複数指定可、1つずつ別のスケジュールになる）")
+    add.add_argument("--url-file", help="URLリスト（1つのスケジュールで順に再生する）")
+    add.add_argument("--shuffle", action="store_true", help="URLリストをシャッフルして再生する")
+    add.add_argument("--interval", required=True, help="繰り返し時間（例: 90, 30s, 10m, 2h, 1d。単位なしは秒）")
+    add.add_argument("--count", type=int, help="繰り返し回数（省略すると無限）")
+
+    commands.add_parser("status", help="スケジュールとワーカーの状態を表示する")
+
+    stop = commands.add_parser("stop", help="スケジュールを終了済みにする（担当のワーカーは次の確認で止める）")
+    stop.add_argument("ids", type=int, nargs="+")
+
+    run = commands.add_parser("run", help="ワーカーとして担当を取って再生する")
+    run.add_argument("--worker-id", help="ワーカーの名前（省略時は ホスト名-PID）")
+    run.add_argument("--capacity", type=int, help="同時に担当するスケジュールの上限（0なら無制限）")
+    run.add_argument("--lease-ttl", type=float, help="リースの期限（秒）。落ちたワーカーの分はこの時間の後に引き継ぐ")
+    run.add_argument("--browser", help="ブラウザの実行ファイル（省略時は設定・YTR_BROWSER・自動検出の順）")
+    run.add_argument("--no-probe", action="store_true", help="毎回の接続確認を行わない")
+    run.add_argument("--no-metadata", action="store_true", help="タイトル・サムネイルを取得しない")
+    run.add_argument("--mode", choices=LAUNCH_MODES,
+                     help="起動モード（normal / minimal: 小さなミュートのウィンドウ / headless）")
+    run.add_argument("--telemetry", help="計測ログ（JSONL）の出力先（省略時は設定の telemetry_log にワーカーの名前か"
+                     "ホスト名と番号を加えたもの。空文字で記録しない）")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = repeater.load_config(args.config)
+    # 相対パスはほかの保存先と同じく、設定ファイルと同じ場所が基準
+    backend = create_lease_backend(config, os.path.dirname(repeater.CONFIG_PATH), args.db)
+    try:
+        return COMMANDS[args.command](args, config, backend)
+    finally:
+        backend.close()
+
+
+def add(args, config, backend):
+    jobs = [[url] for url in args.url or []]
+    if args.url_file:
+        try:
+            video_ids, stats = load_url_list(args.url_file)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"URLリストを読み込めません: {e}", file=sys.stderr)
+            return 2
+        if not video_ids:
+            print("URLリストに有効なURLがありません", file=sys.stderr)
+            return 2
+        jobs.append([canonical_url(video_id) for video_id in video_ids])
+    if not jobs:
+        print("URLが指定されていません（--url または --url-file）", file=sys.stderr)
+        return 2
+    if not all(url.startswith(("http://", "https://")) for urls in jobs for url in urls):
+        print("URLは http:// または https:// で始めてください", file=sys.stderr)
+        return 2
+    try:
+        interval = parse_interval(args.interval)
+    except (ValueError, KeyError):
+        print(f"繰り返し時間が不正です: {args.interval}", file=sys.stderr)
+        return 2
+    if interval <= 0:
+        print("繰り返し時間は正の値で指定してください", file=sys.stderr)
+        return 2
+    if args.count is not None and args.count < 1:
+        print("回数は1以上の整数で指定してください", file=sys.stderr)
+        return 2
+    for urls in jobs:
+        shard_id = backend.add(urls, args.shuffle and len(urls) > 1, interval, args.count)
+        target = urls[0] if len(urls) == 1 else f"URLリスト（{len(urls)}件）"
+        print(f"分担{shard_id}: {target} を{interval:g}秒ごとに"
+              f"{'無限' if args.count is None else f'{args.count}回'}繰り返します")
+    return 0
+
+
+def status(args, config, backend):
+    ttl = config.get("lease_ttl", 15)
+    workers = backend.workers(ttl)
+    print(f"ワーカー: {len(workers)}")
+    for w in workers:
+        print(f"  {w['id']}  ブラウザ {w['browsers']}  担当 {w['owned']}"
+              + (f"/{w['capacity']}" if w["capacity"] else ""))
+    for shard in backend.shards():
+        urls = shard["urls"]
+        target = urls[0] if len(urls) == 1 else f"URLリスト（{len(urls)}件）"
+        done = f"{shard['iteration']}" + (f"/{shard['count']}" if shard["count"] else "")
+        state = shard["state"] if shard["state"] != "finished" else f"finished:{shard['reason']}"
+        print(f"分担{shard['id']}  {state}  {done}回  担当 {shard['owner'] or '-'}  {target}")
+    return 0
+
+
+def stop(args, config, backend):
+    code = 0
+    for shard_id in args.ids:
+        if backend.finish(shard_id):
+            print(f"分担{shard_id}を終了済みにしました")
+        else:
+            print(f"分担{shard_id}は登録されていないか、終了済みです", file=sys.stderr)
+            code = 1
+    return code
+
+
+def run(args, config, backend):
+    browser_path = args.browser or resolve_browser_path(config)
+    if not browser_path:
+        print("ブラウザが見つかりません。--browser で指定してください", file=sys.stderr)
+        return 2
+    diagnostics = setup_diagnostics(config)
+    if args.mode:
+        config["launch_mode"] = args.mode
+    try:
+        launcher = create_browser_launcher(config, browser_path)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    probe_url = None if args.no_probe else config.get("probe_url", repeater.PROBE_URL)
+    worker_id = args.worker_id or default_worker_id()
+    # 動画情報のキャッシュとプロファイルのテンプレートは同じマシンのワーカーで共有する（どちらも
+    # 一時ファイルからの置き換えで書く）。計測ログはローテーションがぶつからないようワーカーごとに分ける
+    video_cache = None if args.no_metadata else create_video_cache(config)
+    telemetry_path = args.telemetry
+    slot_lock = None
+    if telemetry_path is None:
+        telemetry_path = config.get("telemetry_log", "telemetry.jsonl")
+        if args.worker_id:
+            telemetry_path = worker_path(telemetry_path, args.worker_id)
+        elif telemetry_path:
+            # 名前を指定しないワーカーの名前はPIDを含むので、再起動のたびに新しいファイルが増えないよう
+            # このマシンで空いている番号のファイルを使う
+            base_dir = os.path.dirname(repeater.CONFIG_PATH)
+            telemetry_path, slot_lock = host_slot_path(os.path.join(base_dir, telemetry_path))
+    telemetry_log = create_telemetry_log(config, telemetry_path)
+    profile_pool = create_profile_pool(config, browser_path)
+    watchdog = create_watchdog(config)
+    admission = create_admission(config)
+
+    def create_job(target, shuffle):
+        return Repeater(
+            target,
+            browser_path,
+            video_cache=video_cache,
+            incognito=config.get("use_incognito", False),
+            warm=config.get("warm_browser", False),
+            probe_url=probe_url,
+            telemetry_log=telemetry_log,
+            shuffle=shuffle,
+            profile_pool=profile_pool,
+            watchdog=watchdog,
+            admission=admission,
+            launcher=launcher,
+            low_quality=config.get("low_quality", False),
+            handoff=config.get("handoff", False),
+            handoff_lead=config.get("handoff_lead", 5),
+            handoff_timeout=config.get("handoff_timeout", 15),
+        )
+
+    scheduler = Scheduler(max_workers=config.get("scheduler_workers", 4)).start()
+    worker = ShardWorker(
+        backend, scheduler, create_job,
+        worker_id=worker_id,
+        lease_ttl=args.lease_ttl or config.get("lease_ttl", 15),
+        capacity=config.get("worker_capacity", 0) if args.capacity is None else args.capacity,
+    ).start()
+    print(f"ワーカー {worker.worker_id} を開始しました（リース {worker.lease_ttl:g}秒）")
+    stopping = threading.Event()
+
+    def on_signal(signum, frame):
+        print("停止要求を受け取りました")
+        stopping.set()
+
+    signal.signal(signal.SIGINT, on_signal)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, on_signal)
+
+    try:
+        # シグナルを受け取れるよう、メインスレッドは短い間隔で待つ
+        while not stopping.wait(0.5):
+            pass
+    finally:
+        # 進み具合を書いて止め、ブラウザを終了させてから担当を手放す（ほかのワーカーがすぐに続きを取れる）
+        worker.stop()
+        scheduler.shutdown(wait=True)
+        diagnostics.close()
+        if watchdog is not None:
+            watchdog.stop()
+        kill_chrome_processes()
+        worker.leave()
+        if profile_pool is not None:
+            profile_pool.close()
+        if video_cache is not None:
+            video_cache.close()
+        if telemetry_log is not None:
+            telemetry_log.close()
+        if slot_lock is not None:
+            slot_lock.close()
+    return 0
+
+
+def worker_path(path, worker_id):
+    """ファイル名にワーカーの名前を加える（"telemetry.jsonl" → "telemetry-w1.jsonl"。空ならそのまま）"""
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{worker_id}{ext}"
+
+
+def host_slot_path(path, limit=64):
+    """このマシンで空いている番号を取り、(path にホスト名と番号を加えたファイル名, ロック) を返す
+
+    番号はワーカーが動いている間ロックファイルで押さえる（プロセスが落ちればOSが外す）。
+    同時に動くワーカーは別のファイルに書き、再起動したワーカーは空いた番号のファイルを
+    使い続けるので、ファイルの数は同時に動くワーカーの数までしか増えない。
+    """
+    for slot in range(limit):
+        slot_path = worker_path(path, f"{socket.gethostname()}-{slot}")
+        lock = open(slot_path + ".lock", "a")
+        if _try_lock(lock):
+            return slot_path, lock
+        lock.close()
+    raise RuntimeError(f"計測ログの番号が空いていません（{limit}個まで）")
+
+
+def _try_lock(f):
+    try:
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+COMMANDS = {"add": add, "status": status, "stop": stop, "run": run}
+
+
+if __name__ == "__main__":
+    sys.exit(main())
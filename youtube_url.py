@@ -0,0 +1,50 @@
+"""YouTube URLの正規化"""
+import re
+from urllib.parse import urlparse, parse_qs
+
+# 動画IDは英数字と「-」「_」からなる11文字
+_VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+_YOUTUBE_HOSTS = (
+    "youtube.com",
+    "m.youtube.com",
+    "music.youtube.com",
+    "youtube-nocookie.com",
+)
+
+
+def extract_video_id(url):
+    """URLから動画IDを取り出す（watch / youtu.be / shorts / embed 形式に対応）"""
+    if not url:
+        return None
+    url = url.strip()
+    # IDだけが渡された場合はそのまま使う
+    if _VIDEO_ID_RE.match(url):
+        return url
+    try:
+        parsed = urlparse(url if "://" in url else f"https://{url}")
+        host = (parsed.hostname or "").lower()
+    except ValueError:
+        return None
+    if host.startswith("www."):
+        host = host[4:]
+
+    candidate = None
+    if host == "youtu.be":
+        candidate = parsed.path.strip("/").split("/")[0]
+    elif host in _YOUTUBE_HOSTS:
+        if parsed.path.rstrip("/") == "/watch":
+            candidate = parse_qs(parsed.query).get("v", [None])[0]
+        else:
+            parts = parsed.path.strip("/").split("/")
+            if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+                candidate = parts[1]
+
+    if candidate and _VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+
+def canonical_url(video_id):
+    """動画IDから正規化した再生URLを作る"""
+    return f"https://www.youtube.com/watch?v={video_id}"